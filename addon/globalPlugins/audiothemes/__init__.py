@@ -32,19 +32,23 @@ import speech
 import controlTypes
 import globalCommands
 import browseMode
-
-from .handler import AudioThemesHandler, SpecialProps
-from .settings import AudioThemesSettingsPanel
-from .studio import AudioThemesStudioStartupDialog
-
+import ui
+from logHandler import log
 
 PLUGIN_DIRECTORY = os.path.abspath(os.path.dirname(__file__))
 LIB_DIRECTORY = os.path.join(PLUGIN_DIRECTORY, "lib")
 sys.path.insert(0, LIB_DIRECTORY)
 import unsync
 
+# The exporter needs the bundled concurrent.futures.
+from .handler import AudioThemesHandler, SpecialProps
+
 sys.path.remove(LIB_DIRECTORY)
 
+from .unspoken import latency
+from .settings import AudioThemesSettingsPanel
+from .studio import AudioThemesStudioStartupDialog
+
 
 import addonHandler
 
@@ -115,32 +119,33 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
         return self.original_speech_speakTextInfo(info, *args, **kwargs)
 
     def event_gainFocus(self, obj, nextHandler):
-        self.playObject(obj)
+        self.playObject(obj, latency.start("gainFocus"))
         nextHandler()
 
     def event_becomeNavigatorObject(self, obj, nextHandler, isFocus=False):
-        self.playObject(obj)
+        self.playObject(obj, latency.start("becomeNavigatorObject"))
         nextHandler()
 
     def event_mouseMove(self, obj, nextHandler, x, y):
         if obj is not self._previous_mouse_object:
             self._previous_mouse_object = obj
-            self.playObject(obj)
+            self.playObject(obj, latency.start("mouseMove"))
         nextHandler()
 
     def event_show(self, obj, nextHandler):
         if obj.role == controlTypes.ROLE_HELPBALLOON:
             obj.snd = SpecialProps.notify
-            self.playObject(obj)
+            self.playObject(obj, latency.start("show"))
         nextHandler()
 
     def event_documentLoadComplete(self, obj, nextHandler):
         if appModuleHandler.getAppNameFromProcessID(obj.processID) in self.browser_apps:
-            self.playObject(obj)
+            self.playObject(obj, latency.start("documentLoadComplete"))
         nextHandler()
 
     @unsync.unsync
-    def playObject(self, obj):
+    def playObject(self, obj, trace=None):
+        latency.stamp(trace, "dispatched")
         if obj is None:
             return
         order = self.getOrder(obj)
@@ -151,7 +156,21 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
                 obj.snd = order
             else:
                 obj.snd = obj.role
-        self.handler.play(obj, obj.snd)
+        self.handler.play(obj, obj.snd, trace)
+
+    def script_reportLatency(self, gesture):
+        if not latency.enabled:
+            # Translators: message telling the user that latency tracing is turned off
+            ui.message(_("Audio themes latency tracing is disabled"))
+            return
+        log.info("Audio themes latency report (milliseconds):\n" + latency.dump())
+        # Translators: message telling the user that the latency report was written to the log
+        ui.message(_("Audio themes latency report written to the NVDA log"))
+
+    # Translators: description of a command to write the latency report to the NVDA log
+    script_reportLatency.__doc__ = _(
+        "Writes the audio themes latency report to the NVDA log"
+    )
 
     def getOrder(self, obj, parrole=14, chrole=15):
         if obj.parent and obj.parent.role != parrole:
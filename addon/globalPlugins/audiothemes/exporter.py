@@ -0,0 +1,106 @@
+# coding: utf-8
+
+# Copyright (c) 2014-2019 Musharraf Omer
+# This file is covered by the GNU General Public License.
+
+# Export of audio themes as version 1 packages.
+# Compression is chosen for each member: Ogg Vorbis files are already compressed and are stored,
+# anything else is deflated.
+# Members are streamed into the package through ZipFile in fixed-size chunks,
+# so progress is reported and cancelling takes effect while a member is being written.
+# This module has no dependency on NVDA.
+
+import os
+import threading
+from zipfile import ZipFile, ZipInfo, ZIP_STORED, ZIP_DEFLATED
+
+CHUNK_SIZE = 1024 * 1024
+# Already compressed formats, deflating them only costs time.
+STORED_EXTENSIONS = frozenset([".ogg"])
+
+
+class ExportCancelled(Exception):
+    """Raised by `ThemeExporter.run` when the export was cancelled."""
+
+
+class ThemeExporter(object):
+    """Writes the files of the theme in `source_dir` to the package `output_filename`.
+
+    `compression` is None to choose for each member, or ZIP_STORED or ZIP_DEFLATED for every member.
+    `on_progress`, if given, is called with the bytes exported so far and the total,
+    from the thread that runs the export.
+    """
+
+    def __init__(self, source_dir, output_filename, on_progress=None, compression=None):
+        self.source_dir = source_dir
+        self.output_filename = output_filename
+        self.on_progress = on_progress
+        self.compression = compression
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def start(self, on_done):
+        """Export in a background thread, then call `on_done` with None or the exception raised."""
+
+        def export():
+            try:
+                self.run()
+            except Exception as e:
+                on_done(e)
+            else:
+                on_done(None)
+
+        threading.Thread(target=export, daemon=True).start()
+
+    def _check_cancelled(self):
+        if self._cancelled.is_set():
+            raise ExportCancelled(self.output_filename)
+
+    def _members(self):
+        members = []
+        for filename in sorted(os.listdir(self.source_dir)):
+            path = os.path.join(self.source_dir, filename)
+            if os.path.isfile(path):
+                members.append(ZipInfo.from_file(path, filename))
+        return members
+
+    def _compress_type(self, member):
+        if self.compression is not None:
+            return self.compression
+        if os.path.splitext(member.filename)[1].lower() in STORED_EXTENSIONS:
+            return ZIP_STORED
+        return ZIP_DEFLATED
+
+    def run(self):
+        """Export the theme and return the package file name."""
+        members = self._members()
+        total = sum(member.file_size for member in members)
+        temp_path = f"{self.output_filename}.tmp"
+        try:
+            done = 0
+            with ZipFile(temp_path, "w") as package:
+                for member in members:
+                    member.compress_type = self._compress_type(member)
+                    path = os.path.join(self.source_dir, member.filename)
+                    with open(path, "rb") as source, package.open(
+                        member, "w"
+                    ) as target:
+                        while True:
+                            self._check_cancelled()
+                            chunk = source.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            target.write(chunk)
+                            done += len(chunk)
+                            if self.on_progress is not None:
+                                self.on_progress(done, total)
+            os.replace(temp_path, self.output_filename)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        return self.output_filename
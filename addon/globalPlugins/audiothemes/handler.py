@@ -5,32 +5,58 @@
 
 from enum import IntEnum
 from collections import OrderedDict
-from dataclasses import dataclass, field, asdict
-from zipfile import ZipFile, ZIP_DEFLATED
-from uuid import uuid4
+from dataclasses import dataclass, field, fields
+import functools
 import os
-import ctypes
 import shutil
+import threading
 import copy
 import json
 import config
 import controlTypes
 import extensionPoints
 import globalVars
+import queueHandler
+from logHandler import log
 from config import post_configSave, post_configReset, post_configProfileSwitch
-from .unspoken import UnspokenPlayer, libaudioverse, dll_hack
+from .exporter import ThemeExporter
+from .installer import ThemeInstaller
+from .soundstore import SoundStore
+from .themeindex import ThemeIndex
+from .watcher import create_watcher
+from .unspoken import latency, loudness
+from .unspoken.archive import ThemeArchive, ThemeArchiveError, write_info
+from .unspoken.backends import BACKENDS, StealPolicy
+from .unspoken.compact import StoragePolicy, full_size
+from .unspoken.decoder import DecodeError
+from .unspoken.loader import decode_member
+from .unspoken.packed import (
+    PACKED_FILE_NAME,
+    PackedTheme,
+    pack_directory,
+    pack_package,
+)
+from .unspoken.pcmcache import PCMCache
+from .unspoken.soundcache import SoundCache
+from .unspoken.player import UnspokenPlayer
 
 import addonHandler
 
 addonHandler.initTranslation()
 
 THEMES_HOME = os.path.join(globalVars.appArgs.configPath, "audio-themes")
+# Decoded sounds, it has no info file so it is never mistaken for a theme.
+PCM_CACHE_DIRECTORY = os.path.join(THEMES_HOME, "__pcmcache__")
 INFO_FILE_NAME = "info.json"
 SUPPORTED_FILE_TYPES = OrderedDict()
 # Translators: The file type to be shown in a dialog used to browse for audio files.
 SUPPORTED_FILE_TYPES["ogg"] = _("Ogg audio files")
 # Translators: The file type to be shown in a dialog used to browse for audio files.
 SUPPORTED_FILE_TYPES["wav"] = _("Wave audio files")
+# Summaries of the installed themes, kept on disk between sessions.
+theme_index = ThemeIndex(THEMES_HOME, INFO_FILE_NAME)
+# Identical sound files of all themes, kept once on disk.
+sound_store = SoundStore(THEMES_HOME)
 # When the active audio theme is being changed
 audiotheme_changed = extensionPoints.Action()
 
@@ -43,6 +69,40 @@ audiothemes_config_defaults = {
     "speak_roles": "boolean(default=False)",
     "use_synth_volume": "boolean(default=True)",
     "volume": "integer(default=100)",
+    "voices": "integer(default=4, min=1, max=16)",
+    "voice_stealing": 'option("oldest", "quietest", "lowest_priority", default="oldest")',
+    "trace_latency": "boolean(default=False)",
+    # Read once at startup.
+    "audio_backend": 'option({}, default="libaudioverse")'.format(
+        ", ".join(f'"{name}"' for name in BACKENDS)
+    ),
+    "binaural_cache": "boolean(default=False)",
+    # In megabytes.
+    "binaural_cache_size": "integer(default=32, min=1, max=512)",
+    # Decode each sound the first time it is played rather than when the theme is activated.
+    "lazy_loading": "boolean(default=False)",
+    # With lazy loading, decode the remaining sounds in the background.
+    "prefetch_sounds": "boolean(default=True)",
+    "pcm_cache": "boolean(default=True)",
+    # In megabytes.
+    "pcm_cache_size": "integer(default=64, min=1, max=1024)",
+    # Keep loaded sounds in memory across theme switches and previews.
+    "sound_cache": "boolean(default=True)",
+    # In megabytes.
+    "sound_cache_size": "integer(default=48, min=1, max=512)",
+    # How theme sounds are stored once decoded, see unspoken.compact.
+    "downmix_sounds": "boolean(default=False)",
+    "resample_sounds": "boolean(default=False)",
+    "trim_silence": "boolean(default=False)",
+    # Reload sounds of the active theme as soon as their files change on disk.
+    "watch_themes": "boolean(default=True)",
+    # Install theme packages as they are, their sounds are then read from the package.
+    # Mounted packages have no sound files of their own, so share_sounds never deduplicates them.
+    "mount_packages": "boolean(default=True)",
+    # Keep identical sound files of all themes once on disk, see soundstore.
+    "share_sounds": "boolean(default=False)",
+    # Play every sound at the same loudness, from the table in the info file of its theme, see unspoken.loudness.
+    "normalize_loudness": "boolean(default=True)",
 }
 
 
@@ -56,6 +116,9 @@ class SpecialProps(IntEnum):
     loaded = 2504
 
 
+# Sounds that should win when every voice is busy and voice stealing is by priority.
+sound_priorities = {SpecialProps.notify: 2, SpecialProps.loaded: 1}
+
 theme_roles = copy.copy(controlTypes.roleLabels)
 theme_roles.update(
     {
@@ -80,50 +143,266 @@ class AudioTheme:
     author: str
     summary: str
     is_active: bool = False
+    # role -> sound object, sounds of a lazily loaded theme appear here on first use.
     sounds: dict = field(default_factory=dict)
+    # role -> path of every valid sound file, indexed when the theme is loaded.
+    # For a mounted package, role -> name of the member.
+    sound_files: dict = field(default_factory=dict, repr=False, compare=False)
+    # The `unspoken.archive.ThemeArchive` of a mounted package while it is loaded.
+    archive: ThemeArchive = field(default=None, repr=False, compare=False)
+    # The loudness table of the info file, made by `AudioThemesHandler.analyze_loudness`.
+    loudness: dict = field(default_factory=dict, repr=False, compare=False)
+    # role -> gain multiplier from the loudness table, filled when the theme is loaded.
+    gains: dict = field(default_factory=dict, repr=False, compare=False)
+    _load_lock: threading.Lock = field(
+        default_factory=threading.Lock, repr=False, compare=False
+    )
 
     @property
     def info_file_path(self):
         return os.path.join(self.directory, INFO_FILE_NAME)
 
+    @property
+    def packed_file_path(self):
+        return os.path.join(self.directory, PACKED_FILE_NAME)
+
     @property
     def folder(self):
         return os.path.split(self.directory)[-1]
 
+    @property
+    def is_mounted(self):
+        """Whether this theme is a package read in place rather than a directory."""
+        return os.path.isfile(self.directory)
+
     def exists(self):
-        return os.path.isdir(self.directory)
+        return os.path.exists(self.directory)
 
     def todict(self):
-        data = asdict(self)
-        for unwanted_key in ("is_active", "directory", "sounds"):
-            data.pop(unwanted_key)
-        return data
-
-    def load(self, player):
-        if self.sounds:
-            self.unload()
+        unwanted_keys = (
+            "is_active",
+            "directory",
+            "sounds",
+            "sound_files",
+            "archive",
+            "gains",
+            "_load_lock",
+        )
+        return {
+            f.name: getattr(self, f.name)
+            for f in fields(self)
+            if f.name not in unwanted_keys
+        }
+
+    def signature(self):
+        """Describe the files of this theme, the result changes when any of them is added, removed or edited."""
+        try:
+            if self.is_mounted:
+                stat = os.stat(self.directory)
+                return frozenset([(self.folder, stat.st_size, stat.st_mtime_ns)])
+            with os.scandir(self.directory) as it:
+                return frozenset(
+                    (entry.name, stat.st_size, stat.st_mtime_ns)
+                    for entry in it
+                    for stat in (entry.stat(),)
+                )
+        except OSError:
+            return frozenset()
+
+    def iter_sound_files(self):
+        """Yield a (role, path) pair for every valid sound file of this theme."""
+        if self.archive is not None:
+            for name in self.archive.names:
+                rep_role = self.role_of(name)
+                if rep_role is not None:
+                    yield rep_role, name
+            return
         if not os.path.isdir(self.directory):
             return
         for filename in os.listdir(self.directory):
             path = os.path.join(self.directory, filename)
             rep_role = self.is_valid_audio_file(path)
             if rep_role is not None:
-                self.sounds[rep_role] = player.make_sound_object(path)
+                yield rep_role, path
+
+    def load(self, player, lazy=False, prefetch=False):
+        """Index the sound files of this theme and load them.
+
+        With `lazy`, each sound is only decoded the first time it is requested with `get_sound`,
+        or in a background thread if `prefetch` is also given.
+        """
+        if self.sounds or self.sound_files or self.archive:
+            self.unload()
+        if self.is_mounted:
+            try:
+                self.archive = ThemeArchive(self.directory)
+            except ThemeArchiveError:
+                log.exception(
+                    f"Could not open the audio theme package {self.directory}"
+                )
+                return
+        else:
+            self.load_packed(player)
+        self.sound_files = dict(self.iter_sound_files())
+        self.load_gains()
+        for rep_role in self.sound_files:
+            # Loose sound files take precedence over the packed ones.
+            self.sounds.pop(rep_role, None)
+        if not lazy:
+            if self.archive is not None:
+                sounds, errors = player.load_members(
+                    self.archive, self.sound_files.items()
+                )
+                # Opened again if a sound has to be rendered from the package.
+                self.archive.close()
+            else:
+                sounds, errors = player.load_sounds(self.sound_files.items())
+            for rep_role, error in errors.items():
+                path = self.sound_files.pop(rep_role)
+                log.error(f"Could not load {path}", exc_info=error)
+            self.sounds.update(sounds)
+            self.log_memory_usage(player)
+        elif prefetch:
+            threading.Thread(
+                target=self._prefetch, args=(player, self.sound_files), daemon=True
+            ).start()
+
+    def load_gains(self):
+        """Read the gain of every sound from the loudness table, sounds it does not list keep their level."""
+        self.gains = {}
+        for name, gain in loudness.gain_table(self.loudness).items():
+            try:
+                self.gains[int(name)] = gain
+            except ValueError:
+                continue
+
+    def load_packed(self, player):
+        """Load every sound of the packed file of this theme, if it has one."""
+        if not os.path.isfile(self.packed_file_path):
+            return
+        try:
+            self.sounds.update(player.load_packed(self.packed_file_path))
+        except Exception:
+            log.exception(f"Could not load {self.packed_file_path}")
+
+    def _prefetch(self, player, sound_files):
+        for rep_role in list(sound_files):
+            if self.sound_files is not sound_files:
+                # Unloaded or loaded again meanwhile.
+                return
+            self.get_sound(rep_role, player)
+        archive = self.archive
+        if archive is not None:
+            archive.close()
+        self.log_memory_usage(player)
+
+    def log_memory_usage(self, player):
+        """Log the memory held by the loaded sounds, what roles sharing one sound saved,
+        and, with a storage policy, what they would take without it.
+
+        Sizes without the policy are read from the file headers, so they are only
+        computed when a policy is in effect, otherwise they equal the sizes in memory.
+        """
+        compacted = bool(player.storage)
+        stored = full = shared = 0
+        seen = set()
+        for rep_role, sound in list(self.sounds.items()):
+            size = player.sound_size(sound)
+            if id(sound) in seen:
+                shared += size
+                continue
+            seen.add(id(sound))
+            stored += size
+            if not compacted:
+                continue
+            try:
+                full += full_size(self.sound_files[rep_role])
+            except (KeyError, OSError, DecodeError):
+                full += size
+        compaction = f", {full / 1024:.0f} KB without compaction" if compacted else ""
+        log.info(
+            f"Audio theme {self.name}: {len(self.sounds)} sounds, "
+            f"{stored / 1024:.0f} KB in memory{compaction}, "
+            f"{shared / 1024:.0f} KB saved by sharing identical sounds"
+        )
+
+    def get_sound(self, rep_role, player):
+        """Return the sound object of `rep_role`, loading it on first use, or None."""
+        sound = self.sounds.get(rep_role)
+        if (sound is not None) or (rep_role not in self.sound_files):
+            return sound
+        with self._load_lock:
+            sound = self.sounds.get(rep_role)
+            path = self.sound_files.get(rep_role)
+            if (sound is not None) or (path is None):
+                return sound
+            try:
+                if self.archive is not None:
+                    sound = player.load_member(self.archive, path)
+                else:
+                    sound = player.make_sound_object(path)
+                self.sounds[rep_role] = sound
+            except Exception:
+                log.exception(f"Could not load {path}")
+                # Do not try again on every event.
+                del self.sound_files[rep_role]
+        return sound
 
     def unload(self):
-        self.sounds.clear()
+        with self._load_lock:
+            self.sounds.clear()
+            self.sound_files = {}
+            self.gains = {}
+            if self.archive is not None:
+                self.archive.close()
+                self.archive = None
 
     def deactivate(self):
         """Deactivate this theme"""
         self.unload()
         self.is_active = False
 
+    def reload_files(self, filenames, player, lazy=False):
+        """Pick up sound files of this theme that were added, replaced or removed.
+
+        Only the roles of `filenames` are touched, returns the sounds that were loaded again.
+        """
+        loaded = []
+        for filename in filenames:
+            rep_role = self.role_of(filename)
+            if rep_role is None:
+                continue
+            path = os.path.join(self.directory, filename)
+            # Measured before the change, the sound plays at its own level until the theme is measured again.
+            self.gains.pop(rep_role, None)
+            if not os.path.isfile(path):
+                with self._load_lock:
+                    if self.sound_files.get(rep_role) == path:
+                        del self.sound_files[rep_role]
+                        self.sounds.pop(rep_role, None)
+                continue
+            sound = None
+            if not lazy:
+                try:
+                    sound = player.make_sound_object(path)
+                except Exception:
+                    log.exception(f"Could not load {path}")
+                    continue
+                loaded.append(sound)
+            with self._load_lock:
+                self.sound_files[rep_role] = path
+                if sound is None:
+                    # Loaded again on first use.
+                    self.sounds.pop(rep_role, None)
+                else:
+                    self.sounds[rep_role] = sound
+        return loaded
+
     @staticmethod
-    def is_valid_audio_file(filepath):
-        """Return the role that this file represent (if any) else None."""
-        filename = os.path.split(filepath)[-1]
-        fnrole, ext = os.path.splitext(filename)
-        if os.path.isfile(filepath) and ext[1:] in SUPPORTED_FILE_TYPES.keys():
+    def role_of(filename):
+        """Return the role a sound file name stands for, or None."""
+        fnrole, ext = os.path.splitext(os.path.split(filename)[-1])
+        if ext[1:] in SUPPORTED_FILE_TYPES.keys():
             try:
                 key = int(fnrole)
             except ValueError:
@@ -131,6 +410,16 @@ class AudioTheme:
             if key in theme_roles:
                 return key
 
+    @classmethod
+    def is_sound_file_name(cls, filename):
+        return cls.role_of(filename) is not None
+
+    @classmethod
+    def is_valid_audio_file(cls, filepath):
+        """Return the role that this file represent (if any) else None."""
+        if os.path.isfile(filepath):
+            return cls.role_of(filepath)
+
 
 class AudioThemesHandler:
     """Query and manage audio themes."""
@@ -138,8 +427,21 @@ class AudioThemesHandler:
     def __init__(self):
         config.conf.spec["audiothemes"] = audiothemes_config_defaults
         self.enabled = True
-        self.player = UnspokenPlayer()
+        self.normalize_loudness = True
+        self.pcm_cache = None
+        self.sound_cache = None
+        self.player = UnspokenPlayer(
+            backend_name=config.conf["audiothemes"]["audio_backend"]
+        )
         self.active_theme = None
+        # The configuration values applied by the last configure.
+        self._applied_config = {}
+        # (directory, signature, lazy loading, storage policy) of the last theme configure asked for, or None.
+        self._theme_state = None
+        # Bumped by every configure, a theme that finishes loading after a newer configure is dropped.
+        self._theme_generation = 0
+        self._theme_lock = threading.Lock()
+        self.watcher = None
         self.configure()
         for action in (
             post_configSave,
@@ -150,12 +452,17 @@ class AudioThemesHandler:
             action.register(self.configure)
 
     def close(self):
-        if self.active_theme is not None:
-            self.active_theme.deactivate()
-        for _dll in dll_hack:
-            ctypes.windll.kernel32.FreeLibrary(_dll._handle)
+        self.configure_watcher(False)
+        with self._theme_lock:
+            self._theme_generation += 1
+            theme, self.active_theme = self.active_theme, None
+            self._theme_state = None
+        if theme is not None:
+            theme.deactivate()
+        self.player.close()
 
     def get_active_theme(self):
+        """Return the theme the configuration asks for, without loading it."""
         if not config.conf["audiothemes"]["enable_audio_themes"]:
             return
         theme = self.get_theme_from_folder(config.conf["audiothemes"]["active_theme"])
@@ -163,77 +470,296 @@ class AudioThemesHandler:
             config.conf["audiothemes"]["active_theme"] = "Default"
             theme = self.get_theme_from_folder("Default")
         if theme.exists():
-            theme.load(self.player)
-            theme.is_active = True
             return theme
 
     def configure(self, *args, **kwargs):
+        """Apply the configuration, only touching what changed since the last call.
+
+        This runs on every save, reset and profile switch, the sounds are only reloaded
+        when another theme is selected, themes are toggled, or the files of the theme changed.
+        """
         user_config = config.conf["audiothemes"]
-        if self.active_theme is not None:
-            self.active_theme.deactivate()
-        self.enabled = user_config["enable_audio_themes"]
-        self.active_theme = self.get_active_theme()
-        if self.active_theme is None:
+        wanted = {key: user_config[key] for key in audiothemes_config_defaults}
+        changed = {
+            key
+            for key, value in wanted.items()
+            if (key not in self._applied_config) or (self._applied_config[key] != value)
+        }
+        self._applied_config = wanted
+        self.enabled = wanted["enable_audio_themes"]
+        latency.enabled = wanted["trace_latency"]
+        self.player.audio3d = wanted["audio3d"]
+        self.player.use_in_say_all = wanted["use_in_say_all"]
+        self.player.speak_roles = wanted["speak_roles"]
+        self.player.use_synth_volume = wanted["use_synth_volume"]
+        self.player.volume = wanted["volume"]
+        self.normalize_loudness = wanted["normalize_loudness"]
+        if changed & {"pcm_cache", "pcm_cache_size"}:
+            self.configure_pcm_cache(
+                wanted["pcm_cache"], wanted["pcm_cache_size"] * 1024 * 1024
+            )
+        if changed & {"sound_cache", "sound_cache_size"}:
+            self.configure_sound_cache(
+                wanted["sound_cache"], wanted["sound_cache_size"] * 1024 * 1024
+            )
+        storage = StoragePolicy(
+            downmix=wanted["downmix_sounds"],
+            resample=wanted["resample_sounds"],
+            trim_silence=wanted["trim_silence"],
+        )
+        if changed & {"downmix_sounds", "resample_sounds", "trim_silence"}:
+            self.player.set_storage(storage)
+        if "watch_themes" in changed:
+            self.configure_watcher(wanted["watch_themes"])
+        if changed & {"voices", "voice_stealing"}:
+            self.player.configure_voices(
+                wanted["voices"], StealPolicy(wanted["voice_stealing"])
+            )
+        if changed & {"binaural_cache", "binaural_cache_size"}:
+            self.player.configure_binaural_cache(
+                wanted["binaural_cache"], wanted["binaural_cache_size"] * 1024 * 1024
+            )
+        theme = self.get_active_theme()
+        theme_state = None
+        if theme is not None:
+            theme_state = (
+                theme.directory,
+                theme.signature(),
+                wanted["lazy_loading"],
+                storage,
+            )
+        with self._theme_lock:
+            if theme_state == self._theme_state:
+                return
+            self._theme_state = theme_state
+            self._theme_generation += 1
+            generation = self._theme_generation
+        if (theme is None) or wanted["lazy_loading"]:
+            if theme is not None:
+                theme.load(self.player, lazy=True, prefetch=wanted["prefetch_sounds"])
+            self._swap_theme(theme, generation)
+            return
+        # Decoding a whole theme takes a while, the current one keeps playing until it is done.
+        threading.Thread(
+            target=self._load_theme, args=(theme, generation), daemon=True
+        ).start()
+
+    def _load_theme(self, theme, generation):
+        try:
+            theme.load(self.player)
+        except Exception:
+            log.exception(f"Could not load the audio theme {theme.name}")
+            theme.unload()
+            with self._theme_lock:
+                if generation == self._theme_generation:
+                    # Try again on the next configure.
+                    self._theme_state = None
+        self._swap_theme(theme, generation)
+
+    def _swap_theme(self, theme, generation):
+        with self._theme_lock:
+            if generation != self._theme_generation:
+                # A newer configure has already taken over.
+                if theme is not None:
+                    theme.deactivate()
+                return
+            previous, self.active_theme = self.active_theme, theme
+            if theme is not None:
+                theme.is_active = True
+        if previous is not None:
+            previous.deactivate()
+        if theme is not None:
+            self.player.prefetch(theme.sounds.values())
+        self._watch_active_theme()
+
+    def configure_watcher(self, enabled):
+        if enabled and (self.watcher is None):
+            self.watcher = create_watcher(self._on_files_changed)
+            self._watch_active_theme()
+            self.watcher.start()
+        elif not enabled and (self.watcher is not None):
+            self.watcher.stop()
+            self.watcher = None
+
+    def _watch_active_theme(self):
+        watcher, theme = self.watcher, self.active_theme
+        if watcher is not None:
+            # A mounted package changes along with THEMES_HOME.
+            watcher.watch(
+                [THEMES_HOME]
+                if (theme is None) or theme.is_mounted
+                else [THEMES_HOME, theme.directory]
+            )
+
+    def _on_files_changed(self, changes):
+        """Called from the watcher thread with a dict of directory -> changed names."""
+        theme = self.active_theme
+        if theme is None:
+            return
+        if theme.folder in changes.get(os.path.normpath(THEMES_HOME), ()):
+            # The whole theme was removed or replaced.
+            queueHandler.queueFunction(queueHandler.eventQueue, self.configure)
             return
-        self.player.audio3d = user_config["audio3d"]
-        self.player.use_in_say_all = user_config["use_in_say_all"]
-        self.player.speak_roles = user_config["speak_roles"]
-        self.player.use_synth_volume = user_config["use_synth_volume"]
-        self.player.volume = user_config["volume"]
-
-    def play(self, obj, sound):
-        if not self.enabled or (self.active_theme is None):
+        filenames = changes.get(os.path.normpath(theme.directory))
+        if not filenames:
             return
-        sound_obj = self.active_theme.sounds.get(sound)
+        try:
+            loaded = theme.reload_files(
+                filenames, self.player, lazy=self._applied_config["lazy_loading"]
+            )
+        except Exception:
+            log.exception(f"Could not reload the audio theme {theme.name}")
+            return
+        with self._theme_lock:
+            if (self._theme_state is not None) and (
+                self._theme_state[0] == theme.directory
+            ):
+                # Already up to date, the next configure has no reason to reload everything.
+                self._theme_state = (
+                    theme.directory,
+                    theme.signature(),
+                ) + self._theme_state[2:]
+        self.player.invalidate(loaded)
+
+    @staticmethod
+    def share_theme_sounds():
+        """Move the sounds of every installed theme to the sound store, and log what it saved.
+
+        Run when the user turns on sharing, never at startup.
+        """
+        try:
+            report = sound_store.migrate(AudioTheme.is_sound_file_name)
+            freed = sound_store.collect()
+            total = sound_store.disk_saved()
+        except OSError:
+            log.exception("Could not share the sounds of the installed themes")
+            return
+        log.info(
+            f"Shared {report.shared} of {report.files} theme sound files, "
+            f"{(report.bytes_saved + freed) / 1024:.0f} KB freed now, "
+            f"{total / 1024:.0f} KB saved in total"
+        )
+
+    def configure_pcm_cache(self, enabled, max_bytes):
+        if not enabled:
+            self.pcm_cache = None
+        elif self.pcm_cache is None:
+            try:
+                self.pcm_cache = PCMCache(PCM_CACHE_DIRECTORY, max_bytes)
+            except OSError:
+                log.exception("Could not create the decoded sounds cache")
+        else:
+            self.pcm_cache.max_bytes = max_bytes
+            self.pcm_cache.evict()
+        self.player.set_pcm_cache(self.pcm_cache)
+
+    def configure_sound_cache(self, enabled, max_bytes):
+        if not enabled:
+            if self.sound_cache is not None:
+                self.sound_cache.clear()
+            self.sound_cache = None
+        elif self.sound_cache is None:
+            self.sound_cache = SoundCache(self.player.backend, max_bytes)
+        else:
+            self.sound_cache.resize(max_bytes)
+        self.player.set_sound_cache(self.sound_cache)
+
+    def play(self, obj, sound, trace=None):
+        theme = self.active_theme
+        if not self.enabled or (theme is None):
+            return
+        sound_obj = theme.get_sound(sound, self.player)
         if sound_obj is None:
             return
-        self.player.play(obj, sound_obj)
+        latency.stamp(trace, "played")
+        gain = theme.gains.get(sound, 1.0) if self.normalize_loudness else 1.0
+        self.player.play(
+            obj, sound_obj, trace, sound_priorities.get(sound, 0), gain=gain
+        )
 
     @classmethod
     def get_theme_from_folder(cls, folderpath):
-        expected = os.path.join(THEMES_HOME, folderpath)
-        info_file = os.path.join(expected, INFO_FILE_NAME)
-        if os.path.isfile(info_file):
-            info = cls.load_info_file(info_file)
-            return AudioTheme(directory=expected, **info)
+        entry = theme_index.get(folderpath)
+        if entry is not None:
+            return AudioTheme(
+                directory=os.path.join(THEMES_HOME, folderpath), **entry["info"]
+            )
 
     @classmethod
     def get_installed_themes(cls):
-        for folder in os.listdir(THEMES_HOME):
-            theme = cls.get_theme_from_folder(folder)
-            if theme is None:
-                continue
-            yield theme
+        for folder, entry in theme_index.entries():
+            yield AudioTheme(
+                directory=os.path.join(THEMES_HOME, folder), **entry["info"]
+            )
 
     @classmethod
-    def install_audio_themePackage(cls, theme_pack):
-        identified_path = os.path.join(THEMES_HOME, uuid4().hex).lower()
-        with ZipFile(theme_pack, "r") as pack:
-            if pack.infolist()[0].is_dir():
-                # Legacy theme package
-                return cls._install_legacy(pack, identified_path)
-            pack.extractall(path=identified_path)
+    def make_installer(cls, theme_pack, on_progress=None):
+        """Return a `installer.ThemeInstaller` for `theme_pack`, to run in the background."""
+        deduplicate = analyze = None
+        if config.conf["audiothemes"]["share_sounds"]:
+            deduplicate = functools.partial(
+                sound_store.deduplicate, is_sound=AudioTheme.is_sound_file_name
+            )
+        if config.conf["audiothemes"]["normalize_loudness"]:
+            analyze = cls.analyze_loudness
+        return ThemeInstaller(
+            theme_pack,
+            THEMES_HOME,
+            INFO_FILE_NAME,
+            on_progress,
+            mount=config.conf["audiothemes"]["mount_packages"],
+            deduplicate=deduplicate,
+            analyze=analyze,
+        )
 
     @classmethod
-    def _install_legacy(cls, pack, final_dst):
-        pack_infolist = pack.infolist()
-        theme_name = pack_infolist[0].orig_filename.strip("/")
-        os.mkdir(final_dst)
-        for zinfo in pack_infolist[1:]:
-            filename = os.path.split(zinfo.filename)[1]
-            with open(os.path.join(final_dst, filename), "wb") as soundfile:
-                soundfile.write(pack.read(zinfo))
-        info_file = os.path.join(final_dst, INFO_FILE_NAME)
-        theme_info = cls.load_info_file(info_file)
-        if "name" not in theme_info:
-            theme_info["name"] = theme_name
-            cls.write_info_file(info_file, theme_info)
+    def install_audio_themePackage(cls, theme_pack):
+        return cls.make_installer(theme_pack).run()
 
     @staticmethod
     def remove_audio_theme(theme):
         theme.deactivate()
         if theme.directory:
-            shutil.rmtree(theme.directory)
+            if theme.is_mounted:
+                os.remove(theme.directory)
+            else:
+                shutil.rmtree(theme.directory)
+                sound_store.collect()
+            theme_index.invalidate(theme.folder)
+
+    @classmethod
+    def extract_audio_theme(cls, theme):
+        """Replace a mounted package by an extracted copy, so its files can be edited, returns the new theme."""
+        directory = ThemeInstaller(theme.directory, THEMES_HOME, INFO_FILE_NAME).run()
+        extracted = cls.get_theme_from_folder(os.path.basename(directory))
+        if config.conf["audiothemes"]["active_theme"] == theme.folder:
+            config.conf["audiothemes"]["active_theme"] = extracted.folder
+        try:
+            cls.remove_audio_theme(theme)
+        except OSError:
+            # Still open by the active theme, it is only a duplicate now.
+            log.warning(f"Could not remove {theme.directory}", exc_info=True)
+        return extracted
+
+    @staticmethod
+    def detach_theme_sounds(theme):
+        """Give `theme` copies of its own of the sounds it shares, so they can be edited in place."""
+        if theme.directory and not theme.is_mounted:
+            try:
+                sound_store.detach(theme.directory)
+                sound_store.collect()
+            except OSError:
+                log.exception(f"Could not copy the shared sounds of {theme.name}")
+
+    @staticmethod
+    def place_sound_file(source, destination):
+        """Copy a sound file into a theme, replacing `destination`, and share it with identical sounds.
+
+        Copy-on-write: if `destination` is shared with other themes, they keep their sound.
+        """
+        sound_store.place(
+            source, destination, share=config.conf["audiothemes"]["share_sounds"]
+        )
 
     @staticmethod
     def load_info_file(info_file):
@@ -244,11 +770,78 @@ class AudioThemesHandler:
     def write_info_file(file_path, data):
         with open(file_path, "w", encoding="utf8") as f:
             json.dump(data, f)
+        # The modification time may not have moved on a coarse clock.
+        theme_index.invalidate(os.path.basename(os.path.dirname(file_path)))
+
+    @classmethod
+    def analyze_loudness(cls, path, on_progress=None):
+        """Measure every sound of the theme at `path`, a directory or a mounted package,
+        and store the loudness table in its info file, returns the table.
+        `on_progress` is passed to `loudness.analyze`.
+        """
+        # str(role) -> file name, or a function returning the decoded sound.
+        sources = {}
+        if os.path.isfile(path):
+            archive = ThemeArchive(path)
+            try:
+                info = archive.info(INFO_FILE_NAME)
+                for name in archive.names:
+                    rep_role = AudioTheme.role_of(name)
+                    if rep_role is not None:
+                        sources[str(rep_role)] = functools.partial(
+                            decode_member, archive, name
+                        )
+                results, errors = loudness.analyze(sources.items(), on_progress)
+            finally:
+                archive.close()
+        else:
+            info = cls.load_info_file(os.path.join(path, INFO_FILE_NAME))
+            packed_file = os.path.join(path, PACKED_FILE_NAME)
+            pack = PackedTheme(packed_file) if os.path.isfile(packed_file) else None
+            try:
+                if pack is not None:
+                    for rep_role in pack.roles:
+                        sources[str(rep_role)] = functools.partial(
+                            pack.decoded, rep_role
+                        )
+                for filename in os.listdir(path):
+                    rep_role = AudioTheme.role_of(filename)
+                    if rep_role is not None:
+                        # Loose sound files take precedence over the packed ones.
+                        sources[str(rep_role)] = os.path.join(path, filename)
+                results, errors = loudness.analyze(sources.items(), on_progress)
+            finally:
+                if pack is not None:
+                    pack.close()
+        for name, error in errors.items():
+            log.error(
+                f"Could not measure the sound of role {name} in {path}", exc_info=error
+            )
+        info["loudness"] = table = loudness.make_table(results)
+        if os.path.isfile(path):
+            write_info(path, INFO_FILE_NAME, info)
+        else:
+            cls.write_info_file(os.path.join(path, INFO_FILE_NAME), info)
+        return table
 
     @staticmethod
-    def make_zip_file(output_filename, source_dir):
-        with ZipFile(output_filename, "w", ZIP_DEFLATED) as zip:
-            for filename in os.listdir(source_dir):
-                file = os.path.join(source_dir, filename)
-                if os.path.isfile(file):
-                    zip.write(file, filename)
+    def make_packed_file(output_filename, source, sample_format=None):
+        """Convert a theme directory, or a version 1 package, into a version 2 packed theme."""
+        kwargs = {} if sample_format is None else {"sample_format": sample_format}
+        if os.path.isdir(source):
+            pack_directory(
+                source, output_filename, INFO_FILE_NAME, AudioTheme.role_of, **kwargs
+            )
+        else:
+            pack_package(
+                source, output_filename, INFO_FILE_NAME, AudioTheme.role_of, **kwargs
+            )
+
+    @staticmethod
+    def make_exporter(source_dir, output_filename, on_progress=None):
+        """Return a `exporter.ThemeExporter` packaging the theme in `source_dir`, to run in the background."""
+        return ThemeExporter(source_dir, output_filename, on_progress)
+
+    @classmethod
+    def make_zip_file(cls, output_filename, source_dir):
+        return cls.make_exporter(source_dir, output_filename).run()
@@ -0,0 +1,195 @@
+# coding: utf-8
+
+# Copyright (c) 2014-2019 Musharraf Omer
+# This file is covered by the GNU General Public License.
+
+# Installation of audio theme packages.
+# Members are copied from the package to disk in fixed-size chunks, so memory use does not grow with the package.
+# Everything is extracted into a staging directory first, and moved under its final name with one rename
+# once complete, so a failed or cancelled installation never leaves a half-installed theme behind.
+# Version 2 packages, see `unspoken.packed`, are copied whole next to an info file read from their header.
+# With `mount`, version 1 packages are not extracted at all: the package itself is installed,
+# as a file named after the theme folder, and its sounds are read in place, see `unspoken.archive`.
+# This module has no dependency on NVDA.
+
+import json
+import os
+import shutil
+import threading
+from uuid import uuid4
+from zipfile import ZipFile
+from .unspoken.archive import PACKAGE_EXTENSION, ThemeArchive
+from .unspoken.packed import PACKED_FILE_NAME, PackedTheme, is_packed
+
+# Inside THEMES_HOME, it has no info file so it is never mistaken for a theme.
+STAGING_DIRECTORY_NAME = "__staging__"
+CHUNK_SIZE = 1024 * 1024
+
+
+class InstallCancelled(Exception):
+    """Raised by `ThemeInstaller.run` when the installation was cancelled."""
+
+
+class InvalidThemePackage(Exception):
+    """Raised when a package would write outside of its theme directory."""
+
+
+class ThemeInstaller(object):
+    """Installs one theme package into `themes_home`.
+
+    `on_progress`, if given, is called with the bytes written so far and the total,
+    from the thread that runs the installation.
+    With `mount`, version 1 packages are installed as they are instead of being extracted.
+    `analyze`, if given, is called with the extracted directory, or the mounted package,
+    before it is moved in place, to measure its sounds.
+    `deduplicate`, if given, is called with the extracted directory before it is moved in place,
+    see `soundstore.SoundStore.deduplicate`.
+    """
+
+    def __init__(
+        self,
+        package,
+        themes_home,
+        info_file_name,
+        on_progress=None,
+        mount=False,
+        deduplicate=None,
+        analyze=None,
+    ):
+        self.package = package
+        self.themes_home = themes_home
+        self.info_file_name = info_file_name
+        self.on_progress = on_progress
+        self.mount = mount
+        self.deduplicate = deduplicate
+        self.analyze = analyze
+        self.directory = None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def start(self, on_done):
+        """Install in a background thread, then call `on_done` with None or the exception raised."""
+
+        def install():
+            try:
+                self.run()
+            except Exception as e:
+                on_done(e)
+            else:
+                on_done(None)
+
+        threading.Thread(target=install, daemon=True).start()
+
+    def run(self):
+        """Install the package and return the directory, or the mounted package, of the new theme."""
+        staging_home = os.path.join(self.themes_home, STAGING_DIRECTORY_NAME)
+        os.makedirs(staging_home, exist_ok=True)
+        folder = uuid4().hex
+        packed = is_packed(self.package)
+        if self.mount and not packed:
+            folder += PACKAGE_EXTENSION
+        staging = os.path.join(staging_home, folder)
+        try:
+            if packed:
+                self._install_packed(staging)
+            elif self.mount:
+                self._mount(staging)
+            else:
+                with ZipFile(self.package, "r") as pack:
+                    members = pack.infolist()
+                    if members and members[0].is_dir():
+                        self._extract_legacy(pack, members, staging)
+                    else:
+                        self._extract(pack, members, staging)
+            self._check_cancelled()
+            if self.analyze is not None:
+                self.analyze(staging)
+                self._check_cancelled()
+            if (self.deduplicate is not None) and os.path.isdir(staging):
+                self.deduplicate(staging)
+            directory = os.path.join(self.themes_home, folder)
+            os.replace(staging, directory)
+        except BaseException:
+            if os.path.isdir(staging):
+                shutil.rmtree(staging, ignore_errors=True)
+            elif os.path.exists(staging):
+                os.remove(staging)
+            raise
+        self.directory = directory
+        return directory
+
+    def _check_cancelled(self):
+        if self._cancelled.is_set():
+            raise InstallCancelled(self.package)
+
+    def _copy(self, source, target, done, total):
+        """Stream `source` into `target`, returns the bytes written so far."""
+        while True:
+            self._check_cancelled()
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                return done
+            target.write(chunk)
+            done += len(chunk)
+            if self.on_progress is not None:
+                self.on_progress(done, total)
+
+    def _copy_members(self, pack, targets):
+        """Stream every (member, path) of `targets` to disk."""
+        total = sum(member.file_size for member, path in targets)
+        done = 0
+        for member, path in targets:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with pack.open(member) as source, open(path, "wb") as target:
+                done = self._copy(source, target, done, total)
+
+    def _install_packed(self, staging):
+        os.makedirs(staging)
+        packed_file = os.path.join(staging, PACKED_FILE_NAME)
+        with open(self.package, "rb") as source, open(packed_file, "wb") as target:
+            self._copy(source, target, 0, os.path.getsize(self.package))
+        with PackedTheme(packed_file) as pack:
+            info = pack.info
+        with open(
+            os.path.join(staging, self.info_file_name), "w", encoding="utf8"
+        ) as f:
+            json.dump(info, f)
+
+    def _mount(self, staging):
+        # Fails before anything is copied if the package can not be read in place.
+        ThemeArchive(self.package).info(self.info_file_name)
+        with open(self.package, "rb") as source, open(staging, "wb") as target:
+            self._copy(source, target, 0, os.path.getsize(self.package))
+
+    def _extract(self, pack, members, staging):
+        root = os.path.abspath(staging)
+        targets = []
+        for member in members:
+            if member.is_dir():
+                continue
+            path = os.path.abspath(os.path.join(root, member.filename))
+            if os.path.commonpath([root, path]) != root:
+                raise InvalidThemePackage(f"{self.package}: {member.filename}")
+            targets.append((member, path))
+        os.makedirs(staging)
+        self._copy_members(pack, targets)
+
+    def _extract_legacy(self, pack, members, staging):
+        # A folder named after the theme, holding every file flat.
+        theme_name = members[0].orig_filename.strip("/")
+        targets = []
+        for member in members[1:]:
+            filename = os.path.split(member.filename)[1]
+            if filename:
+                targets.append((member, os.path.join(staging, filename)))
+        os.makedirs(staging)
+        self._copy_members(pack, targets)
+        info_file = os.path.join(staging, self.info_file_name)
+        with open(info_file, "r", encoding="utf8") as f:
+            theme_info = json.load(f)
+        if "name" not in theme_info:
+            theme_info["name"] = theme_name
+            with open(info_file, "w", encoding="utf8") as f:
+                json.dump(theme_info, f)
@@ -3,10 +3,12 @@
 # Copyright (c) 2014-2019 Musharraf Omer
 # This file is covered by the GNU General Public License.
 
+import threading
 import wx
 import config
 import gui
 from .handler import AudioThemesHandler, audiotheme_changed
+from .installer import InstallCancelled
 
 
 import addonHandler
@@ -45,6 +47,43 @@ class AudioThemesSettingsPanel(gui.SettingsPanel):
         self.useSynthVolumeCheckbox = wx.CheckBox(
             innerPanel, -1, _("Use speech synthesizer volume")
         )
+        # Translators: label for a checkbox to keep sound files that several themes have in common only once on disk
+        self.shareSoundsCheckbox = wx.CheckBox(
+            innerPanel, -1, _("Share identical sounds between themes")
+        )
+        # Translators: label for a checkbox to keep sounds rendered in 3D in memory
+        self.binauralCacheCheckbox = wx.CheckBox(
+            innerPanel, -1, _("Keep sounds rendered in 3D in memory")
+        )
+        # Translators: label for a checkbox to keep decoded sounds on disk, so themes load faster
+        self.pcmCacheCheckbox = wx.CheckBox(
+            innerPanel, -1, _("Keep decoded sounds on disk")
+        )
+        # Translators: label for a checkbox to load each sound the first time it is played
+        self.lazyLoadingCheckbox = wx.CheckBox(
+            innerPanel, -1, _("Load sounds when they are first played")
+        )
+        # Translators: label for a checkbox to keep loaded sounds in memory across theme changes
+        self.soundCacheCheckbox = wx.CheckBox(
+            innerPanel, -1, _("Keep loaded sounds in memory")
+        )
+        # Translators: label for a checkbox to reload the sounds of the active theme when their files change
+        self.watchThemesCheckbox = wx.CheckBox(
+            innerPanel, -1, _("Reload theme sounds when their files change")
+        )
+        # Translators: label for a checkbox to install theme packages without extracting them, their sounds are then never shared with other themes
+        self.mountPackagesCheckbox = wx.CheckBox(
+            innerPanel,
+            -1,
+            _("Play sounds from installed packages without extracting them"),
+        )
+        # Translators: label for a checkbox to play every sound at the same loudness, whatever the theme
+        self.normalizeLoudnessCheckbox = wx.CheckBox(
+            innerPanel, -1, _("Play all themes at the same loudness")
+        )
+        # Translators: label for a spin control to set how many sounds can play at the same time
+        voicesLabel = wx.StaticText(innerPanel, -1, _("Sounds playing at once:"))
+        self.voicesSpin = wx.SpinCtrl(innerPanel, -1, min=1, max=16)
         # Translators: label for a slider to set the volume of this add-on
         volumeLabel = wx.StaticText(innerPanel, -1, _("Audio themes volume:"))
         self.volumeSlider = wx.Slider(
@@ -77,6 +116,26 @@ class AudioThemesSettingsPanel(gui.SettingsPanel):
                 (self.speakRoleCheckbox, 1, wx.ALL, 5),
                 (self.useInSayAllCheckbox, 1, wx.ALL, 5),
                 (self.useSynthVolumeCheckbox, 1, wx.ALL, 5),
+                (self.shareSoundsCheckbox, 1, wx.ALL, 5),
+            ]
+        )
+        voicesSizer = wx.BoxSizer(wx.HORIZONTAL)
+        voicesSizer.AddMany(
+            [
+                (voicesLabel, 1, wx.LEFT | wx.TOP | wx.BOTTOM, 10),
+                (self.voicesSpin, 1, wx.ALL, 5),
+            ]
+        )
+        innerSizer.AddMany(
+            [
+                (self.binauralCacheCheckbox, 1, wx.ALL, 5),
+                (self.pcmCacheCheckbox, 1, wx.ALL, 5),
+                (self.lazyLoadingCheckbox, 1, wx.ALL, 5),
+                (self.soundCacheCheckbox, 1, wx.ALL, 5),
+                (self.watchThemesCheckbox, 1, wx.ALL, 5),
+                (self.mountPackagesCheckbox, 1, wx.ALL, 5),
+                (self.normalizeLoudnessCheckbox, 1, wx.ALL, 5),
+                (voicesSizer, 1, wx.EXPAND, 10),
                 (volumeLabel, 1, wx.TOP | wx.LEFT | wx.RIGHT, 10),
                 (self.volumeSlider, 1, wx.BOTTOM | wx.LEFT | wx.RIGHT, 5),
             ]
@@ -117,6 +176,15 @@ class AudioThemesSettingsPanel(gui.SettingsPanel):
         self.speakRoleCheckbox.SetValue(conf["speak_roles"])
         self.useInSayAllCheckbox.SetValue(conf["use_in_say_all"])
         self.useSynthVolumeCheckbox.SetValue(conf["use_synth_volume"])
+        self.shareSoundsCheckbox.SetValue(conf["share_sounds"])
+        self.binauralCacheCheckbox.SetValue(conf["binaural_cache"])
+        self.pcmCacheCheckbox.SetValue(conf["pcm_cache"])
+        self.lazyLoadingCheckbox.SetValue(conf["lazy_loading"])
+        self.soundCacheCheckbox.SetValue(conf["sound_cache"])
+        self.watchThemesCheckbox.SetValue(conf["watch_themes"])
+        self.mountPackagesCheckbox.SetValue(conf["mount_packages"])
+        self.normalizeLoudnessCheckbox.SetValue(conf["normalize_loudness"])
+        self.voicesSpin.SetValue(conf["voices"])
         self.volumeSlider.SetValue(conf["volume"])
 
     def _maintain_state(self):
@@ -139,7 +207,22 @@ class AudioThemesSettingsPanel(gui.SettingsPanel):
         conf["speak_roles"] = self.speakRoleCheckbox.IsChecked()
         conf["use_in_say_all"] = self.useInSayAllCheckbox.IsChecked()
         conf["use_synth_volume"] = self.useSynthVolumeCheckbox.IsChecked()
+        conf["voices"] = self.voicesSpin.GetValue()
+        conf["binaural_cache"] = self.binauralCacheCheckbox.IsChecked()
+        conf["pcm_cache"] = self.pcmCacheCheckbox.IsChecked()
+        conf["lazy_loading"] = self.lazyLoadingCheckbox.IsChecked()
+        conf["sound_cache"] = self.soundCacheCheckbox.IsChecked()
+        conf["watch_themes"] = self.watchThemesCheckbox.IsChecked()
+        conf["mount_packages"] = self.mountPackagesCheckbox.IsChecked()
+        conf["normalize_loudness"] = self.normalizeLoudnessCheckbox.IsChecked()
         conf["volume"] = self.volumeSlider.GetValue()
+        share_sounds = self.shareSoundsCheckbox.IsChecked()
+        if share_sounds and not conf["share_sounds"]:
+            # Themes installed from now on are shared as they are installed, the others now.
+            threading.Thread(
+                target=AudioThemesHandler.share_theme_sounds, daemon=True
+            ).start()
+        conf["share_sounds"] = share_sounds
 
     def postSave(self):
         audiotheme_changed.notify()
@@ -183,9 +266,48 @@ class AudioThemesSettingsPanel(gui.SettingsPanel):
             filename = openFileDlg.GetPath().strip()
             openFileDlg.Destroy()
             if filename:
-                AudioThemesHandler.install_audio_themePackage(filename)
+                self.install_package(filename)
+
+    def install_package(self, filename):
+        """Install a theme package in the background, behind a progress dialog that can cancel it."""
+        progress = wx.ProgressDialog(
+            # Translators: title of a dialog shown while an audio theme package is being installed
+            _("Installing Audio Theme"),
+            # Translators: message of a dialog shown while an audio theme package is being installed
+            _("Installing the audio theme, please wait..."),
+            maximum=100,
+            parent=self,
+            style=wx.PD_APP_MODAL | wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME,
+        )
+
+        def update(done, total):
+            if progress and (done < total):
+                keep_going, skip = progress.Update(done * 100 // total)
+                if not keep_going:
+                    installer.cancel()
+
+        def finish(error):
+            if progress:
+                progress.Destroy()
+            if (error is not None) and not isinstance(error, InstallCancelled):
+                wx.MessageBox(
+                    # Translators: message shown when an audio theme package could not be installed
+                    _("Could not install the audio theme package.\n{error}").format(
+                        error=error
+                    ),
+                    # Translators: title of a message shown when an audio theme package could not be installed
+                    _("Error"),
+                    style=wx.ICON_ERROR,
+                )
+            if self:
                 self._maintain_state()
 
+        installer = AudioThemesHandler.make_installer(
+            filename,
+            on_progress=lambda done, total: wx.CallAfter(update, done, total),
+        )
+        installer.start(lambda error: wx.CallAfter(finish, error))
+
     def onThemeSelectionChanged(self, event):
         flag = self.selected_theme is not None
         for btn in (self.aboutThemeButton, self.removeThemeButton):
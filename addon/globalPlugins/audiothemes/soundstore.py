@@ -0,0 +1,197 @@
+# coding: utf-8
+
+# Copyright (c) 2014-2019 Musharraf Omer
+# This file is covered by the GNU General Public License.
+
+# A content-addressed store of theme sounds, shared by every installed theme.
+# Each unique sound file is kept once, under THEMES_HOME/__store__, named after the SHA-1 of its content,
+# and theme directories hold hard links to it: a theme is still a plain directory of sound files,
+# which the rest of the add-on reads as before.
+# Linked files share their content, so a sound file of a theme is never written in place:
+# `place` replaces the link of one theme, and `detach` gives a theme copies of its own before it is edited.
+# Sound editors must do the same, saving an edited sound under a new name and renaming it over the old one
+# ("save as"), since saving into a linked file changes the sound of every theme that shares it.
+# Sharing is opt-in, it runs when a theme is installed or when the user asks for it.
+# Hard links need the themes and the store on one volume that supports them, files that can not be linked
+# are left as they are. Files that already have other links are not looked at again,
+# so sharing the sounds of every theme is cheap once done.
+# Sounds no theme links to any more are collected after a theme is removed.
+# This module has no dependency on NVDA.
+
+import os
+import shutil
+import threading
+from dataclasses import dataclass
+from uuid import uuid4
+from .unspoken.soundcache import content_hash
+
+STORE_DIRECTORY_NAME = "__store__"
+
+
+@dataclass
+class StoreReport:
+    # Sound files looked at.
+    files: int = 0
+    # Of which were replaced by a link to an identical sound.
+    shared: int = 0
+    # Disk space freed by those links.
+    bytes_saved: int = 0
+
+    def update(self, other):
+        self.files += other.files
+        self.shared += other.shared
+        self.bytes_saved += other.bytes_saved
+
+
+class SoundStore(object):
+    def __init__(self, themes_home):
+        self.themes_home = themes_home
+        self.path = os.path.join(themes_home, STORE_DIRECTORY_NAME)
+        self._lock = threading.Lock()
+
+    def object_path(self, digest, extension):
+        return os.path.join(self.path, digest[:2], digest + extension.lower())
+
+    def add(self, filename):
+        """Share `filename` through the store, returns True if it was replaced by a link to an identical sound."""
+        digest = content_hash(filename)
+        target = self.object_path(digest, os.path.splitext(filename)[1])
+        with self._lock:
+            try:
+                if not os.path.exists(target):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.link(filename, target)
+                    return False
+                if os.path.samefile(filename, target):
+                    return False
+                temp_path = f"{filename}.{uuid4().hex}.tmp"
+                os.link(target, temp_path)
+                try:
+                    os.replace(temp_path, filename)
+                except BaseException:
+                    os.remove(temp_path)
+                    raise
+                return True
+            except OSError:
+                # No hard links on this volume, or the file is in use, it keeps a copy of its own.
+                return False
+
+    def place(self, source, destination, share=True):
+        """Copy `source` to `destination`, replacing it, and share it through the store if `share`.
+
+        This is copy-on-write: a `destination` linked to other themes is detached first,
+        so only this theme gets the new sound.
+        """
+        with self._lock:
+            self.detach_file(destination)
+        temp_path = f"{destination}.{uuid4().hex}.tmp"
+        shutil.copyfile(source, temp_path)
+        try:
+            os.replace(temp_path, destination)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        if share:
+            self.add(destination)
+
+    def detach_file(self, path):
+        """Replace `path` by a copy of its own if it has other links, returns True if it was.
+
+        Call with the lock held.
+        """
+        try:
+            if os.stat(path).st_nlink < 2:
+                return False
+            temp_path = f"{path}.{uuid4().hex}.tmp"
+            shutil.copyfile(path, temp_path)
+            try:
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        except OSError:
+            return False
+        return True
+
+    def detach(self, directory):
+        """Replace every file of `directory` that has other links by a copy of its own, returns how many were."""
+        detached = 0
+        with self._lock:
+            with os.scandir(directory) as it:
+                entries = [entry.path for entry in it if entry.is_file()]
+            for path in entries:
+                if self.detach_file(path):
+                    detached += 1
+        return detached
+
+    def deduplicate(self, directory, is_sound):
+        """Share every file of `directory` for which `is_sound(name)` is true, returns a `StoreReport`."""
+        report = StoreReport()
+        with os.scandir(directory) as it:
+            entries = [
+                entry for entry in it if entry.is_file() and is_sound(entry.name)
+            ]
+        for entry in entries:
+            try:
+                st = os.stat(entry.path)
+            except OSError:
+                continue
+            report.files += 1
+            if st.st_nlink > 1:
+                # Already in the store.
+                continue
+            if self.add(entry.path):
+                report.shared += 1
+                report.bytes_saved += st.st_size
+        return report
+
+    def migrate(self, is_sound):
+        """Share the sounds of every theme directory, returns a `StoreReport` of the whole run."""
+        report = StoreReport()
+        with os.scandir(self.themes_home) as it:
+            directories = [
+                entry.path
+                for entry in it
+                if entry.is_dir() and not entry.name.startswith("__")
+            ]
+        for directory in directories:
+            try:
+                report.update(self.deduplicate(directory, is_sound))
+            except OSError:
+                continue
+        return report
+
+    def _objects(self):
+        if not os.path.isdir(self.path):
+            return
+        for prefix in os.listdir(self.path):
+            directory = os.path.join(self.path, prefix)
+            if os.path.isdir(directory):
+                for name in os.listdir(directory):
+                    yield os.path.join(directory, name)
+
+    def collect(self):
+        """Remove the sounds no theme links to any more, returns the bytes freed."""
+        freed = 0
+        with self._lock:
+            for path in list(self._objects()):
+                try:
+                    st = os.stat(path)
+                    if st.st_nlink == 1:
+                        os.remove(path)
+                        freed += st.st_size
+                except OSError:
+                    continue
+        return freed
+
+    def disk_saved(self):
+        """Return the bytes the themes would take on top of the store without it."""
+        saved = 0
+        for path in self._objects():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            # One link is the store's own, one is the copy every theme would need anyway.
+            saved += st.st_size * max(0, st.st_nlink - 2)
+        return saved
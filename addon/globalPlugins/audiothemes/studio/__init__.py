@@ -165,6 +165,7 @@ class AudioThemesStudioStartupDialog(BaseDialog):
                 # Translators: title for create new theme dialog
                 _("Creating New Theme - {name}").format(name=theme_info["name"]),
                 theme=new_theme,
+                player=self.plugin.handler.player,
                 editing=False,
             )
             with self.audio_theme_muted():
@@ -189,10 +190,16 @@ class AudioThemesStudioStartupDialog(BaseDialog):
             if selectDlg.ShowModal() != wx.ID_OK:
                 return
             selected_theme = selectDlg.selected_theme
+        if selected_theme.is_mounted:
+            # The sounds of a mounted package can only be edited once it is extracted.
+            selected_theme = AudioThemesHandler.extract_audio_theme(selected_theme)
+        # Shared sounds are links to files other themes use too.
+        AudioThemesHandler.detach_theme_sounds(selected_theme)
         dlg = ThemeBlenderDialog(
             # Translators: title for create new theme dialog
             _("Editing Audio Theme: {name}").format(name=selected_theme.name),
             theme=selected_theme,
+            player=self.plugin.handler.player,
         )
         with self.audio_theme_muted():
             with dlg:
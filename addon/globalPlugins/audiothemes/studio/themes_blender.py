@@ -8,9 +8,11 @@ from dataclasses import dataclass, field, asdict
 from contextlib import suppress
 import os
 import shutil
+import threading
 import wx
 import gui
-from ..unspoken import UnspokenPlayer
+from logHandler import log
+from ..exporter import ExportCancelled
 from ..handler import AudioTheme, AudioThemesHandler, theme_roles, SUPPORTED_FILE_TYPES
 
 import addonHandler
@@ -51,8 +53,9 @@ class SoundFileInfo:
     def reconcile(self):
         src_ext = os.path.splitext(self.src)[-1]
         dst_file = os.path.join(os.path.dirname(self.dst), f"{self.role}{src_ext}")
-        with suppress(shutil.Error):
-            shutil.copy(self.src, dst_file)
+        with suppress(shutil.Error, OSError):
+            # Replaces the file rather than writing to it, it may be shared with other themes.
+            AudioThemesHandler.place_sound_file(self.src, dst_file)
             return True
         return False
 
@@ -154,10 +157,11 @@ class BaseDialog(wx.Dialog):
 class ThemeBlenderDialog(BaseDialog):
     """Dialog for editing and creating audio themes."""
 
-    def __init__(self, title, theme, editing=True):
+    def __init__(self, title, theme, player, editing=True):
         self.theme_state = ThemeState(theme)
         self.editing = editing
-        self.player = UnspokenPlayer()
+        # The player of the handler, sounds previewed here go through its sound cache.
+        self.player = player
         super().__init__(title)
 
     def addControls(self, sizer, parent):
@@ -238,21 +242,33 @@ class ThemeBlenderDialog(BaseDialog):
 
     def onSave(self, event):
         self.theme_state.apply_diff()
-        if not self.editing:
-            saveFileDlg = wx.FileDialog(
-                self,
-                # Translators: title for a dialog to save an audio theme package
-                _("Save Audio Theme Package"),
-                # Translators: filetype description for audio theme packages
-                wildcard=_("Audio Theme Package (*.atp)|*.atp"),
-                defaultFile=f"{self.theme_state.theme.name}.atp",
-                style=wx.FD_SAVE,
-            )
-            if saveFileDlg.ShowModal() == wx.ID_OK:
-                filename = saveFileDlg.GetPath().strip()
-                saveFileDlg.Destroy()
-                if filename:
-                    self.save_theme_package(filename)
+        if self.editing:
+            self.measure_loudness(self._saved)
+            return
+        saveFileDlg = wx.FileDialog(
+            self,
+            # Translators: title for a dialog to save an audio theme package
+            _("Save Audio Theme Package"),
+            # Translators: filetype description for audio theme packages
+            wildcard=_("Audio Theme Package (*.atp)|*.atp") + "|"
+            # Translators: filetype description for packed audio theme packages, which load faster
+            + _("Packed Audio Theme Package (*.atp)|*.atp"),
+            defaultFile=f"{self.theme_state.theme.name}.atp",
+            style=wx.FD_SAVE,
+        )
+        if saveFileDlg.ShowModal() == wx.ID_OK:
+            filename = saveFileDlg.GetPath().strip()
+            packed = saveFileDlg.GetFilterIndex() == 1
+            saveFileDlg.Destroy()
+            if filename:
+                self.save_theme_package(filename, packed, self._saved)
+                return
+        self._saved()
+
+    def _saved(self):
+        """Close the dialog once everything saving started in the background is done."""
+        if not self:
+            return
         self.theme_state.state = self.theme_state.initial_state = ()
         self.Close()
 
@@ -301,10 +317,110 @@ class ThemeBlenderDialog(BaseDialog):
         self.editButton.Enable(selected_sound is not None)
         self.removeButton.Enable(selected_sound is not None)
 
-    def save_theme_package(self, dst_dir):
+    def save_theme_package(self, dst_dir, packed=False, on_done=None):
+        """Measure the theme, then package it, both in the background, and call `on_done` at the end."""
         theme = self.theme_state.theme
         AudioThemesHandler.write_info_file(theme.info_file_path, theme.todict())
-        AudioThemesHandler.make_zip_file(dst_dir, theme.directory)
+
+        def package():
+            if not packed:
+                self.export_theme_package(theme.directory, dst_dir, on_done)
+                return
+            AudioThemesHandler.make_packed_file(dst_dir, theme.directory)
+            if on_done is not None:
+                on_done()
+
+        # The info file, with the loudness table, is packaged once measured.
+        self.measure_loudness(package)
+
+    def measure_loudness(self, on_done=None):
+        """Measure in the background behind a progress dialog, and store the loudness table
+        in the info file of the theme, so it plays as loud as other themes.
+
+        `on_done` is called on the GUI thread once the table is stored.
+        """
+        theme = self.theme_state.theme
+        progress = wx.ProgressDialog(
+            # Translators: title of a dialog shown while the sounds of an audio theme are measured
+            _("Measuring Loudness"),
+            # Translators: message of a dialog shown while the sounds of an audio theme are measured
+            _("Measuring the loudness of the theme sounds, please wait..."),
+            maximum=100,
+            parent=self,
+            style=wx.PD_APP_MODAL | wx.PD_ELAPSED_TIME,
+        )
+
+        def update(done, total):
+            if progress and (done < total):
+                progress.Update(done * 100 // total)
+
+        def finish(table):
+            if progress:
+                progress.Destroy()
+            if table is not None:
+                theme.loudness = table
+            if on_done is not None:
+                on_done()
+
+        def measure():
+            table = None
+            try:
+                table = AudioThemesHandler.analyze_loudness(
+                    theme.directory,
+                    lambda done, total: wx.CallAfter(update, done, total),
+                )
+            except (OSError, ValueError):
+                # The theme still plays, each sound at its own level.
+                log.exception(f"Could not measure the audio theme {theme.name}")
+            finally:
+                wx.CallAfter(finish, table)
+
+        threading.Thread(target=measure, daemon=True).start()
+
+    def export_theme_package(self, source_dir, filename, on_done=None):
+        """Export in the background behind a progress dialog that can cancel it.
+
+        `on_done` is called on the GUI thread once the package is written, or the export failed,
+        the theme directory may be temporary and must stay until then.
+        """
+        progress = wx.ProgressDialog(
+            # Translators: title of a dialog shown while an audio theme package is being saved
+            _("Saving Audio Theme Package"),
+            # Translators: message of a dialog shown while an audio theme package is being saved
+            _("Saving the audio theme package, please wait..."),
+            maximum=100,
+            parent=self,
+            style=wx.PD_APP_MODAL | wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME,
+        )
+
+        def update(done, total):
+            if progress and (done < total):
+                keep_going, skip = progress.Update(done * 100 // total)
+                if not keep_going:
+                    exporter.cancel()
+
+        def finish(error):
+            if progress:
+                progress.Destroy()
+            if (error is not None) and not isinstance(error, ExportCancelled):
+                wx.MessageBox(
+                    # Translators: message shown when an audio theme package could not be saved
+                    _("Could not save the audio theme package.\n{error}").format(
+                        error=error
+                    ),
+                    # Translators: title of a message shown when an audio theme package could not be saved
+                    _("Error"),
+                    style=wx.ICON_ERROR,
+                )
+            if on_done is not None:
+                on_done()
+
+        exporter = AudioThemesHandler.make_exporter(
+            source_dir,
+            filename,
+            on_progress=lambda done, total: wx.CallAfter(update, done, total),
+        )
+        exporter.start(lambda error: wx.CallAfter(finish, error))
 
 
 class AudioSelectorDialog(BaseDialog):
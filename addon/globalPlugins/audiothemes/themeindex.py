@@ -0,0 +1,157 @@
+# coding: utf-8
+
+# Copyright (c) 2014-2019 Musharraf Omer
+# This file is covered by the GNU General Public License.
+
+# A persisted index of the installed audio themes.
+# For every theme folder it keeps the parsed info file, so listing the themes needs no JSON parsing
+# beyond the index itself.
+# An entry is trusted as long as the modification times of its folder and its info file did not change:
+# adding, removing or renaming files changes the former, editing the info file in place changes the latter.
+# Stale entries are rebuilt one by one, and the index is written back only when something changed.
+# Packages mounted in place, see `unspoken.archive`, are themes too: their file name stands for the folder,
+# and their entries are rebuilt when the package file changes.
+# This module has no dependency on NVDA.
+
+import json
+import os
+import threading
+from .unspoken.archive import PACKAGE_EXTENSION, ThemeArchive, ThemeArchiveError
+
+INDEX_FILE_NAME = "__index__.json"
+# Bump this when the layout of the index changes, older indexes are then rebuilt.
+INDEX_VERSION = 2
+
+
+class ThemeIndex(object):
+    def __init__(self, home, info_file_name):
+        self.home = home
+        self.info_file_name = info_file_name
+        self.path = os.path.join(home, INDEX_FILE_NAME)
+        # folder -> entry, None until first use.
+        self._entries = None
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or (data.get("version") != INDEX_VERSION):
+            return {}
+        return data.get("themes", {})
+
+    def save(self):
+        """Write the index back if it changed, a failure only costs the next startup a rescan."""
+        with self._lock:
+            if not self._dirty:
+                return
+            temp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            try:
+                with open(temp_path, "w", encoding="utf8") as f:
+                    json.dump({"version": INDEX_VERSION, "themes": self._entries}, f)
+                os.replace(temp_path, self.path)
+            except OSError:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                return
+            self._dirty = False
+
+    def _stamps(self, folder):
+        """Return the modification times of `folder` and of its info file, or None if it is not a theme."""
+        directory = os.path.join(self.home, folder)
+        try:
+            if folder.endswith(PACKAGE_EXTENSION):
+                stat = os.stat(directory)
+                return stat.st_mtime_ns, stat.st_size
+            return (
+                os.stat(directory).st_mtime_ns,
+                os.stat(os.path.join(directory, self.info_file_name)).st_mtime_ns,
+            )
+        except OSError:
+            return None
+
+    def _build_mounted(self, folder, stamps):
+        archive = ThemeArchive(os.path.join(self.home, folder))
+        try:
+            info = archive.info(self.info_file_name)
+        finally:
+            archive.close()
+        return {"mtime": stamps[0], "info_mtime": stamps[1], "info": info}
+
+    def _build(self, folder, stamps):
+        if folder.endswith(PACKAGE_EXTENSION):
+            return self._build_mounted(folder, stamps)
+        directory = os.path.join(self.home, folder)
+        with open(
+            os.path.join(directory, self.info_file_name), "r", encoding="utf8"
+        ) as f:
+            info = json.load(f)
+        return {"mtime": stamps[0], "info_mtime": stamps[1], "info": info}
+
+    def _entry(self, folder):
+        if self._entries is None:
+            self._entries = self._load()
+        entry = self._entries.get(folder)
+        stamps = self._stamps(folder)
+        if stamps is None:
+            if entry is not None:
+                del self._entries[folder]
+                self._dirty = True
+            return None
+        if (entry is None) or ((entry["mtime"], entry["info_mtime"]) != stamps):
+            try:
+                entry = self._build(folder, stamps)
+            except (OSError, ValueError, ThemeArchiveError):
+                # Removed meanwhile, or a broken info file, it is looked at again next time.
+                self._entries.pop(folder, None)
+                self._dirty = True
+                return None
+            self._entries[folder] = entry
+            self._dirty = True
+        return entry
+
+    def get(self, folder):
+        """Return the entry of `folder`, a dict with its `info`, or None if it is not a theme."""
+        with self._lock:
+            entry = self._entry(folder)
+            self.save()
+            return entry
+
+    def entries(self):
+        """Return a (folder, entry) pair for every installed theme."""
+        with self._lock:
+            with os.scandir(self.home) as it:
+                folders = [
+                    entry.name
+                    for entry in it
+                    if entry.is_dir()
+                    or (entry.name.endswith(PACKAGE_EXTENSION) and entry.is_file())
+                ]
+            if self._entries is None:
+                self._entries = self._load()
+            for folder in set(self._entries).difference(folders):
+                del self._entries[folder]
+                self._dirty = True
+            result = []
+            for folder in folders:
+                entry = self._entry(folder)
+                if entry is not None:
+                    result.append((folder, entry))
+            self.save()
+            return result
+
+    def invalidate(self, folder=None):
+        """Forget `folder`, or every folder, so it is read again on next use."""
+        with self._lock:
+            if self._entries is None:
+                return
+            if folder is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(folder, None)
+            self._dirty = True
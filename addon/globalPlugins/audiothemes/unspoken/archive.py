@@ -0,0 +1,172 @@
+# coding: utf-8
+
+# Version 1 theme packages read in place, without extracting them.
+# A package is a zip file holding the sound files and the info file of a theme,
+# either at its root or, in legacy packages, inside a single folder named after the theme.
+# Stored members are served straight from a read-only mapping of the package, at their offset in the zip,
+# deflated ones are inflated when they are read, so nothing is decompressed before a sound is needed.
+# The package is opened on first read and can be closed at any time, it is opened again when needed.
+# This module has no dependency on NVDA.
+
+import json
+import mmap
+import os
+import shutil
+import struct
+import threading
+from zipfile import ZipFile, ZipInfo, BadZipFile, ZIP_STORED, ZIP_DEFLATED
+
+PACKAGE_EXTENSION = ".atp"
+_CHUNK_SIZE = 1024 * 1024
+# signature, version, flags, compression, time, date, crc, sizes, name and extra field lengths
+_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+class ThemeArchiveError(Exception):
+    """Raised when a package can not be read in place."""
+
+
+class ThemeArchive(object):
+    """A version 1 theme package opened for reading, its members are addressed by file name."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        # The folder name of legacy packages, None otherwise.
+        self.theme_name = None
+        # file name -> ZipInfo
+        self.members = {}
+        self._zip = None
+        self._mapping = None
+        self._lock = threading.Lock()
+        try:
+            with ZipFile(filename, "r") as pack:
+                members = pack.infolist()
+        except (OSError, BadZipFile) as e:
+            raise ThemeArchiveError(f"{filename}: {e}") from e
+        if members and members[0].is_dir():
+            self.theme_name = members[0].orig_filename.strip("/")
+            members = members[1:]
+        for member in members:
+            if member.is_dir():
+                continue
+            name = member.filename.rsplit("/", 1)[-1]
+            if (self.theme_name is None) and (name != member.filename):
+                # Only the root of a plain package belongs to the theme.
+                continue
+            self.members[name] = member
+
+    @property
+    def names(self):
+        return list(self.members)
+
+    def info(self, info_file_name):
+        """Return the parsed info file of the theme."""
+        try:
+            with self.read(info_file_name) as data:
+                info = json.loads(bytes(data).decode("utf8"))
+        except ValueError as e:
+            raise ThemeArchiveError(f"{self.filename}: {e}") from e
+        if self.theme_name is not None:
+            info.setdefault("name", self.theme_name)
+        return info
+
+    def _open(self):
+        if self._zip is None:
+            try:
+                self._zip = ZipFile(self.filename, "r")
+                with open(self.filename, "rb") as f:
+                    self._mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError, BadZipFile) as e:
+                self._close()
+                raise ThemeArchiveError(f"{self.filename}: {e}") from e
+
+    def read(self, name):
+        """Return the content of member `name` as a memoryview, release it once done."""
+        try:
+            member = self.members[name]
+        except KeyError:
+            raise ThemeArchiveError(f"{self.filename}: no member named {name}")
+        if member.flag_bits & 0x1:
+            raise ThemeArchiveError(f"{self.filename}: {name} is encrypted")
+        with self._lock:
+            self._open()
+            if member.compress_type != ZIP_STORED:
+                pack = self._zip
+            else:
+                return self._stored(member)
+        # Inflating releases the GIL, and ZipFile serializes reads itself.
+        try:
+            return memoryview(pack.read(member))
+        except (OSError, ValueError, BadZipFile) as e:
+            raise ThemeArchiveError(f"{self.filename}: {e}") from e
+
+    def _stored(self, member):
+        mapping = self._mapping
+        offset = member.header_offset
+        if offset + _LOCAL_HEADER.size > len(mapping):
+            raise ThemeArchiveError(f"{self.filename}: {member.filename} is truncated")
+        header = _LOCAL_HEADER.unpack_from(mapping, offset)
+        if header[0] != _LOCAL_HEADER_SIGNATURE:
+            raise ThemeArchiveError(
+                f"{self.filename}: bad header for {member.filename}"
+            )
+        start = offset + _LOCAL_HEADER.size + header[9] + header[10]
+        if start + member.file_size > len(mapping):
+            raise ThemeArchiveError(f"{self.filename}: {member.filename} is truncated")
+        return memoryview(mapping)[start : start + member.file_size]
+
+    def _close(self):
+        if self._mapping is not None:
+            try:
+                self._mapping.close()
+            except BufferError:
+                # A member is still being read, the mapping goes away with it.
+                pass
+            self._mapping = None
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+    def close(self):
+        """Release the package file until the next read."""
+        with self._lock:
+            self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_info(filename, info_file_name, info):
+    """Replace the info file of the package `filename`, which must not be open.
+
+    The package is written again, its other members keep their compression.
+    """
+    archive = ThemeArchive(filename)
+    if archive.theme_name is not None:
+        info_file_name = f"{archive.theme_name}/{info_file_name}"
+    temp_path = f"{filename}.tmp"
+    try:
+        with ZipFile(filename, "r") as source, ZipFile(temp_path, "w") as target:
+            for member in source.infolist():
+                if member.filename == info_file_name:
+                    continue
+                copied = ZipInfo(member.filename, member.date_time)
+                copied.compress_type = member.compress_type
+                copied.external_attr = member.external_attr
+                if member.is_dir():
+                    target.writestr(copied, b"")
+                    continue
+                with source.open(member) as reader, target.open(copied, "w") as writer:
+                    shutil.copyfileobj(reader, writer, _CHUNK_SIZE)
+            target.writestr(info_file_name, json.dumps(info), ZIP_DEFLATED)
+        os.replace(temp_path, filename)
+    except (OSError, BadZipFile) as e:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise ThemeArchiveError(f"{filename}: {e}") from e
@@ -0,0 +1,191 @@
+# coding: utf-8
+
+# The audio engines UnspokenPlayer can render through.
+# A backend plays sounds at angles through a pool of voices,
+# and mixes whatever is playing into blocks of interleaved float samples on request.
+# The mixer converts those blocks to 16-bit PCM and feeds them to nvwave.
+# Backends are imported when first selected, so one that needs native libraries costs nothing otherwise.
+
+import importlib
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any
+from ..compact import StoragePolicy, compact
+from ..decoder import decode
+
+
+@dataclass(eq=False)
+class Sound:
+    """A decoded sound, ready to be played by a voice."""
+
+    # Whatever the backend decoded the sound into.
+    buffer: Any
+    path: str
+    duration: float
+    # Bytes held by the buffer, 0 when the backend can not tell.
+    nbytes: int = 0
+    # Returns the samples again as a `decoder.DecodedSound`, for sounds that have no file of their own.
+    source: Any = None
+
+
+class StealPolicy(Enum):
+    # Cut the voice that started first.
+    oldest = "oldest"
+    # Cut the voice with the lowest gain times the fraction of its sound left to play.
+    quietest = "quietest"
+    # Cut the voice with the lowest priority, oldest first among equals.
+    # A sound is dropped rather than cutting a voice of higher priority.
+    lowest_priority = "lowest_priority"
+
+
+def choose_voice(voices, policy, priority, now):
+    """Pick the voice a new sound should play on, or None if it should be dropped.
+
+    Voices need `is_playing(now)`, `loudness(now)`, `started_at`, `ends_at` and `priority`.
+    A free voice is always preferred, otherwise one is stolen according to `policy`.
+    """
+    free = [voice for voice in voices if not voice.is_playing(now)]
+    if free:
+        return min(free, key=lambda voice: voice.ends_at)
+    if policy is StealPolicy.quietest:
+        return min(voices, key=lambda voice: (voice.loudness(now), voice.started_at))
+    if policy is StealPolicy.lowest_priority:
+        victim = min(voices, key=lambda voice: (voice.priority, voice.started_at))
+        return victim if victim.priority <= priority else None
+    return min(voices, key=lambda voice: voice.started_at)
+
+
+class AudioBackend(object):
+    """Base class for audio engines.
+
+    Subclasses override the methods that raise NotImplementedError.
+    """
+
+    # The name used to select this backend in the configuration.
+    name = None
+    channels = 2
+    # False for backends that produce no sound, the player then starts no mixer.
+    needs_output = True
+
+    def __init__(
+        self,
+        sample_rate=44100,
+        block_size=1024,
+        voices=4,
+        voice_stealing=StealPolicy.oldest,
+        clock=time.time,
+    ):
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        # Offline rendering runs faster than real time and passes its own clock.
+        self.clock = clock
+        # Called when a sound starts, and when the last playing sound has ended.
+        self.on_start = None
+        self.on_idle = None
+        # A `pcmcache.PCMCache` of decoded sounds, used by `decode` when set.
+        self.pcm_cache = None
+        # How decoded sounds are stored, see `compact`.
+        self.storage = StoragePolicy()
+
+    @property
+    def storage_variant(self):
+        return self.storage.variant(self.sample_rate)
+
+    def compact(self, decoded):
+        """Apply the storage policy to a `decoder.DecodedSound`."""
+        return compact(decoded, self.storage, self.sample_rate)
+
+    def decode(self, filename):
+        """Decode `filename` into a `decoder.DecodedSound`, through the PCM cache if there is one.
+
+        The storage policy is applied before the samples are cached.
+        """
+        if self.pcm_cache is not None:
+            return self.pcm_cache.load(filename, self.storage_variant, self.compact)
+        return self.compact(decode(filename))
+
+    def _started(self):
+        if self.on_start is not None:
+            self.on_start()
+
+    def _stopped(self):
+        if self.on_idle is not None:
+            self.on_idle()
+
+    def load_sound(self, filename):
+        """Decode `filename` into a `Sound`."""
+        raise NotImplementedError
+
+    def load_decoded(self, filename, decoded):
+        """Make a `Sound` out of a `decoder.DecodedSound`, decoded elsewhere."""
+        raise NotImplementedError
+
+    def sound_size(self, sound):
+        """How many bytes of memory `sound` holds, estimated if the backend did not say."""
+        if sound.nbytes:
+            return sound.nbytes
+        return int(sound.duration * self.sample_rate) * self.channels * 4
+
+    def play(self, sound, azimuth, elevation, gain, priority=0):
+        """Play `sound` at the given angles, in degrees.
+
+        Pass None as the azimuth for sounds that need no panning.
+        Returns a voice that can be passed to `set_gain` and `stop`, or None if the sound was dropped.
+        """
+        raise NotImplementedError
+
+    def play_preview(self, sound, gain=1.0):
+        """Play `sound` without panning, cutting the previous preview."""
+        raise NotImplementedError
+
+    def set_gain(self, voice, gain):
+        raise NotImplementedError
+
+    def stop(self, voice=None):
+        """Stop `voice`, or every voice if it is None."""
+        raise NotImplementedError
+
+    def configure_voices(self, voices, voice_stealing):
+        raise NotImplementedError
+
+    def render_block(self):
+        """Mix the next `block_size` frames.
+
+        Returns a memoryview of float samples that is only valid until the next call.
+        """
+        raise NotImplementedError
+
+    def configure_binaural_cache(self, enabled, max_bytes):
+        """Backends without an HRTF have nothing to pre-render."""
+
+    def prefetch(self, sounds):
+        """Called with every sound of a theme once it is loaded."""
+
+    def invalidate(self, sounds):
+        """Called with the sounds of the active theme reloaded because their files changed."""
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+# Backend name -> (module, class name)
+BACKENDS = {
+    "libaudioverse": (".lav", "LibaudioverseBackend"),
+    "numpy": (".software", "SoftwareBackend"),
+    "null": (".headless", "NullBackend"),
+    "recording": (".headless", "RecordingBackend"),
+}
+
+
+def create_backend(name, **kwargs):
+    """Import the backend registered as `name` and create it with `kwargs`."""
+    try:
+        module_name, class_name = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown audio backend: {name}")
+    module = importlib.import_module(module_name, __name__)
+    return getattr(module, class_name)(**kwargs)
@@ -0,0 +1,97 @@
+# coding: utf-8
+
+# Backends that make no sound, for load testing and benchmarks without an audio device.
+# The null backend accepts everything and does nothing,
+# so what is left to measure is the cost of getting from an NVDA event to the backend.
+# The recording backend additionally keeps every play command for inspection.
+
+import collections
+import time
+from typing import NamedTuple, Optional
+from . import AudioBackend, Sound, StealPolicy
+
+
+class NullBackend(AudioBackend):
+    name = "null"
+    needs_output = False
+
+    def __init__(
+        self,
+        sample_rate=44100,
+        block_size=1024,
+        voices=4,
+        voice_stealing=StealPolicy.oldest,
+        clock=time.time,
+    ):
+        super().__init__(sample_rate, block_size, clock=clock)
+        self._block_view = memoryview(bytearray(block_size * self.channels * 4)).cast(
+            "f"
+        )
+
+    def load_sound(self, filename):
+        # Nothing is decoded, so nothing has a length either.
+        return Sound(buffer=None, path=filename, duration=0.0)
+
+    def load_decoded(self, filename, decoded):
+        return Sound(buffer=None, path=filename, duration=decoded.duration)
+
+    def play(self, sound, azimuth, elevation, gain, priority=0):
+        return True
+
+    def play_preview(self, sound, gain=1.0):
+        return True
+
+    def set_gain(self, voice, gain):
+        pass
+
+    def stop(self, voice=None):
+        pass
+
+    def configure_voices(self, voices, voice_stealing):
+        pass
+
+    def render_block(self):
+        return self._block_view
+
+
+class PlayRecord(NamedTuple):
+    # From the backend's clock.
+    timestamp: float
+    # The path of the sound file.
+    sound: str
+    # None for sounds played without panning, previews included.
+    azimuth: Optional[float]
+    elevation: float
+    gain: float
+    priority: int
+
+
+class RecordingBackend(NullBackend):
+    name = "recording"
+
+    # Plenty for a load test, while keeping memory bounded if it is left on.
+    max_records = 100000
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.records = collections.deque(maxlen=self.max_records)
+        self.plays = 0
+
+    def play(self, sound, azimuth, elevation, gain, priority=0):
+        record = PlayRecord(
+            self.clock(), sound.path, azimuth, elevation, gain, priority
+        )
+        # deque.append is atomic, events may arrive from several threads.
+        self.records.append(record)
+        self.plays += 1
+        return record
+
+    def play_preview(self, sound, gain=1.0):
+        return self.play(sound, None, 0.0, gain)
+
+    def clear(self):
+        self.records.clear()
+        self.plays = 0
+
+    def stats(self):
+        return {"plays": self.plays, "records": len(self.records)}
@@ -0,0 +1,144 @@
+# coding: utf-8
+
+# The original Unspoken engine: every voice goes through an HRTF panner inside a Libaudioverse simulation.
+# Windows only, it needs the Libaudioverse and libsndfile DLLs.
+
+import os
+import time
+import ctypes
+from . import AudioBackend, Sound, StealPolicy
+from ..decoder import DecodeError
+
+# this is a hack.
+# Normally, we would modify Libaudioverse to know about Unspoken and NVDA.
+# But if Windows sees a DLL is already loaded, it doesn't reload it.
+# To that end, we grab the DLLs out of the Libaudioverse directory here.
+# order is important.
+libaudioverse_directory = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "libaudioverse"
+)
+dll_hack = [
+    ctypes.cdll.LoadLibrary(os.path.join(libaudioverse_directory, "libsndfile-1.dll"))
+]
+dll_hack.append(
+    ctypes.cdll.LoadLibrary(os.path.join(libaudioverse_directory, "libaudioverse.dll"))
+)
+
+from .. import libaudioverse
+
+libaudioverse.initialize()
+from ..voices import VoicePool
+from ..binaural import BinauralCache
+
+
+class LibaudioverseBackend(AudioBackend):
+    name = "libaudioverse"
+
+    def __init__(
+        self,
+        sample_rate=44100,
+        block_size=1024,
+        voices=4,
+        voice_stealing=StealPolicy.oldest,
+        clock=time.time,
+    ):
+        super().__init__(sample_rate, block_size, clock=clock)
+        self.simulation = libaudioverse.Simulation(
+            sample_rate=sample_rate, block_size=block_size
+        )
+        self.voice_pool = VoicePool(
+            self.simulation,
+            voices,
+            voice_stealing,
+            on_start=self._started,
+            on_idle=self._stopped,
+            clock=self.clock,
+        )
+        # Off unless enabled by the user, see configure_binaural_cache.
+        self.binaural_cache = None
+        # Libaudioverse renders into this buffer over and over again.
+        self._render_buffer = (ctypes.c_float * (block_size * self.channels))()
+
+    def load_sound(self, filename):
+        if (self.pcm_cache is not None) or self.storage:
+            try:
+                return self.load_decoded(filename, self.decode(filename))
+            except DecodeError:
+                pass
+        buffer = libaudioverse.Buffer(self.simulation)
+        buffer.load_from_file(filename)
+        return Sound(buffer=buffer, path=filename, duration=buffer.get_duration())
+
+    def load_decoded(self, filename, decoded):
+        buffer = libaudioverse.Buffer(self.simulation)
+        # Libaudioverse copies the samples, a mapping can go right after.
+        buffer.load_from_array(
+            decoded.sample_rate, decoded.channels, decoded.frames, decoded.samples
+        )
+        return Sound(
+            buffer=buffer,
+            path=filename,
+            duration=buffer.get_duration(),
+            nbytes=buffer.get_length_in_samples() * decoded.channels * 4,
+        )
+
+    def play(self, sound, azimuth, elevation, gain, priority=0):
+        if (azimuth is not None) and (self.binaural_cache is not None):
+            stereo_sound = self.binaural_cache.lookup(sound, azimuth, elevation)
+            if stereo_sound is not None:
+                # Already spatialized, it skips the HRTF.
+                return self.voice_pool.play(stereo_sound, None, 0.0, gain, priority)
+        return self.voice_pool.play(sound, azimuth, elevation, gain, priority)
+
+    def play_preview(self, sound, gain=1.0):
+        return self.voice_pool.play_preview(sound, gain)
+
+    def set_gain(self, voice, gain):
+        self.voice_pool.set_gain(voice, gain)
+
+    def stop(self, voice=None):
+        if voice is None:
+            self.voice_pool.stop_all()
+        else:
+            self.voice_pool.stop(voice)
+
+    def configure_voices(self, voices, voice_stealing):
+        self.voice_pool.policy = voice_stealing
+        self.voice_pool.resize(voices)
+
+    def render_block(self):
+        return self.simulation.get_block_into(self._render_buffer, self.channels)
+
+    def configure_binaural_cache(self, enabled, max_bytes):
+        if not enabled:
+            if self.binaural_cache is not None:
+                self.binaural_cache.clear()
+            self.binaural_cache = None
+            return
+        if self.binaural_cache is None:
+            self.binaural_cache = BinauralCache(self.simulation, max_bytes)
+        self.binaural_cache.max_bytes = max_bytes
+
+    def prefetch(self, sounds):
+        if self.binaural_cache is not None:
+            # Drop renderings of the previous theme, then render the new one in the background.
+            self.binaural_cache.clear()
+            self.binaural_cache.prefetch(list(sounds))
+
+    def invalidate(self, sounds):
+        if self.binaural_cache is not None:
+            # Only these sounds are rendered again, the rest of the theme is kept.
+            sounds = list(sounds)
+            self.binaural_cache.invalidate(sounds)
+            self.binaural_cache.prefetch(sounds)
+
+    def stats(self):
+        stats = self.voice_pool.stats()
+        if self.binaural_cache is not None:
+            stats["binaural_cache"] = self.binaural_cache.stats()
+        return stats
+
+    def close(self):
+        self.voice_pool.stop_all()
+        for _dll in dll_hack:
+            ctypes.windll.kernel32.FreeLibrary(_dll._handle)
@@ -0,0 +1,205 @@
+# coding: utf-8
+
+# A software renderer written with NumPy, for machines where Libaudioverse can not load.
+# Sounds are decoded by `decoder` into float32 arrays at the backend's sample rate.
+# Instead of an HRTF, each voice is panned with a constant-power law,
+# and sounds below ear level go through a short lowpass, the lower the duller.
+# Every per-sample operation is vectorized, the Python loop only runs once per voice and block.
+
+import math
+import threading
+import time
+import numpy
+from .. import clamp
+from ..compact import resample
+from . import AudioBackend, Sound, StealPolicy, choose_voice
+
+# How much of the lowpass a sound gets at the bottom of the audio display.
+MAX_ELEVATION_DAMPING = 0.5
+# Elevation, in degrees below ear level, at which the damping is at its maximum.
+ELEVATION_DAMPING_RANGE = 45.0
+
+
+def pan_gains(azimuth):
+    """Constant-power (left, right) gains for an azimuth in degrees, -90 being hard left."""
+    angle = (clamp(azimuth, -90.0, 90.0) + 90.0) / 180.0 * (math.pi / 2)
+    return numpy.array((math.cos(angle), math.sin(angle)), dtype=numpy.float32)
+
+
+def elevation_damping(elevation):
+    return clamp(-elevation / ELEVATION_DAMPING_RANGE, 0.0, 1.0) * MAX_ELEVATION_DAMPING
+
+
+class SoftwareVoice(object):
+    def __init__(self):
+        self.sound = None
+        self.position = 0
+        self.started_at = 0.0
+        self.ends_at = 0.0
+        self.gain = 0.0
+        self.priority = 0
+        self.pan = numpy.ones(2, dtype=numpy.float32)
+        self.gains = self.pan
+        self.downmix = False
+        self.damping = 0.0
+        # The last two input frames, the lowpass needs them at the start of the next block.
+        self.history = None
+
+    def is_playing(self, now):
+        return self.sound is not None
+
+    def loudness(self, now):
+        if self.sound is None:
+            return 0.0
+        frames = self.sound.buffer.shape[0]
+        return self.gain * (frames - self.position) / frames
+
+    def start(self, now, sound, gain, priority, azimuth=None, elevation=0.0):
+        """Start playing `sound`, panned unless `azimuth` is None."""
+        channels = sound.buffer.shape[1]
+        if azimuth is None:
+            self.pan = numpy.ones(2, dtype=numpy.float32)
+            self.downmix = False
+            self.damping = 0.0
+        else:
+            self.pan = pan_gains(azimuth)
+            self.downmix = channels > 1
+            self.damping = elevation_damping(elevation)
+            channels = 1
+        self.history = numpy.zeros((2, channels), dtype=numpy.float32)
+        self.sound = sound
+        self.position = 0
+        self.started_at = now
+        self.ends_at = now + sound.duration
+        self.priority = priority
+        self.set_gain(gain)
+
+    def set_gain(self, gain):
+        self.gain = gain
+        self.gains = self.pan * numpy.float32(gain)
+
+    def stop(self):
+        self.sound = None
+        self.ends_at = 0.0
+
+    def mix_into(self, block):
+        """Add the next frames of this voice to `block`, shaped (frames, 2)."""
+        samples = self.sound.buffer
+        count = min(block.shape[0], samples.shape[0] - self.position)
+        segment = samples[self.position : self.position + count]
+        if self.downmix:
+            segment = segment.mean(axis=1, keepdims=True)
+        if self.damping:
+            # y[n] = d/2 x[n] + (1 - d) x[n-1] + d/2 x[n-2]
+            padded = numpy.concatenate((self.history, segment))
+            self.history = padded[-2:]
+            damping = self.damping
+            segment = (damping / 2) * (padded[2:] + padded[:-2]) + (
+                1 - damping
+            ) * padded[1:-1]
+        # Mono segments are broadcast to both channels.
+        block[:count] += segment * self.gains
+        self.position += count
+        if self.position >= samples.shape[0]:
+            self.stop()
+
+
+class SoftwareBackend(AudioBackend):
+    name = "numpy"
+
+    def __init__(
+        self,
+        sample_rate=44100,
+        block_size=1024,
+        voices=4,
+        voice_stealing=StealPolicy.oldest,
+        clock=time.time,
+    ):
+        super().__init__(sample_rate, block_size, clock=clock)
+        self._lock = threading.Lock()
+        self.voices = []
+        self.preview_voice = SoftwareVoice()
+        self.steals = 0
+        self.drops = 0
+        self.configure_voices(voices, voice_stealing)
+        self._block = numpy.zeros((block_size, self.channels), dtype=numpy.float32)
+        self._block_view = memoryview(self._block.reshape(-1))
+
+    def load_sound(self, filename):
+        return self.load_decoded(filename, self.decode(filename))
+
+    def load_decoded(self, filename, decoded):
+        samples = numpy.frombuffer(decoded.samples, dtype=numpy.float32)
+        samples = samples.reshape(-1, decoded.channels)[:, : self.channels]
+        samples = resample(samples, decoded.sample_rate, self.sample_rate)
+        samples = numpy.ascontiguousarray(samples)
+        return Sound(
+            buffer=samples,
+            path=filename,
+            duration=samples.shape[0] / self.sample_rate,
+            nbytes=samples.nbytes,
+        )
+
+    def _all_voices(self):
+        return self.voices + [self.preview_voice]
+
+    def play(self, sound, azimuth, elevation, gain, priority=0):
+        with self._lock:
+            now = self.clock()
+            voice = choose_voice(self.voices, self.policy, priority, now)
+            if voice is None:
+                self.drops += 1
+                return None
+            if voice.is_playing(now):
+                self.steals += 1
+            voice.start(now, sound, gain, priority, azimuth, elevation)
+            self._started()
+        return voice
+
+    def play_preview(self, sound, gain=1.0):
+        with self._lock:
+            self.preview_voice.start(self.clock(), sound, gain, priority=0)
+            self._started()
+        return self.preview_voice
+
+    def set_gain(self, voice, gain):
+        with self._lock:
+            voice.set_gain(gain)
+
+    def stop(self, voice=None):
+        with self._lock:
+            for each in self._all_voices() if voice is None else [voice]:
+                each.stop()
+            if not self._any_playing():
+                self._stopped()
+
+    def _any_playing(self):
+        return any(voice.sound is not None for voice in self._all_voices())
+
+    def configure_voices(self, voices, voice_stealing):
+        with self._lock:
+            self.policy = voice_stealing
+            voices = max(voices, 1)
+            while len(self.voices) < voices:
+                self.voices.append(SoftwareVoice())
+            del self.voices[voices:]
+
+    def render_block(self):
+        block = self._block
+        block.fill(0.0)
+        with self._lock:
+            playing = [voice for voice in self._all_voices() if voice.sound is not None]
+            for voice in playing:
+                voice.mix_into(block)
+            if playing and not self._any_playing():
+                self._stopped()
+        return self._block_view
+
+    def stats(self):
+        now = self.clock()
+        return {
+            "voices": len(self.voices),
+            "active": sum(voice.is_playing(now) for voice in self._all_voices()),
+            "steals": self.steals,
+            "drops": self.drops,
+        }
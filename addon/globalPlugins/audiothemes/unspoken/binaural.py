@@ -0,0 +1,246 @@
+# coding: utf-8
+
+# A cache of theme sounds pre-rendered through the HRTF.
+# The audio display is cut into a grid of (azimuth, elevation) cells.
+# Each sound is rendered once per cell, in a background thread with a simulation of its own,
+# and stored as a stereo buffer in the playing simulation.
+# A cache hit plays that buffer directly, so no convolution happens while playing.
+# On a miss the caller falls back to the live HRTF and the cell is rendered for next time.
+# A sound reloaded from a changed file has its renderings dropped by `invalidate`, the others are kept.
+
+import math
+import queue
+import threading
+import ctypes
+from array import array
+from collections import OrderedDict
+from . import (
+    libaudioverse,
+    DISPLAY_WIDTH,
+    DISPLAY_HEIGHT_MIN,
+    DISPLAY_HEIGHT_MAGNITUDE,
+)
+from .backends import Sound
+from logHandler import log
+
+
+def _steps(start, stop, step):
+    count = int(math.floor((stop - start) / step))
+    return [start + i * step for i in range(count + 1)] + [stop]
+
+
+class BinauralCache(object):
+    """Stereo renderings of sounds, keyed by sound path and grid cell, capped at `max_bytes`."""
+
+    def __init__(
+        self,
+        simulation,
+        max_bytes=32 * 1024 * 1024,
+        azimuth_step=10.0,
+        elevation_step=10.0,
+        block_size=1024,
+    ):
+        self.simulation = simulation
+        self.max_bytes = max_bytes
+        self.azimuth_step = azimuth_step
+        self.elevation_step = elevation_step
+        self.block_size = block_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # (path, azimuth, elevation) -> (Sound, size in bytes), least recently used first.
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._jobs = queue.Queue()
+        self._pending = set()
+        # Bumped by clear so that jobs queued for a previous theme are dropped.
+        self._generation = 0
+        # path -> bumped by invalidate, so that jobs queued for the previous content of a file are dropped.
+        self._epochs = {}
+        self._render_thread = threading.Thread(target=self._render_func)
+        self._render_thread.daemon = True
+        self._render_thread.start()
+
+    def quantize(self, azimuth, elevation):
+        return (
+            round(azimuth / self.azimuth_step) * self.azimuth_step,
+            round(elevation / self.elevation_step) * self.elevation_step,
+        )
+
+    def grid(self):
+        """Every cell of the audio display, the ones closest to its center first."""
+        azimuths = {
+            self.quantize(azimuth, 0)[0]
+            for azimuth in _steps(
+                -DISPLAY_WIDTH / 2, DISPLAY_WIDTH / 2, self.azimuth_step
+            )
+        }
+        elevations = {
+            self.quantize(0, elevation)[1]
+            for elevation in _steps(
+                DISPLAY_HEIGHT_MIN,
+                DISPLAY_HEIGHT_MIN + DISPLAY_HEIGHT_MAGNITUDE,
+                self.elevation_step,
+            )
+        }
+        center_elevation = DISPLAY_HEIGHT_MIN + DISPLAY_HEIGHT_MAGNITUDE / 2
+        cells = [
+            (azimuth, elevation)
+            for azimuth in azimuths
+            for elevation in elevations
+            if -90.0 <= azimuth <= 90.0
+        ]
+        return sorted(
+            cells, key=lambda cell: (abs(cell[0]), abs(cell[1] - center_elevation))
+        )
+
+    def lookup(self, sound, azimuth, elevation):
+        """Return the pre-rendered stereo Sound for this position, or None.
+
+        A miss queues the cell for rendering.
+        """
+        key = (sound.path,) + self.quantize(azimuth, elevation)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        self._submit(sound, key, prefetch=False)
+
+    def prefetch(self, sounds):
+        """Render every sound in every cell in the background, until the cache is full."""
+        for az, el in self.grid():
+            for sound in sounds:
+                self._submit(sound, (sound.path, az, el), prefetch=True)
+
+    def _submit(self, sound, key, prefetch):
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            epoch = self._epochs.get(sound.path, 0)
+            self._jobs.put((self._generation, epoch, sound, key, prefetch))
+
+    def _is_current(self, generation, epoch, path):
+        return (generation == self._generation) and (epoch == self._epochs.get(path, 0))
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._epochs.clear()
+            self._entries.clear()
+            self._pending.clear()
+            self.size = 0
+
+    def invalidate(self, sounds):
+        """Drop the renderings of `sounds`, whose files changed, and keep every other one."""
+        paths = {sound.path for sound in sounds}
+        with self._lock:
+            for path in paths:
+                self._epochs[path] = self._epochs.get(path, 0) + 1
+            for key in [key for key in self._entries if key[0] in paths]:
+                stereo_sound, nbytes = self._entries.pop(key)
+                self.size -= nbytes
+            self._pending = {key for key in self._pending if key[0] not in paths}
+
+    def _store(self, generation, epoch, key, stereo_sound, nbytes, prefetch):
+        with self._lock:
+            if not self._is_current(generation, epoch, key[0]):
+                # Queued again since, with the current content, if it is still wanted.
+                return
+            self._pending.discard(key)
+            if prefetch and (self.size + nbytes > self.max_bytes):
+                # Prefetching never evicts, it would only churn the cache.
+                return
+            self._entries[key] = (stereo_sound, nbytes)
+            self.size += nbytes
+            while (self.size > self.max_bytes) and (len(self._entries) > 1):
+                evicted_key, (evicted, evicted_bytes) = self._entries.popitem(
+                    last=False
+                )
+                self.size -= evicted_bytes
+                self.evictions += 1
+
+    def _render_func(self):
+        render_sim = libaudioverse.Simulation(block_size=self.block_size)
+        node = libaudioverse.BufferNode(render_sim)
+        panner = libaudioverse.HrtfNode(render_sim, "default")
+        panner.should_crossfade = False
+        node.connect(0, panner, 0)
+        panner.connect_simulation(0)
+        render_buffer = (ctypes.c_float * (self.block_size * 2))()
+        sample_rate = render_sim.sample_rate
+        # Buffers can not move between simulations, so sources are loaded again in ours.
+        # path -> (epoch, Buffer)
+        sources = {}
+        sources_generation = self._generation
+        while True:
+            generation, epoch, sound, key, prefetch = self._jobs.get()
+            if not self._is_current(generation, epoch, sound.path):
+                continue
+            if generation != sources_generation:
+                sources.clear()
+                sources_generation = generation
+            if prefetch and (self.size >= self.max_bytes):
+                with self._lock:
+                    self._pending.discard(key)
+                continue
+            try:
+                loaded_epoch, source = sources.get(sound.path, (None, None))
+                if loaded_epoch != epoch:
+                    # Not loaded yet, or its file changed since.
+                    source = libaudioverse.Buffer(render_sim)
+                    sources[sound.path] = (epoch, source)
+                    if sound.source is None:
+                        source.load_from_file(sound.path)
+                    else:
+                        decoded = sound.source()
+                        source.load_from_array(
+                            decoded.sample_rate,
+                            decoded.channels,
+                            decoded.frames,
+                            decoded.samples,
+                        )
+                panner.reset()
+                panner.azimuth, panner.elevation = key[1], key[2]
+                node.buffer = source
+                samples = array("f")
+                # Render one extra block for the tail of the HRTF.
+                frames = int(math.ceil(sound.duration * sample_rate)) + self.block_size
+                for i in range(int(math.ceil(frames / self.block_size))):
+                    samples.frombytes(render_sim.get_block_into(render_buffer, 2))
+                buffer = libaudioverse.Buffer(self.simulation)
+                buffer.load_from_array(sample_rate, 2, len(samples) // 2, samples)
+                stereo_sound = Sound(
+                    buffer=buffer,
+                    path=sound.path,
+                    duration=len(samples) / 2 / sample_rate,
+                )
+                self._store(
+                    generation,
+                    epoch,
+                    key,
+                    stereo_sound,
+                    samples.itemsize * len(samples),
+                    prefetch,
+                )
+            except Exception:
+                # The file was removed or the package closed meanwhile, the next jobs still run.
+                log.exception(f"Could not render {sound.path} at {key[1:]}")
+                sources.pop(sound.path, None)
+                with self._lock:
+                    self._pending.discard(key)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,130 @@
+# coding: utf-8
+
+# Storage policies for decoded theme sounds.
+# Theme sounds are often shipped as long stereo files at 48 kHz or more,
+# while the HRTF pans a single channel and the simulation runs at its own rate.
+# A policy can downmix sounds to mono, resample them to the simulation rate,
+# and drop the trailing silence many sound editors leave behind,
+# before they are handed to the audio backend.
+# NumPy is used when it is importable, otherwise every step falls back to plain Python.
+# This module has no dependency on NVDA.
+
+from array import array
+from dataclasses import dataclass
+from .decoder import DecodedSound, probe
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Samples quieter than one 16-bit step are silent once they reach nvwave.
+SILENCE_THRESHOLD = 1.0 / ((1 << 15) - 1)
+
+
+@dataclass(frozen=True)
+class StoragePolicy:
+    # Keep one channel, the average of all the others.
+    downmix: bool = False
+    # Convert to the sample rate of the backend up front.
+    resample: bool = False
+    # Cut the trailing samples that would not be heard anyway.
+    trim_silence: bool = False
+
+    def __bool__(self):
+        return self.downmix or self.resample or self.trim_silence
+
+    def variant(self, sample_rate):
+        """A string that tells apart sounds stored with different policies, for caches."""
+        if not self:
+            return ""
+        return "{}{}{}".format(
+            "mono," if self.downmix else "",
+            f"{sample_rate}," if self.resample else "",
+            "trim," if self.trim_silence else "",
+        )
+
+
+def resample(samples, source_rate, target_rate):
+    """Linearly interpolate NumPy `samples`, shaped (frames, channels), to `target_rate`."""
+    if source_rate == target_rate:
+        return samples
+    frames = samples.shape[0]
+    positions = numpy.arange(int(round(frames * target_rate / source_rate)))
+    positions = positions * (source_rate / target_rate)
+    original = numpy.arange(frames)
+    return numpy.stack(
+        [numpy.interp(positions, original, channel) for channel in samples.T], axis=1
+    ).astype(numpy.float32)
+
+
+def _compact_numpy(decoded, policy, sample_rate):
+    samples = numpy.frombuffer(decoded.samples, dtype=numpy.float32)
+    samples = samples.reshape(-1, decoded.channels)
+    rate = decoded.sample_rate
+    if policy.trim_silence:
+        audible = numpy.flatnonzero(
+            (numpy.abs(samples) > SILENCE_THRESHOLD).any(axis=1)
+        )
+        # A silent sound keeps one frame, some backends can not load an empty buffer.
+        samples = samples[: audible[-1] + 1 if audible.size else 1]
+    if policy.downmix and (samples.shape[1] > 1):
+        samples = samples.mean(axis=1, keepdims=True)
+    if policy.resample:
+        samples, rate = resample(samples, rate, sample_rate), sample_rate
+    return DecodedSound(
+        array("f", numpy.ascontiguousarray(samples, dtype=numpy.float32).tobytes()),
+        samples.shape[1],
+        rate,
+    )
+
+
+def _compact_python(decoded, policy, sample_rate):
+    samples, channels, rate = decoded.samples, decoded.channels, decoded.sample_rate
+    if policy.trim_silence:
+        end = len(samples)
+        while end and (abs(samples[end - 1]) <= SILENCE_THRESHOLD):
+            end -= 1
+        # Keep whole frames, and at least one.
+        end = max(-(-end // channels), 1) * channels
+        samples = samples[:end]
+    if policy.downmix and (channels > 1):
+        samples = array(
+            "f",
+            (
+                sum(frame) / channels
+                for frame in zip(*(samples[i::channels] for i in range(channels)))
+            ),
+        )
+        channels = 1
+    if policy.resample and (rate != sample_rate):
+        frames = len(samples) // channels
+        count = int(round(frames * sample_rate / rate))
+        step = rate / sample_rate
+        resampled = array("f", bytes(count * channels * 4))
+        for i in range(count):
+            position = i * step
+            index = min(int(position), frames - 1)
+            following = min(index + 1, frames - 1)
+            fraction = position - index
+            for channel in range(channels):
+                before = samples[index * channels + channel]
+                after = samples[following * channels + channel]
+                resampled[i * channels + channel] = before + (after - before) * fraction
+        samples, rate = resampled, sample_rate
+    return DecodedSound(samples, channels, rate)
+
+
+def compact(decoded, policy, sample_rate):
+    """Apply `policy` to a `DecodedSound`, `sample_rate` being the rate of the backend."""
+    if not policy:
+        return decoded
+    if numpy is not None:
+        return _compact_numpy(decoded, policy, sample_rate)
+    return _compact_python(decoded, policy, sample_rate)
+
+
+def full_size(filename):
+    """Bytes `filename` takes once decoded with no policy, read from its header."""
+    frames, channels, sample_rate = probe(filename)
+    return frames * channels * 4
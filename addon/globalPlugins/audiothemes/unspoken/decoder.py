@@ -0,0 +1,312 @@
+# coding: utf-8
+
+# Decoding of sound files into interleaved float samples, without Libaudioverse.
+# PCM WAV files are read with the `wave` module.
+# Anything else (Ogg Vorbis in particular) goes through libsndfile via ctypes:
+# the copy bundled with Libaudioverse on Windows, or the system one elsewhere.
+# Sounds can also be decoded from their content in memory, such as a member of a theme package.
+# This module has no dependency on NVDA.
+
+import io
+import os
+import sys
+import wave
+import ctypes
+import ctypes.util
+import threading
+from array import array
+from typing import NamedTuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class DecodeError(Exception):
+    """Raised when a sound file can not be decoded."""
+
+
+class DecodedSound(NamedTuple):
+    # Interleaved float32 samples in the range [-1.0, 1.0].
+    samples: array
+    channels: int
+    sample_rate: int
+
+    @property
+    def frames(self):
+        return len(self.samples) // self.channels
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate
+
+
+def _unsigned8_to_float(data):
+    if numpy is not None:
+        samples = numpy.frombuffer(data, dtype=numpy.uint8).astype(numpy.float32)
+        return array("f", ((samples - 128.0) / 128.0).tobytes())
+    return array("f", ((sample - 128) / 128.0 for sample in data))
+
+
+def _int_to_float(data, width):
+    scale = float(1 << (width * 8 - 1))
+    if numpy is not None:
+        if width == 3:
+            # Widen each 24-bit sample to 32 bits, the low byte being zero.
+            padded = numpy.zeros((len(data) // 3, 4), dtype=numpy.uint8)
+            padded[:, 1:] = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, 3)
+            samples = padded.view("<i4").ravel()
+            scale *= 256
+        else:
+            samples = numpy.frombuffer(data, dtype=f"<i{width}")
+        return array("f", (samples / scale).astype(numpy.float32).tobytes())
+    if width == 3:
+        samples = (
+            int.from_bytes(data[i : i + 3], "little", signed=True)
+            for i in range(0, len(data), 3)
+        )
+    else:
+        # frombytes, since an array built from a memoryview would take each byte as a sample.
+        samples = array("h" if width == 2 else "i")
+        samples.frombytes(data)
+        if sys.byteorder != "little":
+            samples.byteswap()
+    return array("f", map((1.0 / scale).__mul__, samples))
+
+
+def int16_to_float(data):
+    """Convert little-endian 16-bit PCM to float32 samples."""
+    return _int_to_float(data, 2)
+
+
+def _source(filename, data):
+    return filename if data is None else io.BytesIO(data)
+
+
+def decode_wave(filename, data=None):
+    """Decode an integer PCM WAV file."""
+    try:
+        with wave.open(_source(filename, data), "rb") as wav:
+            width = wav.getsampwidth()
+            channels = wav.getnchannels()
+            sample_rate = wav.getframerate()
+            data = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError) as e:
+        raise DecodeError(f"{filename}: {e}") from e
+    if width == 1:
+        samples = _unsigned8_to_float(data)
+    elif width in (2, 3, 4):
+        samples = _int_to_float(data, width)
+    else:
+        raise DecodeError(f"{filename}: unsupported sample width {width}")
+    return DecodedSound(samples, channels, sample_rate)
+
+
+class _SF_INFO(ctypes.Structure):
+    _fields_ = [
+        ("frames", ctypes.c_int64),
+        ("samplerate", ctypes.c_int),
+        ("channels", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("sections", ctypes.c_int),
+        ("seekable", ctypes.c_int),
+    ]
+
+
+_sf_vio_get_filelen = ctypes.CFUNCTYPE(ctypes.c_int64, ctypes.c_void_p)
+_sf_vio_seek = ctypes.CFUNCTYPE(
+    ctypes.c_int64, ctypes.c_int64, ctypes.c_int, ctypes.c_void_p
+)
+_sf_vio_read = ctypes.CFUNCTYPE(
+    ctypes.c_int64, ctypes.c_void_p, ctypes.c_int64, ctypes.c_void_p
+)
+_sf_vio_write = ctypes.CFUNCTYPE(
+    ctypes.c_int64, ctypes.c_void_p, ctypes.c_int64, ctypes.c_void_p
+)
+_sf_vio_tell = ctypes.CFUNCTYPE(ctypes.c_int64, ctypes.c_void_p)
+
+
+class _SF_VIRTUAL_IO(ctypes.Structure):
+    _fields_ = [
+        ("get_filelen", _sf_vio_get_filelen),
+        ("seek", _sf_vio_seek),
+        ("read", _sf_vio_read),
+        ("write", _sf_vio_write),
+        ("tell", _sf_vio_tell),
+    ]
+
+
+class _VirtualFile(object):
+    """Serves a file held in memory to libsndfile, it must outlive the handle opened on it."""
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.address = ctypes.cast(ctypes.c_char_p(self.data), ctypes.c_void_p).value
+        self.position = 0
+        self.io = _SF_VIRTUAL_IO(
+            _sf_vio_get_filelen(lambda user_data: len(self.data)),
+            _sf_vio_seek(self._seek),
+            _sf_vio_read(self._read),
+            _sf_vio_write(lambda ptr, count, user_data: 0),
+            _sf_vio_tell(lambda user_data: self.position),
+        )
+
+    def _seek(self, offset, whence, user_data):
+        base = (0, self.position, len(self.data))[whence]
+        self.position = min(max(base + offset, 0), len(self.data))
+        return self.position
+
+    def _read(self, ptr, count, user_data):
+        count = min(count, len(self.data) - self.position)
+        ctypes.memmove(ptr, self.address + self.position, count)
+        self.position += count
+        return count
+
+
+_SFM_READ = 0x10
+# Loaded on first use, False once we know it is not available.
+_libsndfile = None
+# Threads decoding at once wait for the first of them to load it.
+_libsndfile_lock = threading.Lock()
+
+
+def _load_libsndfile():
+    global _libsndfile
+    if _libsndfile is not None:
+        return _libsndfile
+    with _libsndfile_lock:
+        if _libsndfile is None:
+            # Only set once every candidate was tried, other threads read it without the lock.
+            _libsndfile = _find_libsndfile()
+    return _libsndfile
+
+
+def _find_libsndfile():
+    candidates = [
+        os.path.join(os.path.dirname(__file__), "libaudioverse", "libsndfile-1.dll"),
+        ctypes.util.find_library("sndfile"),
+        ctypes.util.find_library("libsndfile-1"),
+    ]
+    for candidate in candidates:
+        if not candidate or ((os.sep in candidate) and not os.path.isfile(candidate)):
+            continue
+        try:
+            lib = ctypes.CDLL(candidate)
+        except OSError:
+            continue
+        lib.sf_open.restype = ctypes.c_void_p
+        lib.sf_open.argtypes = [
+            ctypes.c_char_p,
+            ctypes.c_int,
+            ctypes.POINTER(_SF_INFO),
+        ]
+        if hasattr(lib, "sf_wchar_open"):
+            lib.sf_wchar_open.restype = ctypes.c_void_p
+            lib.sf_wchar_open.argtypes = [
+                ctypes.c_wchar_p,
+                ctypes.c_int,
+                ctypes.POINTER(_SF_INFO),
+            ]
+        if hasattr(lib, "sf_open_virtual"):
+            lib.sf_open_virtual.restype = ctypes.c_void_p
+            lib.sf_open_virtual.argtypes = [
+                ctypes.POINTER(_SF_VIRTUAL_IO),
+                ctypes.c_int,
+                ctypes.POINTER(_SF_INFO),
+                ctypes.c_void_p,
+            ]
+        lib.sf_readf_float.restype = ctypes.c_int64
+        lib.sf_readf_float.argtypes = [
+            ctypes.c_void_p,
+            ctypes.POINTER(ctypes.c_float),
+            ctypes.c_int64,
+        ]
+        lib.sf_close.argtypes = [ctypes.c_void_p]
+        lib.sf_strerror.restype = ctypes.c_char_p
+        lib.sf_strerror.argtypes = [ctypes.c_void_p]
+        return lib
+    return False
+
+
+def have_libsndfile():
+    return bool(_load_libsndfile())
+
+
+def _sf_open(lib, filename, info, virtual=None):
+    """Open `filename`, or the `_VirtualFile` given, for reading, filling `info`, and return the handle."""
+    if virtual is not None:
+        handle = lib.sf_open_virtual(
+            ctypes.byref(virtual.io), _SFM_READ, ctypes.byref(info), None
+        )
+    elif hasattr(lib, "sf_wchar_open"):
+        # Windows, where the narrow version only takes the ANSI code page.
+        handle = lib.sf_wchar_open(filename, _SFM_READ, ctypes.byref(info))
+    else:
+        handle = lib.sf_open(os.fsencode(filename), _SFM_READ, ctypes.byref(info))
+    if not handle:
+        raise DecodeError(
+            f"{filename}: {lib.sf_strerror(None).decode(errors='replace')}"
+        )
+    return handle
+
+
+def _virtual_file(lib, filename, data):
+    if data is None:
+        return None
+    if not hasattr(lib, "sf_open_virtual"):
+        raise DecodeError(f"{filename}: this libsndfile can not read from memory")
+    return _VirtualFile(data)
+
+
+def decode_libsndfile(filename, data=None):
+    """Decode any format libsndfile understands."""
+    lib = _load_libsndfile()
+    if not lib:
+        raise DecodeError(f"{filename}: libsndfile is not available")
+    info = _SF_INFO()
+    virtual = _virtual_file(lib, filename, data)
+    handle = _sf_open(lib, filename, info, virtual)
+    try:
+        samples = array("f", bytes(info.frames * info.channels * 4))
+        address, length = samples.buffer_info()
+        target = ctypes.cast(address, ctypes.POINTER(ctypes.c_float))
+        read = lib.sf_readf_float(handle, target, info.frames)
+    finally:
+        lib.sf_close(handle)
+    del samples[read * info.channels :]
+    return DecodedSound(samples, info.channels, info.samplerate)
+
+
+def probe(filename, data=None):
+    """Return the (frames, channels, sample rate) of `filename` without decoding it."""
+    if os.path.splitext(filename)[1].lower() == ".wav":
+        try:
+            with wave.open(_source(filename, data), "rb") as wav:
+                return wav.getnframes(), wav.getnchannels(), wav.getframerate()
+        except (wave.Error, EOFError) as e:
+            if not have_libsndfile():
+                raise DecodeError(f"{filename}: {e}") from e
+    lib = _load_libsndfile()
+    if not lib:
+        raise DecodeError(f"{filename}: libsndfile is not available")
+    info = _SF_INFO()
+    virtual = _virtual_file(lib, filename, data)
+    handle = _sf_open(lib, filename, info, virtual)
+    lib.sf_close(handle)
+    return info.frames, info.channels, info.samplerate
+
+
+def decode(filename, data=None):
+    """Decode `filename` into a `DecodedSound`.
+
+    `data`, if given, is the content of the file, which is then never opened.
+    """
+    if os.path.splitext(filename)[1].lower() == ".wav":
+        try:
+            return decode_wave(filename, data)
+        except DecodeError:
+            # Float or compressed WAV, libsndfile may still read it.
+            if not have_libsndfile():
+                raise
+    return decode_libsndfile(filename, data)
@@ -0,0 +1,141 @@
+# coding: utf-8
+
+# Latency instrumentation for the path from an NVDA event to the first audible sample.
+# A trace is started in the global plugin and stamped at each stage it passes through:
+# the unsync thread hop, the handler, the simulation, and finally the hand-off to nvwave.
+# The time spent between consecutive stages is kept in per-stage histograms in memory.
+# This module has no dependency on NVDA.
+
+import math
+import threading
+import time
+
+
+# Tracing costs a couple of clock reads per event, it is off unless asked for.
+enabled = False
+
+STAGES = ("event", "dispatched", "played", "connected", "rendered", "fed")
+# Histogram buckets grow geometrically, each one 5% wider than the previous.
+_BUCKET_BASE = 0.01  # milliseconds
+_BUCKET_GROWTH = math.log(1.05)
+_PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram(object):
+    """Log-bucketed histogram of durations in milliseconds."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.max = 0.0
+
+    @staticmethod
+    def _bucket_for(value):
+        if value <= _BUCKET_BASE:
+            return 0
+        return int(math.log(value / _BUCKET_BASE) / _BUCKET_GROWTH) + 1
+
+    @staticmethod
+    def _upper_bound(bucket):
+        return _BUCKET_BASE * math.exp(bucket * _BUCKET_GROWTH)
+
+    def add(self, value):
+        bucket = self._bucket_for(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """Return the upper bound of the bucket holding the given percentile."""
+        if not self.count:
+            return 0.0
+        wanted = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= wanted:
+                return min(self._upper_bound(bucket), self.max)
+        return self.max
+
+
+class LatencyTrace(object):
+    __slots__ = ("source", "stamps")
+
+    def __init__(self, source):
+        self.source = source
+        self.stamps = [("event", time.perf_counter())]
+
+    def stamp(self, stage):
+        self.stamps.append((stage, time.perf_counter()))
+
+
+class LatencyRecorder(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+    def _add(self, stage, value):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        histogram.add(value)
+
+    def record(self, trace):
+        with self._lock:
+            stamps = trace.stamps
+            for (prev_stage, prev_time), (stage, stage_time) in zip(stamps, stamps[1:]):
+                self._add(f"{prev_stage} -> {stage}", (stage_time - prev_time) * 1000)
+            self._add(
+                f"total ({trace.source})", (stamps[-1][1] - stamps[0][1]) * 1000
+            )
+
+    def dump(self):
+        """Return a plain text table of the recorded latencies, in milliseconds."""
+        header = "{:<36}{:>8}".format("stage", "count") + "".join(
+            f"{'p' + str(p):>9}" for p in _PERCENTILES
+        )
+        lines = [header + f"{'max':>9}"]
+        with self._lock:
+            for stage in sorted(self.histograms, key=_stage_order):
+                histogram = self.histograms[stage]
+                line = f"{stage:<36}{histogram.count:>8}"
+                for percent in _PERCENTILES:
+                    line += f"{histogram.percentile(percent):>9.2f}"
+                lines.append(line + f"{histogram.max:>9.2f}")
+        return "\n".join(lines)
+
+
+def _stage_order(name):
+    first = name.split(" ")[0]
+    if first in STAGES:
+        return (STAGES.index(first), name)
+    return (len(STAGES), name)
+
+
+recorder = LatencyRecorder()
+
+
+def start(source):
+    """Start a trace for an event, returns None when tracing is disabled."""
+    if enabled:
+        return LatencyTrace(source)
+
+
+def stamp(trace, stage):
+    if trace is not None:
+        trace.stamp(stage)
+
+
+def finish(trace, stage):
+    """Stamp the final stage and add the trace to the histograms."""
+    if trace is not None:
+        trace.stamp(stage)
+        recorder.record(trace)
+
+
+def dump():
+    return recorder.dump()
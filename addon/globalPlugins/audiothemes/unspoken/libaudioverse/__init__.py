@@ -728,6 +728,35 @@ class Simulation(_HandleComparer):
             )
             return list(buff)
 
+    def get_block_into(self, buffer, channels, may_apply_mixing_matrix=True):
+        r"""Renders a block of data into a caller-owned buffer and returns a float32 memoryview over it.
+
+        Like get_block, but nothing is allocated.  buffer may be any writable object supporting the buffer protocol (a ctypes float array, an array.array("f"), a bytearray...) with room for at least block_size * channels floats.
+        The returned memoryview covers exactly one block and stays valid as long as the buffer does."""
+        with self._lock:
+            length = _lav.simulation_get_block_size(self.handle) * channels
+            target = (ctypes.c_float * length).from_buffer(buffer)
+            # circumvent automatic conversion of iterables.
+            buff_ptr = ctypes.cast(target, ctypes.POINTER(ctypes.c_float))
+            _lav.simulation_get_block(
+                self.handle, channels, may_apply_mixing_matrix, buff_ptr
+            )
+            return memoryview(target).cast("B").cast("f")
+
+    @property
+    def block_size(self):
+        r"""The number of frames in a block.
+
+        This wraps Lav_simulationGetBlockSize."""
+        return _lav.simulation_get_block_size(self)
+
+    @property
+    def sample_rate(self):
+        r"""The sampling rate of the simulation.
+
+        This wraps Lav_simulationGetSr."""
+        return _lav.simulation_get_sr(self)
+
     # context manager support.
     def __enter__(self):
         r"""Lock the simulation."""
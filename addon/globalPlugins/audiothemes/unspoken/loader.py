@@ -0,0 +1,84 @@
+# coding: utf-8
+
+# Loading of many sounds, for activating a whole theme at once.
+# Decoding through libsndfile or Libaudioverse happens inside ctypes calls that release the GIL,
+# so those files (Ogg Vorbis in particular) are loaded by a bounded pool of threads.
+# WAV files are read by the `wave` module, which holds the GIL the whole time,
+# a pool only adds overhead to them, so they are loaded one after the other meanwhile.
+# Members of a package read in place, see `archive`, are decoded from memory, split the same way.
+# This module has no dependency on NVDA.
+
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .decoder import decode
+
+
+def default_workers():
+    return min(4, os.cpu_count() or 1)
+
+
+def decodes_natively(filename):
+    """Whether `filename` is decoded by native code that lets other threads run."""
+    return os.path.splitext(filename)[1].lower() != ".wav"
+
+
+def _load_all(load, items, max_workers):
+    """Call `load` on the name of every (key, name) pair of `items`, see `load_sounds`."""
+    in_pool, in_turn = [], []
+    for key, name in items:
+        (in_pool if decodes_natively(name) else in_turn).append((key, name))
+    max_workers = min(max_workers or default_workers(), len(in_pool))
+    if max_workers < 2:
+        # A pool of one thread would only hand the work over.
+        in_pool, in_turn = [], in_pool + in_turn
+    sounds, errors = {}, {}
+    with ThreadPoolExecutor(max(max_workers, 1)) as pool:
+        futures = {pool.submit(load, name): key for key, name in in_pool}
+        for key, name in in_turn:
+            try:
+                sounds[key] = load(name)
+            except Exception as e:
+                errors[key] = e
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                sounds[key] = future.result()
+            except Exception as e:
+                errors[key] = e
+    return sounds, errors
+
+
+def load_sounds(backend, sound_files, max_workers=None):
+    """Load `sound_files`, an iterable of (key, path) pairs, with `backend`.
+
+    Returns a (sounds, errors) pair of dicts, mapping keys to the loaded sounds,
+    and to the exception raised while loading them.
+    At most `max_workers` threads, `default_workers()` if None, decode files other than WAV.
+    """
+    return _load_all(backend.load_sound, sound_files, max_workers)
+
+
+def decode_member(archive, name):
+    """Decode the member `name` of an `archive.ThemeArchive`."""
+    with archive.read(name) as data:
+        return decode(name, data)
+
+
+def load_member(backend, archive, name):
+    """Load the member `name` of an `archive.ThemeArchive` with `backend`."""
+    decoded = backend.compact(decode_member(archive, name))
+    sound = backend.load_decoded(os.path.join(archive.filename, name), decoded)
+    # The member has no file of its own to render from.
+    sound.source = functools.partial(decode_member, archive, name)
+    return sound
+
+
+def load_members(backend, archive, members, max_workers=None):
+    """Load `members`, an iterable of (key, member name) pairs of `archive`.
+
+    Returns a (sounds, errors) pair like `load_sounds`.
+    """
+    return _load_all(
+        functools.partial(load_member, backend, archive), members, max_workers
+    )
@@ -0,0 +1,215 @@
+# coding: utf-8
+
+# Loudness analysis of theme sounds, so that every theme plays at the same loudness.
+# Sounds are measured once, when a theme is installed or saved in the studio,
+# and the player only multiplies its volume by the gain computed here, nothing is measured while playing.
+# Loudness follows ITU-R BS.1770: the mean square of the K-weighted samples over 400 ms blocks,
+# overlapping by 75%, gated at -70 LUFS and then 10 LU below the mean of the remaining blocks.
+# Most theme sounds are shorter than one block, they are measured as a single block.
+# With NumPy the K-weighting is applied as its magnitude response in the frequency domain,
+# which gives the same energy as the filter itself, otherwise the filters run sample by sample.
+# Measuring holds the GIL, and NVDA can not start worker processes, so sounds are measured one after
+# the other, by the thread installing the theme or by one the studio starts, never by NVDA's own threads.
+# This module has no dependency on NVDA.
+
+import math
+from itertools import accumulate
+from typing import NamedTuple
+from .decoder import decode
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The loudness every sound is brought to, in LUFS.
+TARGET_LOUDNESS = -20.0
+# Quiet sounds are not boosted by more than this, in dB.
+MAX_BOOST = 12.0
+# Nor above this peak, in dBFS.
+PEAK_CEILING = -1.0
+# What silence measures, in dB.
+SILENCE = -120.0
+_BLOCK_SECONDS = 0.4
+_STEP_SECONDS = 0.1
+_ABSOLUTE_GATE = -70.0
+_RELATIVE_GATE = -10.0
+
+
+class Loudness(NamedTuple):
+    # Of the highest sample, in dBFS.
+    peak: float
+    # Over every sample, in dBFS.
+    rms: float
+    # Integrated loudness, in LUFS.
+    lufs: float
+    # In seconds.
+    duration: float
+
+    def gain(self, target=TARGET_LOUDNESS):
+        """The gain in dB bringing this sound to `target`, limited by MAX_BOOST and PEAK_CEILING."""
+        if self.lufs <= _ABSOLUTE_GATE:
+            # Silence, or too quiet to tell.
+            return 0.0
+        return min(target - self.lufs, MAX_BOOST, PEAK_CEILING - self.peak)
+
+    def todict(self, target=TARGET_LOUDNESS):
+        """The entry of this sound in the loudness table of an info file."""
+        return {
+            "peak": round(self.peak, 2),
+            "rms": round(self.rms, 2),
+            "lufs": round(self.lufs, 2),
+            "duration": round(self.duration, 3),
+            "gain": round(self.gain(target), 2),
+        }
+
+
+def _decibels(power):
+    return max(10 * math.log10(power), SILENCE) if power > 0 else SILENCE
+
+
+def _k_weighting(sample_rate):
+    """The (b0, b1, b2, a1, a2) of the shelving and high-pass stages of the K-weighting at `sample_rate`."""
+    # The stages are given for 48 kHz by BS.1770, these are the analog prototypes they come from.
+    gain, q, frequency = 3.99984385397, 0.7071752369554193, 1681.974450955533
+    k = math.tan(math.pi * frequency / sample_rate)
+    vh = 10 ** (gain / 20)
+    vb = vh**0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = (
+        (vh + vb * k / q + k * k) / a0,
+        2 * (k * k - vh) / a0,
+        (vh - vb * k / q + k * k) / a0,
+        2 * (k * k - 1) / a0,
+        (1 - k / q + k * k) / a0,
+    )
+    q, frequency = 0.5003270373253953, 38.13547087613982
+    k = math.tan(math.pi * frequency / sample_rate)
+    a0 = 1 + k / q + k * k
+    high_pass = (1, -2, 1, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+    return shelf, high_pass
+
+
+def _weighted_power_numpy(values, channels, sample_rate):
+    """The K-weighted power of every frame, summed over the channels."""
+    frames = values.reshape(-1, channels)
+    # Room for the response of the high-pass stage to die out.
+    size = len(frames) + sample_rate // 10
+    spectrum = numpy.fft.rfft(frames.astype(numpy.float64), n=size, axis=0)
+    z = numpy.exp(-1j * numpy.linspace(0, math.pi, len(spectrum)))
+    response = numpy.ones(len(spectrum))
+    for b0, b1, b2, a1, a2 in _k_weighting(sample_rate):
+        response *= numpy.abs((b0 + b1 * z + b2 * z * z) / (1 + a1 * z + a2 * z * z))
+    weighted = numpy.fft.irfft(spectrum * response[:, None], n=size, axis=0)
+    return (weighted[: len(frames)] ** 2).sum(axis=1)
+
+
+def _weighted_power_python(samples, channels, sample_rate):
+    stages = _k_weighting(sample_rate)
+    power = None
+    for channel in range(channels):
+        squares = []
+        append = squares.append
+        (b0, b1, b2, a1, a2), (c0, c1, c2, d1, d2) = stages
+        x1 = x2 = y1 = y2 = z1 = z2 = 0.0
+        for x in samples[channel::channels]:
+            y = b0 * x + b1 * x1 + b2 * x2 - a1 * y1 - a2 * y2
+            z = c0 * y + c1 * y1 + c2 * y2 - d1 * z1 - d2 * z2
+            x2, x1, y2, y1, z2, z1 = x1, x, y1, y, z1, z
+            append(z * z)
+        power = squares if power is None else [p + s for p, s in zip(power, squares)]
+    return power or []
+
+
+def _integrated(block_powers):
+    """Gated loudness of the mean powers of the blocks, in LUFS."""
+    gated = [p for p in block_powers if -0.691 + _decibels(p) > _ABSOLUTE_GATE]
+    if not gated:
+        return SILENCE
+    threshold = -0.691 + _decibels(sum(gated) / len(gated)) + _RELATIVE_GATE
+    gated = [p for p in gated if -0.691 + _decibels(p) > threshold]
+    return max(-0.691 + _decibels(sum(gated) / len(gated)), SILENCE)
+
+
+def measure(decoded):
+    """Measure a `decoder.DecodedSound`, returns its `Loudness`."""
+    samples, channels, rate = decoded.samples, decoded.channels, decoded.sample_rate
+    frames = len(samples) // channels
+    if not frames:
+        return Loudness(SILENCE, SILENCE, SILENCE, 0.0)
+    if numpy is not None:
+        values = numpy.frombuffer(samples, dtype=numpy.float32)[: frames * channels]
+        peak = float(numpy.abs(values).max())
+        mean_square = float(numpy.dot(values, values)) / len(values)
+        power = _weighted_power_numpy(values, channels, rate)
+        prefix = numpy.concatenate(([0.0], numpy.cumsum(power)))
+    else:
+        values = samples[: frames * channels]
+        peak = max(abs(min(values)), abs(max(values)))
+        mean_square = math.fsum(x * x for x in values) / len(values)
+        power = _weighted_power_python(values, channels, rate)
+        prefix = [0.0] + list(accumulate(power))
+    block = int(_BLOCK_SECONDS * rate)
+    step = int(_STEP_SECONDS * rate)
+    if frames <= block:
+        starts, block = [0], frames
+    else:
+        starts = range(0, frames - block + 1, step)
+    block_powers = [float(prefix[s + block] - prefix[s]) / block for s in starts]
+    return Loudness(
+        _decibels(peak * peak),
+        _decibels(mean_square),
+        _integrated(block_powers),
+        frames / rate,
+    )
+
+
+def measure_file(filename):
+    return measure(decode(filename))
+
+
+def _measure_source(source):
+    if callable(source):
+        return measure(source())
+    return measure_file(source)
+
+
+def analyze(sources, on_progress=None):
+    """Measure `sources`, an iterable of (key, source) pairs, one after the other.
+
+    A source is the name of a sound file, or a function returning a `decoder.DecodedSound`.
+    Returns a (results, errors) pair of dicts, mapping keys to a `Loudness`,
+    and to the exception raised while measuring them.
+    `on_progress`, if given, is called with the sounds measured so far and the total.
+    """
+    sources = list(sources)
+    results, errors = {}, {}
+    for done, (key, source) in enumerate(sources, 1):
+        try:
+            results[key] = _measure_source(source)
+        except Exception as e:
+            errors[key] = e
+        if on_progress is not None:
+            on_progress(done, len(sources))
+    return results, errors
+
+
+def make_table(results, target=TARGET_LOUDNESS):
+    """The loudness table of an info file, from a dict of sound name -> `Loudness`."""
+    return {
+        "target": target,
+        "sounds": {name: results[name].todict(target) for name in sorted(results)},
+    }
+
+
+def gain_table(table, target=TARGET_LOUDNESS):
+    """Turn the loudness table of an info file into a dict of sound name -> gain multiplier."""
+    gains = {}
+    for name, entry in table.get("sounds", {}).items():
+        try:
+            loudness = Loudness(*(float(entry[field]) for field in Loudness._fields))
+        except (KeyError, TypeError, ValueError):
+            continue
+        # Computed again rather than read, the table may have been made for another target.
+        gains[name] = 10 ** (loudness.gain(target) / 20)
+    return gains
@@ -1,23 +1,42 @@
 # coding: utf-8
 
-# very simple mixer using Libaudioverse.
-# wraps a Simulation object
-import queue
+# very simple mixer.
+# pulls blocks from an audio backend and feeds them to NVDA.
+# When nothing is playing the mixer parks both of its threads instead of rendering and feeding silence.
 import threading
-import struct
+from enum import Enum
 import nvwave
 import config
 import time
+from . import latency, pcm
+from .ring import PCMRing
+
+
+class MixerState(Enum):
+    active = "active"
+    # No sound is connected anymore, keep rendering until the output falls silent.
+    draining = "draining"
+    idle = "idle"
 
 
 class Mixer(object):
-    def __init__(self, sim, mix_ahead):
-        self.sim = sim
+    def __init__(self, backend, mix_ahead):
+        self.backend = backend
         self.mix_ahead = mix_ahead
-        self.queue = queue.Queue(mix_ahead + 1)
+        # Nothing is playing yet, so start parked.
+        self.state = MixerState.idle
+        self._state_lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._idle_since = time.perf_counter()
+        self._idle_time = 0.0
+        self.wakeups = 0
+        # Latency traces waiting for the next rendered block.
+        self._pending_traces = []
+        # 16-bit stereo blocks waiting to be played.
+        self.ring = PCMRing(mix_ahead + 1)
         self.player = nvwave.WavePlayer(
-            channels=2,
-            samplesPerSec=44100,
+            channels=backend.channels,
+            samplesPerSec=backend.sample_rate,
             bitsPerSample=16,
             outputDevice=config.conf["speech"]["outputDevice"],
             wantDucking=False,
@@ -29,31 +48,105 @@ class Mixer(object):
         self.playing_thread.start()
         self.feeding_thread.start()
 
+    def wake(self):
+        """Resume rendering right away, call this whenever a sound is connected."""
+        with self._state_lock:
+            if self.state is MixerState.idle:
+                self._idle_time += time.perf_counter() - self._idle_since
+                self.wakeups += 1
+                self._wake_event.set()
+            self.state = MixerState.active
+
+    def track(self, trace):
+        """Follow a latency trace until the next block reaches nvwave."""
+        if trace is not None:
+            with self._state_lock:
+                self._pending_traces.append(trace)
+
+    def idle(self):
+        """Park the mixer as soon as the rendered output is silent.
+
+        Call this when the last playing sound has ended or was disconnected.
+        """
+        with self._state_lock:
+            if self.state is MixerState.active:
+                self.state = MixerState.draining
+
+    def _park_if_drained(self, block):
+        if (self.state is not MixerState.draining) or not pcm.is_silent(block):
+            return
+        with self._state_lock:
+            # wake may have been called since we checked.
+            if self.state is MixerState.draining:
+                self.state = MixerState.idle
+                self._idle_since = time.perf_counter()
+                self._wake_event.clear()
+
+    @property
+    def idle_time(self):
+        """Total seconds spent parked, including the current idle period."""
+        with self._state_lock:
+            if self.state is MixerState.idle:
+                return self._idle_time + (time.perf_counter() - self._idle_since)
+            return self._idle_time
+
     def feeder_func(self):
         while True:
-            block = self.sim.get_block(2)
-            max_sample = (1 << 15) - 1
-            for i, j in enumerate(block):
-                block[i] = j * max_sample
-            struct_format = f"{len(block)}h"
-            block_string = struct.pack(struct_format, *(int(i) for i in block))
-            self.queue.put(block_string, block=True)
+            if self.state is MixerState.idle:
+                self._wake_event.wait()
+            self.ring.acquire_write()
+            # The conversion to PCM copies the samples out of the backend's block.
+            block = self.backend.render_block()
+            traces = None
+            if self._pending_traces:
+                # track may be appending from another thread.
+                with self._state_lock:
+                    traces, self._pending_traces = self._pending_traces, []
+                for trace in traces:
+                    latency.stamp(trace, "rendered")
+            self._park_if_drained(block)
+            self.ring.commit_write(pcm.float_to_int16(block), traces)
 
     def player_func(self):
         prev_device = config.conf["speech"]["outputDevice"]
-        zero_string = struct.pack("882h", *[0] * 882)  # 10 ms of silence.
+        # 10 ms of silence.
+        zero_string = bytes(self.backend.sample_rate // 100 * self.backend.channels * 2)
+        parked = False
         while True:
             current_device = config.conf["speech"]["outputDevice"]
             if prev_device != current_device:
                 self.player = nvwave.WavePlayer(
-                    channels=2,
-                    samplesPerSec=44100,
+                    channels=self.backend.channels,
+                    samplesPerSec=self.backend.sample_rate,
                     bitsPerSample=16,
                     outputDevice=config.conf["speech"]["outputDevice"],
                 )
             prev_device = current_device
-            try:
-                send_string = self.queue.get(block=True, timeout=0.01)
-                self.player.feed(send_string)
-            except queue.Empty:
+            if (self.state is MixerState.idle) and not self.ring.occupancy:
+                if not parked:
+                    # Let nvwave close the device while we are not using it.
+                    self.player.idle()
+                    parked = True
+                self._wake_event.wait()
+                continue
+            parked = False
+            block = self.ring.acquire_read(timeout=0.01)
+            if block is None:
                 self.player.feed(zero_string)
+                continue
+            # Already the immutable bytes nvwave needs, the slot can be freed right away.
+            traces = self.ring.release_read()
+            if traces is not None:
+                for trace in traces:
+                    latency.finish(trace, "fed")
+            self.player.feed(block)
+
+    def stats(self):
+        """Counters useful for tuning `mix_ahead` and checking idle behavior."""
+        return dict(
+            self.ring.stats(),
+            mix_ahead=self.mix_ahead,
+            state=self.state.value,
+            idle_time=self.idle_time,
+            wakeups=self.wakeups,
+        )
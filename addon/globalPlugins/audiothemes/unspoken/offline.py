@@ -0,0 +1,150 @@
+# coding: utf-8
+
+# Offline rendering of scripted event sequences.
+# Plays sounds through the same audio backends UnspokenPlayer uses,
+# but pulls blocks from the backend as fast as it can and writes them to a WAV file.
+# Neither nvwave nor an audio device is involved.
+#
+#   renderer = OfflineRenderer()
+#   renderer.load_sounds(theme.iter_sound_files())
+#   stats = renderer.render([(0.0, controlTypes.ROLE_BUTTON, (0, 0, 100, 30))], "out.wav")
+
+import time
+import wave
+from dataclasses import dataclass
+from typing import NamedTuple, Optional, Tuple
+from . import loader, pcm, location_to_angles
+from .backends import StealPolicy, create_backend
+
+
+class RenderEvent(NamedTuple):
+    """A sound to play `time` seconds after the start of the rendering."""
+
+    time: float
+    role: int
+    # (left, top, width, height) in screen coordinates, None means the center of the screen.
+    location: Optional[Tuple[int, int, int, int]] = None
+
+
+@dataclass
+class RenderStats:
+    events: int
+    skipped: int
+    frames: int
+    sample_rate: int
+    elapsed: float
+    steals: int = 0
+    drops: int = 0
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate
+
+    @property
+    def realtime_factor(self):
+        """How many seconds of audio were rendered per second of wall time."""
+        return self.duration / self.elapsed if self.elapsed else float("inf")
+
+
+class OfflineRenderer:
+    """Renders a list of `RenderEvent`s to a 16-bit stereo WAV file."""
+
+    def __init__(
+        self,
+        sample_rate=44100,
+        block_size=128,
+        desktop_size=(1920, 1080),
+        audio3d=True,
+        volume=1.0,
+        voices=4,
+        voice_stealing=StealPolicy.oldest,
+        backend="libaudioverse",
+    ):
+        # Simulated time, in seconds since the start of the rendering.
+        self._now = 0.0
+        # Events start on block boundaries, so a small block keeps the timing accurate.
+        self.backend = create_backend(
+            backend,
+            sample_rate=sample_rate,
+            block_size=block_size,
+            voices=voices,
+            voice_stealing=voice_stealing,
+            clock=lambda: self._now,
+        )
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.desktop_size = desktop_size
+        self.audio3d = audio3d
+        self.volume = volume
+        self.sounds = {}
+
+    def load_sound(self, role, filename):
+        self.sounds[role] = self.backend.load_sound(filename)
+
+    def load_sounds(self, sound_files):
+        """Load an iterable of (role, filename) pairs.
+
+        Raises the first error met, once every other sound is loaded.
+        """
+        sounds, errors = loader.load_sounds(self.backend, sound_files)
+        self.sounds.update(sounds)
+        for error in errors.values():
+            raise error
+
+    def _play(self, event, priority):
+        location = event.location if self.audio3d else None
+        angle_x, angle_y = location_to_angles(location, *self.desktop_size)
+        self.backend.play(
+            self.sounds[event.role], angle_x, angle_y, self.volume, priority
+        )
+
+    def render(self, events, filename, tail=1.0, priorities=None):
+        """Render `events` to `filename`.
+
+        Once the last sound has ended, rendering goes on for up to `tail` seconds until the output is silent.
+        Events whose role has no loaded sound are skipped.
+        `priorities` optionally maps roles to voice priorities.
+        """
+        priorities = priorities or {}
+        events = sorted((RenderEvent(*event) for event in events), key=lambda e: e.time)
+        playable = [event for event in events if event.role in self.sounds]
+        ends_at = max(
+            (event.time + self.sounds[event.role].duration for event in playable),
+            default=0,
+        )
+        channels = self.backend.channels
+        pcm_buffer = memoryview(bytearray(self.block_size * channels * 2))
+        frames = 0
+        next_event = 0
+        started = time.perf_counter()
+        with wave.open(filename, "wb") as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            while True:
+                now = self._now = frames / self.sample_rate
+                while (next_event < len(playable)) and (
+                    playable[next_event].time <= now
+                ):
+                    event = playable[next_event]
+                    self._play(event, priorities.get(event.role, 0))
+                    next_event += 1
+                block = self.backend.render_block()
+                wav.writeframesraw(
+                    pcm_buffer[: pcm.float_to_int16_into(block, pcm_buffer)]
+                )
+                frames += self.block_size
+                if (next_event < len(playable)) or (now < ends_at):
+                    continue
+                if (now >= ends_at + tail) or pcm.is_silent(block):
+                    break
+        backend_stats = self.backend.stats()
+        return RenderStats(
+            events=len(playable),
+            skipped=len(events) - len(playable),
+            frames=frames,
+            sample_rate=self.sample_rate,
+            elapsed=time.perf_counter() - started,
+            steals=backend_stats.get("steals", 0),
+            drops=backend_stats.get("drops", 0),
+        )
@@ -0,0 +1,235 @@
+# coding: utf-8
+
+# Packed themes: version 2 of the audio theme package format.
+# A packed theme is one file holding every sound of a theme already decoded,
+# so activating it needs no codec at all:
+#
+#   header   magic, format version, sample format, number of sounds, length of the info
+#   info     the theme's info file, as UTF-8 JSON
+#   index    role, payload offset, frames, channels and sample rate of every sound
+#   payload  the interleaved samples of every sound, one after the other,
+#            as float32, or int16 for half the size, starting at a 16-byte boundary
+#
+# Float32 is the default and the one to use in NVDA: int16 sounds are converted back to floats
+# when loaded, which is only cheap with NumPy, without it they load barely faster than the sound files.
+# Readers map the file copy-on-write, float32 sounds are handed to the backend straight from the mapping.
+# Version 1 packages are zip files of sound files, `is_packed` tells the two apart.
+# This module has no dependency on NVDA.
+
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from zipfile import ZipFile
+from .decoder import DecodedSound, decode, int16_to_float
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PACKED_MAGIC = b"ATP2"
+PACKED_VERSION = 2
+# The name of the packed sounds inside an installed theme directory.
+PACKED_FILE_NAME = "sounds.atp2"
+FLOAT32 = 1
+INT16 = 2
+_SAMPLE_WIDTHS = {FLOAT32: 4, INT16: 2}
+# magic, version, sample format, sounds, info length
+_HEADER = struct.Struct("<4sHHII")
+# role, offset, frames, channels, sample rate
+_ENTRY = struct.Struct("<iQIHI")
+_ALIGNMENT = 16
+
+
+class PackedThemeError(Exception):
+    """Raised when a file is not a valid packed theme."""
+
+
+def is_packed(filename):
+    try:
+        with open(filename, "rb") as f:
+            return f.read(len(PACKED_MAGIC)) == PACKED_MAGIC
+    except OSError:
+        return False
+
+
+def _payload_start(info_length, sounds):
+    end = _HEADER.size + info_length + sounds * _ENTRY.size
+    return -(-end // _ALIGNMENT) * _ALIGNMENT
+
+
+class PackedTheme(object):
+    """A packed theme file opened for reading."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            try:
+                # Copy-on-write, Libaudioverse can only take samples from a writable buffer without copying them.
+                self._mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            except ValueError:
+                raise PackedThemeError(f"{filename}: empty file")
+        mapping = self._mapping
+        if len(mapping) < _HEADER.size:
+            raise PackedThemeError(f"{filename}: truncated header")
+        magic, version, sample_format, count, info_length = _HEADER.unpack_from(mapping)
+        if (magic != PACKED_MAGIC) or (version != PACKED_VERSION):
+            raise PackedThemeError(f"{filename}: not a packed theme")
+        if sample_format not in _SAMPLE_WIDTHS:
+            raise PackedThemeError(f"{filename}: unknown sample format {sample_format}")
+        self.sample_format = sample_format
+        try:
+            self.info = json.loads(
+                bytes(mapping[_HEADER.size : _HEADER.size + info_length]).decode("utf8")
+            )
+        except ValueError as e:
+            raise PackedThemeError(f"{filename}: {e}") from e
+        self._payload = _payload_start(info_length, count)
+        width = _SAMPLE_WIDTHS[sample_format]
+        # role -> (offset, frames, channels, sample rate)
+        self.index = {}
+        position = _HEADER.size + info_length
+        for i in range(count):
+            role, offset, frames, channels, rate = _ENTRY.unpack_from(mapping, position)
+            position += _ENTRY.size
+            if self._payload + offset + frames * channels * width > len(mapping):
+                raise PackedThemeError(f"{filename}: sound {role} is truncated")
+            self.index[role] = (offset, frames, channels, rate)
+
+    @property
+    def roles(self):
+        return list(self.index)
+
+    def decoded(self, role):
+        """Return the `DecodedSound` of `role`, float32 sounds are views of the mapping."""
+        offset, frames, channels, rate = self.index[role]
+        width = _SAMPLE_WIDTHS[self.sample_format]
+        start = self._payload + offset
+        data = memoryview(self._mapping)[start : start + frames * channels * width]
+        if self.sample_format == FLOAT32:
+            return DecodedSound(data.cast("f"), channels, rate)
+        return DecodedSound(int16_to_float(data), channels, rate)
+
+    def close(self):
+        try:
+            self._mapping.close()
+        except BufferError:
+            # Sounds still use the mapping, it goes away with them.
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _samples_bytes(decoded, sample_format):
+    if sample_format == FLOAT32:
+        return memoryview(decoded.samples).cast("B")
+    if numpy is not None:
+        samples = numpy.frombuffer(decoded.samples, dtype=numpy.float32)
+        return (numpy.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    clipped = (min(max(sample, -1.0), 1.0) for sample in decoded.samples)
+    samples = array("h", (int(sample * 32767) for sample in clipped))
+    if samples.itemsize != 2:
+        raise PackedThemeError("no 16-bit integer type on this platform")
+    if sys.byteorder != "little":
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def write_packed(filename, info, sounds, sample_format=FLOAT32):
+    """Write a packed theme.
+
+    `sounds` maps roles to functions returning the `DecodedSound` of each role,
+    they are called one at a time so only one sound is in memory at once.
+    """
+    info_bytes = json.dumps(info).encode("utf8")
+    roles = list(sounds)
+    payload = _payload_start(len(info_bytes), len(roles))
+    temp_path = f"{filename}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(
+                _HEADER.pack(
+                    PACKED_MAGIC,
+                    PACKED_VERSION,
+                    sample_format,
+                    len(roles),
+                    len(info_bytes),
+                )
+            )
+            f.write(info_bytes)
+            # The index is written once the payload offsets are known.
+            f.seek(payload)
+            entries = []
+            offset = 0
+            for role in roles:
+                decoded = sounds[role]()
+                data = _samples_bytes(decoded, sample_format)
+                f.write(data)
+                entries.append(
+                    _ENTRY.pack(
+                        role,
+                        offset,
+                        decoded.frames,
+                        decoded.channels,
+                        decoded.sample_rate,
+                    )
+                )
+                offset += len(data)
+            f.seek(_HEADER.size + len(info_bytes))
+            f.write(b"".join(entries))
+        os.replace(temp_path, filename)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def pack_directory(directory, filename, info_file_name, role_of, sample_format=FLOAT32):
+    """Pack the theme in `directory`, `role_of` maps a sound file name to its role or None."""
+    with open(os.path.join(directory, info_file_name), "r", encoding="utf8") as f:
+        info = json.load(f)
+    sounds = {}
+    for name in sorted(os.listdir(directory)):
+        role = role_of(name)
+        path = os.path.join(directory, name)
+        if (role is not None) and os.path.isfile(path):
+            sounds[role] = lambda path=path: decode(path)
+    write_packed(filename, info, sounds, sample_format)
+
+
+def pack_package(package, filename, info_file_name, role_of, sample_format=FLOAT32):
+    """Convert a version 1 package, plain or legacy, into a packed theme."""
+    with tempfile.TemporaryDirectory() as directory:
+        with ZipFile(package, "r") as pack:
+            members = pack.infolist()
+            theme_name = None
+            if members and members[0].is_dir():
+                # Legacy package, the files are in a folder named after the theme.
+                theme_name = members[0].orig_filename.strip("/")
+            for member in members:
+                name = os.path.split(member.filename)[1]
+                if member.is_dir() or not name:
+                    continue
+                with pack.open(member) as source, open(
+                    os.path.join(directory, name), "wb"
+                ) as target:
+                    shutil.copyfileobj(source, target)
+        if theme_name is not None:
+            info_file = os.path.join(directory, info_file_name)
+            with open(info_file, "r", encoding="utf8") as f:
+                info = json.load(f)
+            info.setdefault("name", theme_name)
+            with open(info_file, "w", encoding="utf8") as f:
+                json.dump(info, f)
+        pack_directory(directory, filename, info_file_name, role_of, sample_format)
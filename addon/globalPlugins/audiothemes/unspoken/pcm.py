@@ -0,0 +1,116 @@
+# coding: utf-8
+
+# Conversion of Libaudioverse float blocks into the 16-bit PCM that nvwave plays.
+# This module has no dependency on NVDA or Libaudioverse, so it can be benchmarked on its own.
+# NumPy is used when it is importable, otherwise we fall back to a precompiled struct.
+# NVDA has no NumPy, so the fallback is the path that runs there: it reads the samples out of the
+# block's buffer in one call and scales them with `map`, iterating a ctypes array sample by sample costs more
+# than the conversion itself.
+
+import functools
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+MAX_SAMPLE = (1 << 15) - 1
+_SCALE = float(MAX_SAMPLE)
+# Anything quieter than one 16-bit step converts to zero.
+SILENCE_THRESHOLD = 1.0 / MAX_SAMPLE
+
+
+def _as_float32(block):
+    """Return a flat float32 view of `block` without copying when possible."""
+    try:
+        return numpy.frombuffer(block, dtype=numpy.float32)
+    except TypeError:
+        return numpy.asarray(block, dtype=numpy.float32)
+
+
+def _scale_and_clip(block):
+    scaled = numpy.multiply(_as_float32(block), MAX_SAMPLE)
+    numpy.clip(scaled, -MAX_SAMPLE, MAX_SAMPLE, out=scaled)
+    return scaled
+
+
+def _float_to_int16_numpy(block):
+    return _scale_and_clip(block).astype("<i2").tobytes()
+
+
+def _float_to_int16_into_numpy(block, out):
+    scaled = _scale_and_clip(block)
+    target = numpy.frombuffer(out, dtype="<i2", count=len(scaled))
+    numpy.copyto(target, scaled, casting="unsafe")
+    return target.nbytes
+
+
+@functools.lru_cache(maxsize=8)
+def _int16_struct(count):
+    return struct.Struct(f"<{count}h")
+
+
+def _floats(block):
+    """The samples of `block` as a list of floats, read from its buffer when it has one."""
+    try:
+        view = memoryview(block)
+    except TypeError:
+        return block
+    if view.format not in ("f", "<f"):
+        return block
+    return view.cast("B").cast("f").tolist()
+
+
+def _pack_int16(pack, block, *args):
+    samples = _floats(block)
+    try:
+        return pack(*args, *map(int, map(_SCALE.__mul__, samples)))
+    except struct.error:
+        # At least one sample is out of range, only now pay for clipping.
+        return pack(
+            *args,
+            *[int(min(max(sample, -1.0), 1.0) * MAX_SAMPLE) for sample in samples],
+        )
+
+
+def _float_to_int16_stdlib(block):
+    return _pack_int16(_int16_struct(len(block)).pack, block)
+
+
+def _float_to_int16_into_stdlib(block, out):
+    packer = _int16_struct(len(block))
+    _pack_int16(packer.pack_into, block, out, 0)
+    return packer.size
+
+
+def float_to_int16(block):
+    """Convert a block of floats in the range [-1.0, 1.0] to little-endian 16-bit PCM.
+
+    Samples outside the range are clipped rather than raising like `struct.pack` does.
+    `block` may be any sequence of floats or a float32 buffer (array, ctypes array, memoryview).
+    """
+    if numpy is not None:
+        return _float_to_int16_numpy(block)
+    return _float_to_int16_stdlib(block)
+
+
+def float_to_int16_into(block, out):
+    """Like `float_to_int16`, but writes the PCM into the writable buffer `out`.
+
+    Returns the number of bytes written.
+    """
+    if numpy is not None:
+        return _float_to_int16_into_numpy(block, out)
+    return _float_to_int16_into_stdlib(block, out)
+
+
+def is_silent(block, threshold=SILENCE_THRESHOLD):
+    """Return True if no sample of `block` would be audible once converted."""
+    if not len(block):
+        return True
+    if numpy is not None:
+        return bool(numpy.abs(_as_float32(block)).max() < threshold)
+    samples = _floats(block)
+    return (max(samples) < threshold) and (min(samples) > -threshold)
@@ -0,0 +1,170 @@
+# coding: utf-8
+
+# A persistent cache of decoded sounds.
+# Each entry holds the raw float32 samples of one sound file behind a small header,
+# and is keyed by the file's absolute path, size and modification time,
+# so editing or replacing a sound invalidates its entry.
+# Sounds stored under a `compact.StoragePolicy` get entries of their own, named by its variant.
+# Hits are memory-mapped rather than read, and the least recently used entries are
+# removed once the cache grows past its size limit.
+# This module has no dependency on NVDA.
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from contextlib import suppress
+from .decoder import DecodedSound, decode
+
+# Bump this when the layout of entries changes, old entries are then never hit again.
+CACHE_VERSION = 1
+ENTRY_SUFFIX = ".pcm"
+# magic, channels, sample rate, frames
+_HEADER = struct.Struct("<4sIII")
+_MAGIC = b"APCM"
+
+
+class PCMCache(object):
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for path, size, mtime in self._entries())
+
+    def _entries(self):
+        """Yield (path, size, mtime) for every entry, in no particular order."""
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(ENTRY_SUFFIX) and entry.is_file():
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def entry_path(self, filename, variant=""):
+        stat = os.stat(filename)
+        key = "\0".join(
+            (
+                str(CACHE_VERSION),
+                os.path.normcase(os.path.abspath(filename)),
+                str(stat.st_size),
+                str(stat.st_mtime_ns),
+                variant,
+            )
+        )
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + ENTRY_SUFFIX)
+
+    def get(self, filename, variant=""):
+        """Return the cached `DecodedSound` of `filename`, or None.
+
+        The samples are a copy-on-write mapping of the entry, writable but never written back.
+        """
+        path = self.entry_path(filename, variant)
+        try:
+            with open(path, "rb") as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (OSError, ValueError):
+            # Missing, or empty.
+            return None
+        if len(mapping) < _HEADER.size:
+            mapping.close()
+            return None
+        magic, channels, sample_rate, frames = _HEADER.unpack_from(mapping)
+        if (magic != _MAGIC) or (len(mapping) != _HEADER.size + frames * channels * 4):
+            mapping.close()
+            return None
+        with self._lock:
+            self.hits += 1
+        # Hits count as uses for the eviction order.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        samples = memoryview(mapping)[_HEADER.size :].cast("f")
+        return DecodedSound(samples, channels, sample_rate)
+
+    def put(self, filename, decoded, variant=""):
+        path = self.entry_path(filename, variant)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(
+                    _HEADER.pack(
+                        _MAGIC, decoded.channels, decoded.sample_rate, decoded.frames
+                    )
+                )
+                f.write(memoryview(decoded.samples).cast("B"))
+        except OSError:
+            with suppress(OSError):
+                os.remove(temp_path)
+            raise
+        size = os.path.getsize(temp_path)
+        try:
+            # Another thread may have stored the same sound meanwhile.
+            size -= os.path.getsize(path)
+        except OSError:
+            pass
+        os.replace(temp_path, path)
+        with self._lock:
+            self.size += size
+        self.evict()
+
+    def load(self, filename, variant="", transform=None):
+        """Return the decoded samples of `filename`, decoding and storing them on a miss.
+
+        `transform`, if given, is applied to freshly decoded samples before they are stored under `variant`.
+        """
+        decoded = self.get(filename, variant)
+        if decoded is not None:
+            return decoded
+        with self._lock:
+            self.misses += 1
+        decoded = decode(filename)
+        if transform is not None:
+            decoded = transform(decoded)
+        try:
+            self.put(filename, decoded, variant)
+        except OSError:
+            # A full or read-only disk only costs us the cache.
+            pass
+        return decoded
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in `max_bytes`."""
+        with self._lock:
+            if self.size <= self.max_bytes:
+                return
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            self.size = sum(entry[1] for entry in entries)
+            for path, size, mtime in entries:
+                if self.size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Still mapped by a sound on Windows, try again next time.
+                    continue
+                self.size -= size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            for path, size, mtime in list(self._entries()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self.size -= size
+
+    def stats(self):
+        return {
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
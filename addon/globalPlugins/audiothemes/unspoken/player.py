@@ -0,0 +1,234 @@
+# coding: utf-8
+
+# Unspoken user interface feedback for NVDA
+# By Bryan Smart (bryansmart@bryansmart.com) and Austin Hicks (camlorn38@gmail.com)
+# Modified for use with the audio themes add-on by Musharraf Omer
+
+import os
+import time
+import dataclasses
+import functools
+import weakref
+import controlTypes
+import NVDAObjects
+import synthDriverHandler
+import speech
+import speech.sayAll as sayAllHandler
+from logHandler import log
+
+from . import clamp, latency, loader, location_to_angles, mixer
+from .backends import StealPolicy, create_backend
+from .packed import PackedTheme
+
+
+@dataclasses.dataclass
+class UnspokenPlayer:
+    """Wraps the funcionality of the unspoken add-on."""
+
+    audio3d: bool = True
+    use_in_say_all: bool = True
+    speak_roles: bool = True
+    use_synth_volume: bool = True
+    volume: int = 100
+    # How many sounds can play at once, and which one to cut when more are requested.
+    voices: int = 4
+    voice_stealing: StealPolicy = StealPolicy.oldest
+    # The audio engine, one of `backends.BACKENDS`.
+    backend_name: str = "libaudioverse"
+
+    def __post_init__(self):
+        backend_options = dict(
+            block_size=1024, voices=self.voices, voice_stealing=self.voice_stealing
+        )
+        try:
+            self.backend = create_backend(self.backend_name, **backend_options)
+        except ImportError:
+            # The NumPy backend in an NVDA without NumPy, the add-on still has to load.
+            log.exception(
+                f"Could not load the {self.backend_name} audio backend, using libaudioverse"
+            )
+            self.backend_name = "libaudioverse"
+            self.backend = create_backend(self.backend_name, **backend_options)
+        # Hook to keep NVDA from announcing roles.
+        self._NVDA_getSpeechTextForProperties = speech.getPropertiesSpeech
+        speech.getPropertiesSpeech = self._hook_getPropertiesSpeech
+        self._last_played_object = None
+        self._last_played_time = 0
+        # A `soundcache.SoundCache` shared by every theme, see set_sound_cache.
+        self.sound_cache = None
+        # the mixer feeds us through NVDA.
+        self.mixer = None
+        if self.backend.needs_output:
+            self.mixer = mixer.Mixer(self.backend, 1)
+            self.backend.on_start = self.mixer.wake
+            self.backend.on_idle = self.mixer.idle
+        self._precompute_desktop_dimentions()
+
+    def configure_voices(self, voices, voice_stealing):
+        self.voices = voices
+        self.voice_stealing = voice_stealing
+        self.backend.configure_voices(voices, voice_stealing)
+
+    def configure_binaural_cache(self, enabled, max_bytes):
+        """Turn the pre-rendered binaural cache on or off."""
+        self.backend.configure_binaural_cache(enabled, max_bytes)
+
+    def prefetch(self, sounds):
+        """Let the backend prepare the sounds of a newly loaded theme."""
+        self.backend.prefetch(sounds)
+
+    def invalidate(self, sounds):
+        """Let the backend prepare sounds reloaded from changed files, dropping what it kept of them."""
+        self.backend.invalidate(sounds)
+
+    def set_pcm_cache(self, pcm_cache):
+        """Decode sounds through `pcm_cache`, a `pcmcache.PCMCache`, or directly if it is None."""
+        self.backend.pcm_cache = pcm_cache
+
+    def set_storage(self, storage):
+        """Store sounds loaded from now on under `storage`, a `compact.StoragePolicy`."""
+        self.backend.storage = storage
+
+    @property
+    def storage(self):
+        """The `compact.StoragePolicy` sounds are loaded under."""
+        return self.backend.storage
+
+    def sound_size(self, sound):
+        """Bytes of memory held by a loaded sound."""
+        return self.backend.sound_size(sound)
+
+    def set_sound_cache(self, sound_cache):
+        """Reuse sounds loaded earlier through `sound_cache`, or always load them if it is None."""
+        self.sound_cache = sound_cache
+
+    def make_sound_object(self, filename):
+        """Decode a sound file with the current backend."""
+        if self.sound_cache is not None:
+            return self.sound_cache.load(filename)
+        return self.backend.load_sound(filename)
+
+    def load_sounds(self, sound_files):
+        """Load (key, path) pairs, returns `loader.load_sounds`'s (sounds, errors).
+
+        With a sound cache, files with identical content are loaded once and share one sound.
+        """
+        sound_cache = self.sound_cache
+        if sound_cache is None:
+            return loader.load_sounds(self.backend, sound_files)
+        cached, missing = {}, []
+        # content key -> the first key loading it, and key -> that first key for the others.
+        first, duplicates = {}, {}
+        for key, path in sound_files:
+            sound = sound_cache.get(path)
+            if sound is not None:
+                cached[key] = sound
+                continue
+            try:
+                content = sound_cache.key(path)
+            except OSError:
+                content = None
+            if content in first:
+                duplicates[key] = first[content]
+                continue
+            if content is not None:
+                first[content] = key
+            missing.append((key, path))
+        sounds, errors = loader.load_sounds(self.backend, missing)
+        paths = dict(missing)
+        for key, sound in sounds.items():
+            sound_cache.put(paths[key], sound)
+        for key, original in duplicates.items():
+            if original in sounds:
+                sounds[key] = sounds[original]
+            else:
+                errors[key] = errors[original]
+        sounds.update(cached)
+        return sounds, errors
+
+    def load_member(self, archive, name):
+        """Decode a member of an `archive.ThemeArchive` with the current backend."""
+        return loader.load_member(self.backend, archive, name)
+
+    def load_members(self, archive, members):
+        """Load (key, member name) pairs of `archive`, returns (sounds, errors)."""
+        return loader.load_members(self.backend, archive, members)
+
+    def load_packed(self, filename):
+        """Load every sound of a packed theme file, returns a dict mapping roles to sounds."""
+        pack = PackedTheme(filename)
+        sounds = {}
+        for role in pack.roles:
+            source = functools.partial(pack.decoded, role)
+            sound = self.backend.load_decoded(
+                f"{filename}#{role}", self.backend.compact(source())
+            )
+            sound.source = source
+            sounds[role] = sound
+        return sounds
+
+    def shouldNukeRoleSpeech(self):
+        if self.use_in_say_all and sayAllHandler.isRunning():
+            return False
+        if self.speak_roles:
+            return False
+        return True
+
+    def _hook_getPropertiesSpeech(
+        self, reason=controlTypes.OutputReason.QUERY, *args, **kwargs
+    ):
+        role = kwargs.get("role", None)
+        if role:
+            if self.shouldNukeRoleSpeech():
+                # NVDA will not announce roles if we put it in as _role.
+                kwargs["_role"] = kwargs["role"]
+                del kwargs["role"]
+        return self._NVDA_getSpeechTextForProperties(reason, *args, **kwargs)
+
+    def _compute_volume(self):
+        if not self.use_synth_volume:
+            return clamp(self.volume / 100, 0.0, 1.0)
+        driver = synthDriverHandler.getSynth()
+        volume = getattr(driver, "volume", 100) / 100.0  # nvda reports as percent.
+        volume = clamp(volume, 0.0, 1.0)
+        return volume
+
+    def play(self, obj, sound, trace=None, priority=0, gain=1.0):
+        """Play `sound` at the location of `obj`, `gain` multiplies the volume, see `loudness`."""
+        curtime = time.time()
+        _last_ref = None if not self._last_played_object else self._last_played_object()
+        if (curtime - self._last_played_time < 0.1) and (obj is _last_ref):
+            return
+        self._last_played_object = weakref.ref(obj)
+        self._last_played_time = curtime
+        self._play_object(obj, sound, trace, priority, gain)
+
+    def _play_object(self, obj, sound, trace=None, priority=0, gain=1.0):
+        # Objects without location are assumed in the center of the screen.
+        location = obj.location if self.audio3d else None
+        angle_x, angle_y = location_to_angles(
+            location, self.desktop_max_x, self.desktop_max_y
+        )
+        voice = self.backend.play(
+            sound, angle_x, angle_y, self._compute_volume() * gain, priority
+        )
+        if voice is None:
+            return
+        if self.mixer is not None:
+            latency.stamp(trace, "connected")
+            self.mixer.track(trace)
+        else:
+            # Nothing will be rendered, the trace ends here.
+            latency.finish(trace, "connected")
+
+    def _precompute_desktop_dimentions(self):
+        self.desktop = NVDAObjects.api.getDesktopObject()
+        self.desktop_max_x = self.desktop.location[2]
+        self.desktop_max_y = self.desktop.location[3]
+
+    def play_file(self, filepath):
+        sound = self.make_sound_object(os.path.abspath(filepath))
+        self.backend.play_preview(sound)
+
+    def close(self):
+        self.backend.close()
@@ -0,0 +1,88 @@
+# coding: utf-8
+
+# A fixed capacity ring of PCM blocks.
+# Shared between exactly one producer thread (the mixer's feeder) and one consumer thread (the player).
+# Blocks are immutable bytes, which nvwave needs anyway, so the player feeds them without copying.
+# Each index is only ever advanced by one side, so the fast path takes no lock at all.
+# The events are only touched when a side has to wait for the other.
+
+import threading
+
+
+class PCMRing(object):
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._tags = [None] * capacity
+        # Both indices only grow, their difference is the occupancy.
+        self._write_index = 0
+        self._read_index = 0
+        self._space_available = threading.Event()
+        self._data_available = threading.Event()
+        self.underruns = 0
+        self.producer_waits = 0
+        self.peak_occupancy = 0
+        self.blocks_written = 0
+
+    @property
+    def occupancy(self):
+        return self._write_index - self._read_index
+
+    def acquire_write(self, timeout=None):
+        """Wait while the ring is full, returns False if no slot became free within `timeout` seconds."""
+        if self.occupancy >= self.capacity:
+            self.producer_waits += 1
+            self._space_available.clear()
+            # Check again, the consumer may have released a slot before we cleared the event.
+            if self.occupancy >= self.capacity:
+                if not self._space_available.wait(timeout):
+                    return False
+        return True
+
+    def commit_write(self, block, tag=None):
+        """Publish `block`, a bytes object, in the slot the last `acquire_write` waited for.
+
+        `tag` is handed back to the consumer when it releases the slot.
+        """
+        index = self._write_index % self.capacity
+        self._slots[index] = block
+        self._tags[index] = tag
+        self._write_index += 1
+        self.blocks_written += 1
+        self.peak_occupancy = max(self.peak_occupancy, self.occupancy)
+        self._data_available.set()
+
+    def acquire_read(self, timeout=None):
+        """Return the oldest block, waiting while the ring is empty.
+
+        Returns None, and counts an underrun, if nothing arrived within `timeout` seconds.
+        """
+        if not self.occupancy:
+            self._data_available.clear()
+            if not self.occupancy:
+                if not self._data_available.wait(timeout):
+                    self.underruns += 1
+                    return None
+        return self._slots[self._read_index % self.capacity]
+
+    def release_read(self):
+        """Hand the slot returned by the last `acquire_read` back to the producer.
+
+        Returns the tag the slot was committed with.
+        """
+        index = self._read_index % self.capacity
+        self._slots[index] = None
+        tag, self._tags[index] = self._tags[index], None
+        self._read_index += 1
+        self._space_available.set()
+        return tag
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "occupancy": self.occupancy,
+            "peak_occupancy": self.peak_occupancy,
+            "blocks_written": self.blocks_written,
+            "underruns": self.underruns,
+            "producer_waits": self.producer_waits,
+        }
@@ -0,0 +1,117 @@
+# coding: utf-8
+
+# A cache of loaded sounds, kept in memory across themes.
+# Entries are keyed by a hash of the file's content, so the same sound shipped by two themes,
+# or previewed again and again in the studio, is only decoded once,
+# and by the storage variant of the backend, so a change of `compact.StoragePolicy` is a miss.
+# Hashing a file is much cheaper than decoding it, and each file is only hashed again
+# when its size or modification time changes. Hard links to one file, such as sounds shared
+# between themes by the sound store, are hashed once.
+# The least recently used sounds are dropped once the cache holds more than its budget.
+# This module has no dependency on NVDA.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+def content_hash(filename, chunk_size=64 * 1024):
+    digest = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SoundCache(object):
+    """Sounds loaded by one backend, keyed by content hash, capped at `max_bytes`."""
+
+    def __init__(self, backend, max_bytes=64 * 1024 * 1024):
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # (content hash, storage variant) -> (Sound, size in bytes), least recently used first.
+        self._entries = OrderedDict()
+        # (file identity, size, mtime) -> content hash
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def key(self, filename):
+        stat = os.stat(filename)
+        if stat.st_ino:
+            identity = (stat.st_dev, stat.st_ino)
+        else:
+            identity = os.path.normcase(os.path.abspath(filename))
+        stamp = (identity, stat.st_size, stat.st_mtime_ns)
+        digest = self._hashes.get(stamp)
+        if digest is None:
+            digest = self._hashes[stamp] = content_hash(filename)
+        return digest, self.backend.storage_variant
+
+    def get(self, filename):
+        """Return the cached sound of `filename`, or None."""
+        try:
+            key = self.key(filename)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, filename, sound):
+        try:
+            key = self.key(filename)
+        except OSError:
+            return
+        size = self.backend.sound_size(sound)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._entries[key] = (sound, size)
+            self.size += size
+            self._evict()
+
+    def load(self, filename):
+        """Return the sound of `filename`, loading it with the backend on a miss."""
+        sound = self.get(filename)
+        if sound is None:
+            sound = self.backend.load_sound(filename)
+            self.put(filename, sound)
+        return sound
+
+    def _evict(self):
+        while (self.size > self.max_bytes) and self._entries:
+            key, (sound, size) = self._entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._hashes.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,206 @@
+# coding: utf-8
+
+# A fixed pool of voices, so that several sounds can play at once.
+# Each voice owns two buffer nodes that stay connected for the lifetime of the pool:
+# one feeding an HRTF panner, and one connected straight to the simulation for sounds that need no panning.
+# Playing a sound is just a matter of pointing one of them at a buffer.
+# When every voice is busy one of them is stolen according to a policy.
+# Every start of a voice bumps its generation, which the end callback of that start carries,
+# so a late callback of an earlier sound is told apart from the end of the current one.
+
+import threading
+import time
+from collections import deque
+from . import libaudioverse
+from .backends import StealPolicy, choose_voice
+
+
+class Voice(object):
+    def __init__(self, simulation, on_end):
+        self.spatial_node = libaudioverse.BufferNode(simulation)
+        self.panner = libaudioverse.HrtfNode(simulation, "default")
+        self.panner.should_crossfade = False
+        self.spatial_node.connect(0, self.panner, 0)
+        self.panner.connect_simulation(0)
+        self.direct_node = libaudioverse.BufferNode(simulation)
+        self.direct_node.connect_simulation(0)
+        # Idle outputs are paused so the simulation does not process them.
+        for output in (self.panner, self.direct_node):
+            output.state = libaudioverse.NodeStates.paused
+        self.output = None
+        # Called with (node, voice, generation) from Libaudioverse's callback thread.
+        self.on_end = on_end
+        self.generation = 0
+        # Callbacks of earlier starts may still be queued by Libaudioverse, their ctypes objects must stay alive.
+        self._previous_callbacks = deque(maxlen=4)
+        self.started_at = 0.0
+        self.ends_at = 0.0
+        self.gain = 0.0
+        self.priority = 0
+
+    @property
+    def nodes(self):
+        return (self.spatial_node, self.direct_node)
+
+    def is_playing(self, now):
+        return now < self.ends_at
+
+    def loudness(self, now):
+        duration = self.ends_at - self.started_at
+        if duration <= 0:
+            return 0.0
+        return self.gain * max(self.ends_at - now, 0.0) / duration
+
+    def start(self, now, sound, gain, priority, azimuth=None, elevation=0.0):
+        """Start playing `sound`, through the HRTF panner unless `azimuth` is None."""
+        if azimuth is None:
+            node = output = self.direct_node
+        else:
+            node, output = self.spatial_node, self.panner
+            self.panner.azimuth = azimuth
+            self.panner.elevation = elevation
+        if (self.output is not None) and (self.output is not output):
+            self.output.state = libaudioverse.NodeStates.paused
+        output.mul = gain
+        self.generation += 1
+        previous = node._state["callbacks"].get("end")
+        if previous is not None:
+            self._previous_callbacks.append(previous)
+        node.set_end_callback(self.on_end, additional_args=(self, self.generation))
+        # Setting the buffer also rewinds the node.
+        node.buffer = sound.buffer
+        output.state = libaudioverse.NodeStates.playing
+        self.output = output
+        self.started_at = now
+        self.ends_at = now + sound.duration
+        self.gain = gain
+        self.priority = priority
+
+    def set_gain(self, gain):
+        self.gain = gain
+        if self.output is not None:
+            self.output.mul = gain
+
+    def stop(self):
+        if self.output is not None:
+            self.output.state = libaudioverse.NodeStates.paused
+        self.ends_at = 0.0
+
+    def destroy(self):
+        self.stop()
+        self.panner.isolate()
+        self.direct_node.isolate()
+
+
+class VoicePool(object):
+    """A fixed number of voices plus one reserved for previews."""
+
+    def __init__(
+        self,
+        simulation,
+        size,
+        policy=StealPolicy.oldest,
+        on_start=None,
+        on_idle=None,
+        clock=time.time,
+    ):
+        self.simulation = simulation
+        self.policy = policy
+        # Called when a voice starts, and when the last playing voice has ended.
+        self.on_start = on_start
+        self.on_idle = on_idle
+        # Offline rendering runs faster than real time and passes its own clock.
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.voices = []
+        self.preview_voice = self._make_voice()
+        self.steals = 0
+        self.drops = 0
+        self.resize(size)
+
+    def _make_voice(self):
+        return Voice(self.simulation, self._on_voice_end)
+
+    def resize(self, size):
+        size = max(size, 1)
+        with self._lock:
+            while len(self.voices) < size:
+                self.voices.append(self._make_voice())
+            while len(self.voices) > size:
+                self.voices.pop().destroy()
+
+    @property
+    def active_count(self):
+        now = self.clock()
+        return sum(
+            voice.is_playing(now) for voice in self.voices + [self.preview_voice]
+        )
+
+    def _choose_voice(self, priority, now):
+        voice = choose_voice(self.voices, self.policy, priority, now)
+        if (voice is not None) and voice.is_playing(now):
+            self.steals += 1
+        return voice
+
+    def play(self, sound, azimuth, elevation, gain, priority=0):
+        """Play `sound` at the given angles, returns the voice or None if the sound was dropped.
+
+        Pass None as the azimuth for sounds that are already spatialized.
+        """
+        with self._lock:
+            now = self.clock()
+            voice = self._choose_voice(priority, now)
+            if voice is None:
+                self.drops += 1
+                return None
+            voice.start(now, sound, gain, priority, azimuth, elevation)
+            self._notify(self.on_start)
+        return voice
+
+    def play_preview(self, sound, gain=1.0):
+        """Play `sound` without spatialization, cutting the previous preview."""
+        with self._lock:
+            self.preview_voice.start(self.clock(), sound, gain, priority=0)
+            self._notify(self.on_start)
+        return self.preview_voice
+
+    def set_gain(self, voice, gain):
+        with self._lock:
+            voice.set_gain(gain)
+
+    def stop(self, voice):
+        with self._lock:
+            voice.stop()
+            if not self.active_count:
+                self._notify(self.on_idle)
+
+    def stop_all(self):
+        with self._lock:
+            for voice in self.voices + [self.preview_voice]:
+                voice.stop()
+            self._notify(self.on_idle)
+
+    def _on_voice_end(self, node, voice, generation):
+        # Called from Libaudioverse's callback thread.
+        # The callback may arrive late, after the voice has been given a new sound.
+        # It may also arrive before ends_at, the mixer renders ahead of the wall clock.
+        with self._lock:
+            if generation != voice.generation:
+                return
+            voice.stop()
+            if not self.active_count:
+                self._notify(self.on_idle)
+
+    @staticmethod
+    def _notify(callback):
+        # Always called with the lock held, so a start and an idle notification can never cross.
+        if callback is not None:
+            callback()
+
+    def stats(self):
+        return {
+            "voices": len(self.voices),
+            "active": self.active_count,
+            "steals": self.steals,
+            "drops": self.drops,
+        }
@@ -0,0 +1,229 @@
+# coding: utf-8
+
+# Copyright (c) 2014-2019 Musharraf Omer
+# This file is covered by the GNU General Public License.
+
+# Watching theme directories for changes made by other programs.
+# Each watched directory is summarized by a snapshot, mapping the name of every entry
+# to its size and modification time, and changes are found by comparing snapshots.
+# The polling watcher takes a new snapshot of every directory at a fixed interval and runs anywhere.
+# On Windows, change notifications tell which directory to look at, so nothing is scanned while idle.
+# Changes are debounced: they are reported in one batch once the directories have been quiet for a while,
+# so an editor saving a file in several steps only triggers one reload.
+# With share_sounds on, sound files may be linked to other themes, see `soundstore`:
+# an edited sound has to be saved under a new name and renamed over the old one, not saved in place.
+# This module has no dependency on NVDA.
+
+import os
+import sys
+import threading
+import time
+
+
+def snapshot(directory):
+    """Map the name of every entry of `directory` to a stamp that changes when the entry does."""
+    entries = {}
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        # A directory changes with its content, only its identity matters here.
+                        entries[entry.name] = ("dir", entry.inode())
+                    else:
+                        stat = entry.stat()
+                        entries[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return entries
+
+
+def diff(before, after):
+    """Return the names added, removed or changed between two snapshots."""
+    return {
+        name
+        for name in before.keys() | after.keys()
+        if before.get(name) != after.get(name)
+    }
+
+
+class PollingWatcher(object):
+    """Calls `callback` with a dict of directory -> set of changed names, from a thread of its own."""
+
+    def __init__(self, callback, interval=1.0, debounce=0.5):
+        self.callback = callback
+        self.interval = interval
+        self.debounce = debounce
+        # directory -> snapshot
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def watch(self, directories):
+        """Watch exactly `directories`, changes that happened before this call are not reported."""
+        directories = {os.path.normpath(directory) for directory in directories}
+        with self._lock:
+            for directory in set(self._snapshots).difference(directories):
+                del self._snapshots[directory]
+            for directory in directories.difference(self._snapshots):
+                self._snapshots[directory] = snapshot(directory)
+        self._directories_changed()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _directories_changed(self):
+        """Called when the set of watched directories changes."""
+
+    def _wait(self, timeout):
+        """Wait up to `timeout` seconds and return the directories that may have changed."""
+        self._stop.wait(timeout)
+        with self._lock:
+            return list(self._snapshots)
+
+    def _rescan(self, directory):
+        current = snapshot(directory)
+        with self._lock:
+            if directory not in self._snapshots:
+                # No longer watched.
+                return set()
+            changed = diff(self._snapshots[directory], current)
+            self._snapshots[directory] = current
+        return changed
+
+    def _run(self):
+        pending = {}
+        last_change = 0.0
+        while not self._stop.is_set():
+            timeout = min(self.interval, self.debounce) if pending else self.interval
+            for directory in self._wait(timeout):
+                changed = self._rescan(directory)
+                if changed:
+                    pending.setdefault(directory, set()).update(changed)
+                    last_change = time.monotonic()
+            if pending and (time.monotonic() - last_change >= self.debounce):
+                batch, pending = pending, {}
+                if not self._stop.is_set():
+                    self.callback(batch)
+        self._close()
+
+    def _close(self):
+        pass
+
+
+if sys.platform == "win32":
+    import ctypes
+    from ctypes import wintypes
+
+    _kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    _kernel32.FindFirstChangeNotificationW.restype = wintypes.HANDLE
+    _kernel32.FindFirstChangeNotificationW.argtypes = [
+        wintypes.LPCWSTR,
+        wintypes.BOOL,
+        wintypes.DWORD,
+    ]
+    _kernel32.FindNextChangeNotification.argtypes = [wintypes.HANDLE]
+    _kernel32.FindCloseChangeNotification.argtypes = [wintypes.HANDLE]
+    _kernel32.WaitForMultipleObjects.restype = wintypes.DWORD
+    _kernel32.WaitForMultipleObjects.argtypes = [
+        wintypes.DWORD,
+        ctypes.POINTER(wintypes.HANDLE),
+        wintypes.BOOL,
+        wintypes.DWORD,
+    ]
+    _INVALID_HANDLE_VALUE = wintypes.HANDLE(-1).value
+    _FILE_NOTIFY_CHANGE_FILE_NAME = 0x1
+    _FILE_NOTIFY_CHANGE_DIR_NAME = 0x2
+    _FILE_NOTIFY_CHANGE_SIZE = 0x8
+    _FILE_NOTIFY_CHANGE_LAST_WRITE = 0x10
+    _NOTIFY_FILTER = (
+        _FILE_NOTIFY_CHANGE_FILE_NAME
+        | _FILE_NOTIFY_CHANGE_DIR_NAME
+        | _FILE_NOTIFY_CHANGE_SIZE
+        | _FILE_NOTIFY_CHANGE_LAST_WRITE
+    )
+    _WAIT_OBJECT_0 = 0
+    # WaitForMultipleObjects takes at most 64 handles.
+    _MAXIMUM_WAIT_OBJECTS = 64
+
+    class NotificationWatcher(PollingWatcher):
+        """Waits on Windows change notifications instead of scanning every interval.
+
+        Directories that can not be watched this way, such as missing ones, are polled.
+        """
+
+        def __init__(self, callback, interval=1.0, debounce=0.5):
+            super().__init__(callback, interval, debounce)
+            # directory -> notification handle, only touched by the watcher thread.
+            self._handles = {}
+            self._rebuild = threading.Event()
+
+        def _directories_changed(self):
+            self._rebuild.set()
+
+        def _close_handles(self):
+            for handle in self._handles.values():
+                _kernel32.FindCloseChangeNotification(handle)
+            self._handles.clear()
+
+        def _open_handles(self, directories):
+            self._close_handles()
+            for directory in directories[:_MAXIMUM_WAIT_OBJECTS]:
+                handle = _kernel32.FindFirstChangeNotificationW(
+                    directory, False, _NOTIFY_FILTER
+                )
+                if handle and (handle != _INVALID_HANDLE_VALUE):
+                    self._handles[directory] = handle
+
+        def _wait(self, timeout):
+            with self._lock:
+                directories = list(self._snapshots)
+            if self._rebuild.is_set() or (not self._handles and directories):
+                self._rebuild.clear()
+                self._open_handles(directories)
+            polled = [
+                directory for directory in directories if directory not in self._handles
+            ]
+            if not self._handles:
+                self._stop.wait(timeout)
+                return polled
+            watched = list(self._handles)
+            handles = (wintypes.HANDLE * len(watched))(
+                *(self._handles[directory] for directory in watched)
+            )
+            # Wake up at least every `timeout` seconds to notice stop requests.
+            result = _kernel32.WaitForMultipleObjects(
+                len(watched), handles, False, int(timeout * 1000)
+            )
+            index = result - _WAIT_OBJECT_0
+            if 0 <= index < len(watched):
+                directory = watched[index]
+                if not _kernel32.FindNextChangeNotification(self._handles[directory]):
+                    # The directory went away, it is polled until it comes back.
+                    _kernel32.FindCloseChangeNotification(self._handles.pop(directory))
+                polled.append(directory)
+            return polled
+
+        def _close(self):
+            self._close_handles()
+
+    Watcher = NotificationWatcher
+else:
+    Watcher = PollingWatcher
+
+
+def create_watcher(callback, interval=1.0, debounce=0.5, native=True):
+    """Create the best watcher for this platform, or a polling one if `native` is False."""
+    factory = Watcher if native else PollingWatcher
+    return factory(callback, interval=interval, debounce=debounce)
@@ -0,0 +1,144 @@
+# coding: utf-8
+
+# Copyright (c) 2014-2019 Musharraf Omer
+# This file is covered by the GNU General Public License.
+
+"""
+Compares the CPU cost per play of the live HRTF path and of the pre-rendered binaural cache.
+
+A synthetic sound is played repeatedly, at a new position each time, and the simulation is
+rendered block by block as the mixer would. The live mode sends every play through an
+HrtfNode, the cached mode plays a stereo buffer rendered once beforehand, which is what
+a cache hit does. Needs the Libaudioverse DLLs, so it only runs on Windows.
+
+Usage: python benchmarks/binaural_cache.py [plays]
+"""
+
+import ctypes
+import math
+import os
+import random
+import sys
+import time
+from array import array
+
+UNSPOKEN_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.pardir,
+    "addon",
+    "globalPlugins",
+    "audiothemes",
+    "unspoken",
+)
+sys.path.insert(0, os.path.abspath(UNSPOKEN_DIRECTORY))
+import libaudioverse
+
+BLOCK_SIZE = 1024
+SAMPLE_RATE = 44100
+SOUND_DURATION = 0.25
+# Roughly one sound per focus change while arrowing through a list.
+PLAY_INTERVAL = 0.1
+
+
+def make_sound(simulation):
+    frames = int(SOUND_DURATION * SAMPLE_RATE)
+    samples = array("f", (random.uniform(-0.5, 0.5) for i in range(frames)))
+    buffer = libaudioverse.Buffer(simulation)
+    buffer.load_from_array(SAMPLE_RATE, 1, frames, samples)
+    return buffer
+
+
+def render_stereo(simulation, source, azimuth, elevation):
+    """Render `source` through the HRTF into a stereo buffer, the way `BinauralCache` does."""
+    node = libaudioverse.BufferNode(simulation)
+    panner = libaudioverse.HrtfNode(simulation, "default")
+    panner.should_crossfade = False
+    node.connect(0, panner, 0)
+    panner.connect_simulation(0)
+    panner.azimuth, panner.elevation = azimuth, elevation
+    node.buffer = source
+    render_buffer = (ctypes.c_float * (BLOCK_SIZE * 2))()
+    samples = array("f")
+    blocks = int(math.ceil(SOUND_DURATION * SAMPLE_RATE / BLOCK_SIZE)) + 1
+    for i in range(blocks):
+        samples.frombytes(simulation.get_block_into(render_buffer, 2))
+    panner.isolate()
+    return samples
+
+
+def run(simulation, play, plays):
+    render_buffer = (ctypes.c_float * (BLOCK_SIZE * 2))()
+    blocks_per_play = max(int(PLAY_INTERVAL * SAMPLE_RATE / BLOCK_SIZE), 1)
+    started = time.process_time()
+    for i in range(plays):
+        play(random.uniform(-90, 90), random.uniform(-40, 10))
+        for j in range(blocks_per_play):
+            simulation.get_block_into(render_buffer, 2)
+    return time.process_time() - started
+
+
+def live_mode(plays):
+    simulation = libaudioverse.Simulation(
+        sample_rate=SAMPLE_RATE, block_size=BLOCK_SIZE
+    )
+    source = make_sound(simulation)
+    node = libaudioverse.BufferNode(simulation)
+    panner = libaudioverse.HrtfNode(simulation, "default")
+    panner.should_crossfade = False
+    node.connect(0, panner, 0)
+    panner.connect_simulation(0)
+
+    def play(azimuth, elevation):
+        panner.azimuth, panner.elevation = azimuth, elevation
+        node.buffer = source
+
+    return run(simulation, play, plays)
+
+
+def cached_mode(plays, step=10):
+    simulation = libaudioverse.Simulation(
+        sample_rate=SAMPLE_RATE, block_size=BLOCK_SIZE
+    )
+    source = make_sound(simulation)
+    cells = {}
+    started = time.process_time()
+    for azimuth in range(-90, 91, step):
+        for elevation in range(-40, 11, step):
+            samples = render_stereo(simulation, source, azimuth, elevation)
+            buffer = libaudioverse.Buffer(simulation)
+            buffer.load_from_array(SAMPLE_RATE, 2, len(samples) // 2, samples)
+            cells[azimuth, elevation] = buffer
+    prerender = time.process_time() - started
+    node = libaudioverse.BufferNode(simulation)
+    node.connect_simulation(0)
+
+    def play(azimuth, elevation):
+        cell = (
+            int(round(azimuth / step) * step),
+            int(round(elevation / step) * step),
+        )
+        node.buffer = cells[cell]
+
+    return run(simulation, play, plays), prerender, len(cells)
+
+
+def main(plays=500):
+    libaudioverse.initialize()
+    try:
+        live = live_mode(plays)
+        cached, prerender, cells = cached_mode(plays)
+    finally:
+        libaudioverse.shutdown()
+    print(
+        f"{plays} plays, {SOUND_DURATION * 1000:.0f} ms sound, {BLOCK_SIZE} frame blocks"
+    )
+    print(f"{'live HRTF':<24} {live / plays * 1e6:10.1f} us CPU/play")
+    print(f"{'binaural cache':<24} {cached / plays * 1e6:10.1f} us CPU/play")
+    print(
+        f"pre-rendering {cells} cells took {prerender * 1000:.1f} ms CPU, "
+        f"paid back after {prerender / max(live - cached, 1e-9) * plays:.0f} plays"
+    )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
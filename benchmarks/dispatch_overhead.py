@@ -0,0 +1,203 @@
+# coding: utf-8
+
+# Copyright (c) 2014-2019 Musharraf Omer
+# This file is covered by the GNU General Public License.
+
+"""
+Measures the cost of dispatching an event from `AudioThemesHandler.play` to the audio backend.
+
+This runs outside NVDA: the few NVDA modules the handler and the player import are
+replaced by stand-ins, the configuration is the add-on's defaults, and the handler
+plays a generated theme on the "recording" backend, which makes no sound.
+Every event uses a different fake object, so the player's repeat throttle never kicks in.
+
+Usage: python benchmarks/dispatch_overhead.py [--events 5000] [--backend recording]
+"""
+
+import argparse
+import builtins
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+import types
+
+AUDIOTHEMES_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.pardir,
+    "addon",
+    "globalPlugins",
+    "audiothemes",
+)
+ROLES = range(1, 9)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from theme_load import write_sound
+
+
+class FakeObject(object):
+    """Just enough of an NVDAObject for the player."""
+
+    def __init__(self, role, location=None, parent=None):
+        self.role = role
+        self.location = location
+        self.parent = parent
+        self.previous = None
+        self.next = None
+        self.states = set()
+        self.snd = None
+
+
+class FakeAction(object):
+    def __init__(self):
+        self.handlers = []
+
+    def register(self, handler):
+        self.handlers.append(handler)
+
+    def notify(self, **kwargs):
+        for handler in self.handlers:
+            handler(**kwargs)
+
+
+class FakeConfig(object):
+    def __init__(self, sections):
+        self.spec = {}
+        self.sections = sections
+
+    def __getitem__(self, key):
+        return self.sections[key]
+
+
+def config_defaults(spec):
+    """The default of every option in a configobj `spec`."""
+    defaults = {}
+    for key, value in spec.items():
+        default = re.search(r"default=\s*([^,)]+)", value).group(1).strip()
+        if value.startswith("boolean"):
+            defaults[key] = default == "True"
+        elif value.startswith("integer"):
+            defaults[key] = int(default)
+        else:
+            defaults[key] = default.strip("\"'")
+    return defaults
+
+
+def stub_nvda(config_path, audiothemes_config):
+    """Put stand-ins for the NVDA modules the handler imports into `sys.modules`."""
+
+    def module(name, **attributes):
+        stub = types.ModuleType(name)
+        stub.__dict__.update(attributes)
+        sys.modules[name] = stub
+        return stub
+
+    builtins._ = lambda text: text
+    module(
+        "config",
+        conf=FakeConfig(
+            {"audiothemes": audiothemes_config, "speech": {"outputDevice": None}}
+        ),
+        post_configSave=FakeAction(),
+        post_configReset=FakeAction(),
+        post_configProfileSwitch=FakeAction(),
+    )
+    module(
+        "controlTypes",
+        roleLabels={role: f"role {role}" for role in ROLES},
+        OutputReason=types.SimpleNamespace(QUERY=0),
+    )
+    module("extensionPoints", Action=FakeAction)
+    module("globalVars", appArgs=types.SimpleNamespace(configPath=config_path))
+    module("logHandler", log=logging.getLogger("audiothemes"))
+    module("addonHandler", initTranslation=lambda: None)
+    module(
+        "queueHandler",
+        eventQueue=None,
+        queueFunction=lambda queue, func, *args, **kwargs: func(*args, **kwargs),
+    )
+    desktop = types.SimpleNamespace(location=(0, 0, 1920, 1080))
+    module("NVDAObjects", api=types.SimpleNamespace(getDesktopObject=lambda: desktop))
+    module("synthDriverHandler", getSynth=lambda: types.SimpleNamespace(volume=100))
+    # The headless backends need no output, so the mixer never opens a player.
+    module("nvwave")
+    say_all = module("speech.sayAll", isRunning=lambda: False)
+    module("speech", sayAll=say_all, getPropertiesSpeech=lambda *args, **kwargs: [])
+
+
+def load_handler(config_path, backend):
+    """Import the handler against the stand-ins, with the add-on's default configuration."""
+    audiothemes_config = {}
+    stub_nvda(config_path, audiothemes_config)
+    package = types.ModuleType("audiothemes")
+    package.__path__ = [os.path.abspath(AUDIOTHEMES_DIRECTORY)]
+    sys.modules["audiothemes"] = package
+    from audiothemes import handler
+
+    audiothemes_config.update(config_defaults(handler.audiothemes_config_defaults))
+    # Nothing on disk changes during the run, and the decoded sounds need not be kept.
+    audiothemes_config.update(
+        audio_backend=backend, watch_themes=False, pcm_cache=False
+    )
+    return handler
+
+
+def make_theme(directory):
+    os.makedirs(directory)
+    with open(os.path.join(directory, "info.json"), "w") as info:
+        json.dump(dict(name="Default", author="benchmark", summary=""), info)
+    for role in ROLES:
+        write_sound(os.path.join(directory, f"{role}.wav"), 0.1)
+
+
+def make_objects(count, roles):
+    # A parent that is not a list, so no object is taken for a first or last list item.
+    parent = FakeObject(role=0)
+    return [
+        FakeObject(
+            roles[i % len(roles)],
+            (i * 37 % 1920, i * 53 % 1080, 100, 30),
+            parent,
+        )
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--backend", choices=("recording", "null"), default="recording")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as config_path:
+        handler = load_handler(config_path, args.backend)
+        make_theme(os.path.join(handler.THEMES_HOME, "Default"))
+        themes = handler.AudioThemesHandler()
+        deadline = time.monotonic() + 30
+        while themes.active_theme is None:
+            if time.monotonic() > deadline:
+                raise RuntimeError("The theme did not load")
+            time.sleep(0.01)
+        backend = themes.player.backend
+        print(f"{themes.active_theme.name} theme on the {backend.name} backend")
+        objects = make_objects(args.events, list(ROLES))
+        started = time.perf_counter()
+        for obj in objects:
+            themes.play(obj, obj.role)
+        finished = time.perf_counter()
+        print(
+            f"{args.events} events: {(finished - started) / args.events * 1e6:.1f} us/event, "
+            f"{args.events / (finished - started):.0f} events/s"
+        )
+        if backend.name == "recording":
+            records = list(backend.records)
+            print(f"{backend.plays} plays recorded")
+            span = (records[-1].timestamp - records[0].timestamp) if records else 0
+            if span:
+                print(f"the backend received {len(records) / span:.0f} plays/s")
+        themes.close()
+
+
+if __name__ == "__main__":
+    main()
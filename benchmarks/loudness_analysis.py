@@ -0,0 +1,66 @@
+# coding: utf-8
+
+# Copyright (c) 2014-2019 Musharraf Omer
+# This file is covered by the GNU General Public License.
+
+"""
+Reports the time taken to measure the loudness of a theme's sounds when it is installed.
+
+A theme of generated WAV files is measured the way the installer and the studio do it.
+Pass --pure-python to measure as if NumPy were missing, which is what NVDA does.
+
+Usage: python benchmarks/loudness_analysis.py [--sounds 64] [--pure-python]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import types
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+AUDIOTHEMES_DIRECTORY = os.path.join(
+    BENCHMARKS_DIRECTORY,
+    os.pardir,
+    "addon",
+    "globalPlugins",
+    "audiothemes",
+)
+sys.path.insert(0, BENCHMARKS_DIRECTORY)
+# The add-on package itself needs NVDA, its NVDA-free modules are imported without running its __init__.
+package = types.ModuleType("audiothemes")
+package.__path__ = [os.path.abspath(AUDIOTHEMES_DIRECTORY)]
+sys.modules["audiothemes"] = package
+from audiothemes.unspoken import decoder, loudness
+from theme_load import write_sound
+
+
+def timed(label, func):
+    started = time.perf_counter()
+    results = func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<24} {elapsed * 1000:9.1f} ms, {len(results)} sounds")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sounds", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=0.5)
+    parser.add_argument("--pure-python", action="store_true")
+    args = parser.parse_args()
+    if args.pure_python:
+        decoder.numpy = loudness.numpy = None
+    with tempfile.TemporaryDirectory() as directory:
+        sound_files = []
+        for i in range(args.sounds):
+            filename = os.path.join(directory, f"{i}.wav")
+            write_sound(filename, args.seconds)
+            sound_files.append((i, filename))
+        results = timed("analyze", lambda: loudness.analyze(sound_files)[0])
+        print(f"first sound: {results[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# coding: utf-8
+
+# Copyright (c) 2014-2019 Musharraf Omer
+# This file is covered by the GNU General Public License.
+
+"""
+Renders a scripted burst of events through an audio backend, with no audio device involved,
+and reports how much faster than real time it went.
+
+Sounds are generated on the fly as WAV files, so the numpy backend runs anywhere NumPy does.
+Pass --profile to print the functions the time was spent in.
+
+Usage: python benchmarks/offline_render.py [--backend numpy] [--events 2000] [--profile]
+"""
+
+import argparse
+import cProfile
+import math
+import os
+import pstats
+import random
+import struct
+import sys
+import tempfile
+import wave
+
+AUDIOTHEMES_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.pardir,
+    "addon",
+    "globalPlugins",
+    "audiothemes",
+)
+sys.path.insert(0, os.path.abspath(AUDIOTHEMES_DIRECTORY))
+from unspoken.offline import OfflineRenderer
+
+SAMPLE_RATE = 44100
+ROLES = range(8)
+
+
+def write_tone(filename, frequency, duration=0.15, sample_rate=SAMPLE_RATE):
+    frames = int(duration * sample_rate)
+    # A short fade out keeps the tone from clicking.
+    samples = (
+        int(
+            math.sin(2 * math.pi * frequency * i / sample_rate)
+            * min(1.0, (frames - i) / 200)
+            * 0.5
+            * 32767
+        )
+        for i in range(frames)
+    )
+    with wave.open(filename, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(struct.pack(f"<{frames}h", *samples))
+
+
+def make_events(count, interval):
+    """Events every `interval` seconds on average, all over a 1920x1080 screen."""
+    time = 0.0
+    for i in range(count):
+        time += random.expovariate(1 / interval)
+        location = (random.randrange(1920), random.randrange(1080), 100, 30)
+        yield (time, random.choice(ROLES), location)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", default="numpy")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--block-size", type=int, default=128)
+    parser.add_argument("--voices", type=int, default=4)
+    parser.add_argument("--profile", action="store_true")
+    args = parser.parse_args()
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as directory:
+        renderer = OfflineRenderer(
+            block_size=args.block_size, voices=args.voices, backend=args.backend
+        )
+        for role in ROLES:
+            filename = os.path.join(directory, f"{role}.wav")
+            write_tone(filename, 220 * (1 + role / 4))
+            renderer.load_sound(role, filename)
+        events = list(make_events(args.events, args.interval))
+        output = os.path.join(directory, "render.wav")
+        profiler = cProfile.Profile() if args.profile else None
+        if profiler is not None:
+            profiler.enable()
+        stats = renderer.render(events, output)
+        if profiler is not None:
+            profiler.disable()
+    print(
+        f"{args.backend}: {stats.events} events, {stats.duration:.1f} s of audio "
+        f"in {stats.elapsed:.2f} s, {stats.realtime_factor:.0f}x real time, "
+        f"{stats.steals} steals, {stats.drops} drops"
+    )
+    if profiler is not None:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+
+
+if __name__ == "__main__":
+    main()
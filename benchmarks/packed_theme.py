@@ -0,0 +1,129 @@
+# coding: utf-8
+
+# Copyright (c) 2014-2019 Musharraf Omer
+# This file is covered by the GNU General Public License.
+
+"""
+Compares loading a theme from its sound files with loading it from a packed theme.
+
+A theme of generated WAV files is decoded file by file through an audio backend,
+then packed as float32 and as int16, and every sound is loaded again from each packed file.
+The sounds read back from each packed file are checked against the sound files first.
+Pass --pure-python to decode as if NumPy were missing, which is what NVDA does.
+
+Usage: python benchmarks/packed_theme.py [--backend numpy] [--sounds 64] [--pure-python]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+AUDIOTHEMES_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.pardir,
+    "addon",
+    "globalPlugins",
+    "audiothemes",
+)
+sys.path.insert(0, os.path.abspath(AUDIOTHEMES_DIRECTORY))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from theme_load import write_sound
+from unspoken import decoder, packed
+from unspoken.backends import create_backend
+
+INFO_FILE_NAME = "info.json"
+
+
+def role_of(filename):
+    stem, ext = os.path.splitext(filename)
+    if ext == ".wav":
+        return int(stem)
+
+
+def timed(label, func):
+    started = time.perf_counter()
+    sounds = func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<24} {elapsed * 1000:9.1f} ms, {len(sounds)} sounds")
+    return elapsed
+
+
+def check_round_trip(theme, filename, sample_format):
+    """Raise AssertionError unless every sound of `filename` matches its sound file."""
+    # int16 keeps 15 bits of each sample.
+    tolerance = 0.0 if sample_format == packed.FLOAT32 else 1.5 / 32767
+    with packed.PackedTheme(filename) as pack:
+        for name in os.listdir(theme):
+            role = role_of(name)
+            if role is None:
+                continue
+            expected = decoder.decode(os.path.join(theme, name))
+            actual = pack.decoded(role)
+            assert (actual.frames, actual.channels, actual.sample_rate) == (
+                expected.frames,
+                expected.channels,
+                expected.sample_rate,
+            ), f"{name}: the packed sound has another length or layout"
+            error = max(map(abs, map(float.__sub__, actual.samples, expected.samples)))
+            assert error <= tolerance, f"{name}: samples differ by up to {error}"
+            del actual
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", default="numpy")
+    parser.add_argument("--sounds", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=0.5)
+    parser.add_argument("--pure-python", action="store_true")
+    args = parser.parse_args()
+    if args.pure_python:
+        decoder.numpy = None
+        packed.numpy = None
+    with tempfile.TemporaryDirectory() as directory:
+        theme = os.path.join(directory, "theme")
+        os.mkdir(theme)
+        with open(os.path.join(theme, INFO_FILE_NAME), "w") as f:
+            json.dump({"name": "Benchmark", "author": "me", "summary": ""}, f)
+        for i in range(args.sounds):
+            write_sound(os.path.join(theme, f"{i}.wav"), args.seconds)
+        backend = create_backend(args.backend)
+
+        def from_files():
+            return {
+                role_of(name): backend.load_decoded(
+                    name, decoder.decode(os.path.join(theme, name))
+                )
+                for name in os.listdir(theme)
+                if role_of(name) is not None
+            }
+
+        def from_packed(filename):
+            def load():
+                pack = packed.PackedTheme(filename)
+                return {
+                    role: backend.load_decoded(filename, pack.decoded(role))
+                    for role in pack.roles
+                }
+
+            return load
+
+        baseline = timed("sound files", from_files)
+        for label, sample_format in (
+            ("packed, float32", packed.FLOAT32),
+            ("packed, int16", packed.INT16),
+        ):
+            filename = os.path.join(directory, f"{sample_format}.atp")
+            packed.pack_directory(
+                theme, filename, INFO_FILE_NAME, role_of, sample_format
+            )
+            check_round_trip(theme, filename, sample_format)
+            elapsed = timed(label, from_packed(filename))
+            size = os.path.getsize(filename) // 1024
+            print(f"{'':<24} {baseline / elapsed:9.1f}x faster, {size} KB")
+
+
+if __name__ == "__main__":
+    main()
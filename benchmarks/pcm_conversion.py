@@ -0,0 +1,85 @@
+# coding: utf-8
+
+# Copyright (c) 2014-2019 Musharraf Omer
+# This file is covered by the GNU General Public License.
+
+"""
+Measures the CPU cost of converting one mixer block (1024 stereo frames)
+from Libaudioverse floats to 16-bit PCM.
+
+The legacy code got a list of floats, the backends now render into a ctypes float array.
+
+Usage: python benchmarks/pcm_conversion.py [iterations]
+"""
+
+import ctypes
+import os
+import random
+import struct
+import sys
+import timeit
+
+UNSPOKEN_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.pardir,
+    "addon",
+    "globalPlugins",
+    "audiothemes",
+    "unspoken",
+)
+sys.path.insert(0, os.path.abspath(UNSPOKEN_DIRECTORY))
+import pcm
+
+BLOCK_SIZE = 1024
+CHANNELS = 2
+SAMPLE_RATE = 44100
+BLOCK_PERIOD = BLOCK_SIZE / SAMPLE_RATE
+
+
+def legacy_float_to_int16(block):
+    """The conversion `Mixer.feeder_func` used to do."""
+    max_sample = (1 << 15) - 1
+    for i, j in enumerate(block):
+        block[i] = j * max_sample
+    struct_format = f"{len(block)}h"
+    return struct.pack(struct_format, *(int(i) for i in block))
+
+
+def make_block():
+    return [random.uniform(-1.0, 1.0) for i in range(BLOCK_SIZE * CHANNELS)]
+
+
+def report(label, func, iterations, block=None):
+    if block is None:
+        block = make_block()
+        # The legacy implementation scales the list in place, so give it a fresh copy each time.
+        elapsed = timeit.timeit(lambda: func(list(block)), number=iterations)
+    else:
+        elapsed = timeit.timeit(lambda: func(block), number=iterations)
+    per_block = elapsed / iterations
+    print(
+        f"{label:<24} {per_block * 1e6:10.1f} us/block "
+        f"{per_block / BLOCK_PERIOD * 100:6.2f}% of the block period"
+    )
+
+
+def main(iterations=2000):
+    print(
+        f"{BLOCK_SIZE * CHANNELS} samples per block, "
+        f"{1 / BLOCK_PERIOD:.1f} blocks per second"
+    )
+    block = make_block()
+    assert legacy_float_to_int16(list(block)) == pcm._float_to_int16_stdlib(block)
+    report("struct.pack (legacy)", legacy_float_to_int16, iterations)
+    report("stdlib fallback", pcm._float_to_int16_stdlib, iterations)
+    # What Simulation.get_block_into and the software backend render into.
+    ctypes_block = (ctypes.c_float * len(block))(*block)
+    report("stdlib, ctypes block", pcm._float_to_int16_stdlib, iterations, ctypes_block)
+    if pcm.numpy is not None:
+        report("numpy", pcm._float_to_int16_numpy, iterations)
+    else:
+        print("numpy is not installed, skipping the numpy path")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
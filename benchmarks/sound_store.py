@@ -0,0 +1,134 @@
+# coding: utf-8
+
+# Copyright (c) 2014-2019 Musharraf Omer
+# This file is covered by the GNU General Public License.
+
+"""
+Reports the disk and memory saved by sharing identical sounds between installed themes.
+
+Several themes are generated, each holding some sounds of its own and some copied from a common set,
+the way community themes borrow from the Default theme.
+The sounds of every theme are then moved to the sound store, and loaded once per file,
+then through a sound cache, which keeps one sound for identical files.
+
+Usage: python benchmarks/sound_store.py [--backend numpy] [--themes 8] [--sounds 32] [--copied 0.5]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+AUDIOTHEMES_DIRECTORY = os.path.join(
+    BENCHMARKS_DIRECTORY,
+    os.pardir,
+    "addon",
+    "globalPlugins",
+    "audiothemes",
+)
+sys.path.insert(0, BENCHMARKS_DIRECTORY)
+# The add-on package itself needs NVDA, its NVDA-free modules are imported without running its __init__.
+package = types.ModuleType("audiothemes")
+package.__path__ = [os.path.abspath(AUDIOTHEMES_DIRECTORY)]
+sys.modules["audiothemes"] = package
+from audiothemes.soundstore import SoundStore, STORE_DIRECTORY_NAME
+from audiothemes.unspoken.backends import create_backend
+from audiothemes.unspoken.soundcache import SoundCache
+from theme_load import write_sound
+
+
+def disk_usage(directory):
+    """Bytes taken by the files under `directory`, counting each hard linked file once."""
+    seen = set()
+    total = 0
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            stat = os.stat(os.path.join(root, name))
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    return total
+
+
+def sound_files(themes_home):
+    for root, dirs, files in os.walk(themes_home):
+        if os.path.basename(root) != STORE_DIRECTORY_NAME:
+            for name in files:
+                yield os.path.join(root, name)
+
+
+def memory_usage(backend, themes_home, share):
+    """Bytes held by the sounds of every theme, loaded through a sound cache if `share`."""
+    if not share:
+        return sum(
+            backend.sound_size(backend.load_sound(filename))
+            for filename in sound_files(themes_home)
+        )
+    cache = SoundCache(backend, max_bytes=1 << 40)
+    for filename in sound_files(themes_home):
+        cache.load(filename)
+    return cache.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", default="numpy")
+    parser.add_argument("--themes", type=int, default=8)
+    parser.add_argument("--sounds", type=int, default=32)
+    parser.add_argument("--copied", type=float, default=0.5)
+    parser.add_argument("--seconds", type=float, default=0.25)
+    args = parser.parse_args()
+    backend = create_backend(args.backend)
+    copied = int(args.sounds * args.copied)
+    with tempfile.TemporaryDirectory() as directory:
+        common = os.path.join(directory, "common")
+        themes_home = os.path.join(directory, "audio-themes")
+        os.makedirs(common)
+        for i in range(copied):
+            # Sounds of different lengths, so their contents differ.
+            write_sound(os.path.join(common, f"{i}.wav"), args.seconds + i / 1000)
+        for theme in range(args.themes):
+            theme_dir = os.path.join(themes_home, f"theme{theme}")
+            os.makedirs(theme_dir)
+            for i in range(args.sounds):
+                filename = os.path.join(theme_dir, f"{i}.wav")
+                if i < copied:
+                    shutil.copyfile(os.path.join(common, f"{i}.wav"), filename)
+                else:
+                    write_sound(
+                        filename, args.seconds + (theme * args.sounds + i) / 1000
+                    )
+        files = args.themes * args.sounds
+        print(f"{args.themes} themes of {args.sounds} sounds, {copied} of them copied")
+        disk_before = disk_usage(themes_home)
+        memory_before = memory_usage(backend, themes_home, share=False)
+        store = SoundStore(themes_home)
+        started = time.perf_counter()
+        report = store.migrate(lambda name: name.endswith(".wav"))
+        migrated = time.perf_counter() - started
+        started = time.perf_counter()
+        again = store.migrate(lambda name: name.endswith(".wav"))
+        migrated_again = time.perf_counter() - started
+        disk_after = disk_usage(themes_home)
+        memory_after = memory_usage(backend, themes_home, share=True)
+        print(
+            f"migration: {report.shared} of {report.files} files shared "
+            f"in {migrated * 1000:.1f} ms, {again.shared} more "
+            f"in {migrated_again * 1000:.1f} ms when run again"
+        )
+        print(
+            f"disk:   {disk_before // 1024:8} KB before, {disk_after // 1024:8} KB after, "
+            f"{store.disk_saved() // 1024} KB saved by the store"
+        )
+        print(
+            f"memory: {memory_before // 1024:8} KB loading every file, "
+            f"{memory_after // 1024:8} KB sharing identical sounds, for {files} sounds"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# coding: utf-8
+
+# Copyright (c) 2014-2019 Musharraf Omer
+# This file is covered by the GNU General Public License.
+
+"""
+Compares exporting a theme package, and loading it in place, for each compression choice.
+
+A theme of generated sounds is exported the way make_zip_file used to do it, deflating every member in turn,
+then by the exporter with compression chosen per member, with every member stored and with every member deflated.
+Each package is then mounted and all of its sounds are loaded through an audio backend.
+Half of the sounds are Ogg Vorbis when libsndfile can write them, all of them are WAV otherwise.
+
+Usage: python benchmarks/theme_export.py [--backend numpy] [--sounds 64]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import types
+from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+AUDIOTHEMES_DIRECTORY = os.path.join(
+    BENCHMARKS_DIRECTORY,
+    os.pardir,
+    "addon",
+    "globalPlugins",
+    "audiothemes",
+)
+sys.path.insert(0, BENCHMARKS_DIRECTORY)
+# The add-on package itself needs NVDA, its NVDA-free modules are imported without running its __init__.
+package = types.ModuleType("audiothemes")
+package.__path__ = [os.path.abspath(AUDIOTHEMES_DIRECTORY)]
+sys.modules["audiothemes"] = package
+from audiothemes.exporter import ThemeExporter
+from audiothemes.unspoken import decoder, loader
+from audiothemes.unspoken.archive import ThemeArchive
+from audiothemes.unspoken.backends import create_backend
+from theme_load import write_ogg, write_sound
+
+
+def make_zip_file(output_filename, source_dir):
+    """What make_zip_file did before the exporter."""
+    with ZipFile(output_filename, "w", ZIP_DEFLATED) as zip:
+        for filename in os.listdir(source_dir):
+            file = os.path.join(source_dir, filename)
+            if os.path.isfile(file):
+                zip.write(file, filename)
+
+
+def load_package(backend, filename):
+    archive = ThemeArchive(filename)
+    members = [(name, name) for name in archive.names if name != "info.json"]
+    sounds, errors = loader.load_members(backend, archive, members)
+    archive.close()
+    assert not errors, errors
+    return sounds
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", default="numpy")
+    parser.add_argument("--sounds", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=0.5)
+    args = parser.parse_args()
+    backend = create_backend(args.backend)
+    with tempfile.TemporaryDirectory() as directory:
+        theme = os.path.join(directory, "theme")
+        os.mkdir(theme)
+        with open(os.path.join(theme, "info.json"), "w") as f:
+            f.write('{"name": "Benchmark", "author": "me", "summary": ""}')
+        oggs = 0
+        for i in range(args.sounds):
+            if (i % 2) and write_ogg(os.path.join(theme, f"{i}.ogg"), args.seconds):
+                oggs += 1
+            else:
+                write_sound(os.path.join(theme, f"{i}.wav"), args.seconds)
+        print(f"{args.sounds - oggs} WAV and {oggs} Ogg Vorbis sounds")
+        print(f"{'':<24} {'export':>9} {'load':>9} {'size':>9}")
+        choices = (
+            ("ZipFile, deflated", None),
+            ("exporter, per member", None),
+            ("exporter, stored", ZIP_STORED),
+            ("exporter, deflated", ZIP_DEFLATED),
+        )
+        for index, (label, compression) in enumerate(choices):
+            filename = os.path.join(directory, f"{index}.atp")
+            if index == 0:
+                export = lambda: make_zip_file(filename, theme)
+            else:
+                export = ThemeExporter(theme, filename, compression=compression).run
+            exported, _ = timed(export)
+            loaded, sounds = timed(lambda: load_package(backend, filename))
+            size = os.path.getsize(filename) // 1024
+            print(
+                f"{label:<24} {exported * 1000:6.1f} ms {loaded * 1000:6.1f} ms {size:6} KB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# coding: utf-8
+
+# Copyright (c) 2014-2019 Musharraf Omer
+# This file is covered by the GNU General Public License.
+
+"""
+Compares listing installed themes by parsing every info file with the theme index.
+
+A themes folder with many generated themes is listed the way the handler used to do it,
+then through a fresh `ThemeIndex` with no index file, with the index file written by the previous step,
+and finally with the index already in memory.
+
+Usage: python benchmarks/theme_index.py [--themes 500] [--sounds 60]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+
+AUDIOTHEMES_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.pardir,
+    "addon",
+    "globalPlugins",
+    "audiothemes",
+)
+# The add-on package itself needs NVDA, its NVDA-free modules are imported without running its __init__.
+package = types.ModuleType("audiothemes")
+package.__path__ = [os.path.abspath(AUDIOTHEMES_DIRECTORY)]
+sys.modules["audiothemes"] = package
+from audiothemes.themeindex import ThemeIndex
+
+INFO_FILE_NAME = "info.json"
+
+
+def scan(home):
+    """What get_installed_themes did before the index."""
+    themes = []
+    for folder in os.listdir(home):
+        info_file = os.path.join(home, folder, INFO_FILE_NAME)
+        if os.path.isfile(info_file):
+            with open(info_file, "r", encoding="utf8") as f:
+                themes.append((folder, json.load(f)))
+    return themes
+
+
+def timed(label, func):
+    started = time.perf_counter()
+    themes = func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<24} {elapsed * 1000:9.1f} ms, {len(themes)} themes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--themes", type=int, default=500)
+    parser.add_argument("--sounds", type=int, default=60)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as home:
+        for i in range(args.themes):
+            directory = os.path.join(home, f"theme{i}")
+            os.mkdir(directory)
+            with open(os.path.join(directory, INFO_FILE_NAME), "w") as f:
+                json.dump({"name": f"Theme {i}", "author": "me", "summary": ""}, f)
+            for role in range(args.sounds):
+                open(os.path.join(directory, f"{role}.wav"), "wb").close()
+        timed("parsing info files", lambda: scan(home))
+        timed("index, no index file", ThemeIndex(home, INFO_FILE_NAME).entries)
+        index = ThemeIndex(home, INFO_FILE_NAME)
+        timed("index, from its file", index.entries)
+        timed("index, in memory", index.entries)
+
+
+if __name__ == "__main__":
+    main()
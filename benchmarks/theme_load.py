@@ -0,0 +1,134 @@
+# coding: utf-8
+
+# Copyright (c) 2014-2019 Musharraf Omer
+# This file is covered by the GNU General Public License.
+
+"""
+Reports the time taken to load a theme's sounds, decoded and then from the PCM cache.
+
+A theme of generated WAV files is loaded through an audio backend the way a theme is activated.
+Pass --pure-python to decode as if NumPy were missing, which is what NVDA does.
+Pass --ogg for Ogg Vorbis files instead, written and decoded with libsndfile,
+they are decoded by a pool of --workers threads, which is compared with a single thread.
+
+Usage: python benchmarks/theme_load.py [--backend numpy] [--sounds 64] [--pure-python] [--ogg] [--workers 4]
+"""
+
+import argparse
+import ctypes
+import os
+import struct
+import sys
+import tempfile
+import time
+import wave
+
+AUDIOTHEMES_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.pardir,
+    "addon",
+    "globalPlugins",
+    "audiothemes",
+)
+sys.path.insert(0, os.path.abspath(AUDIOTHEMES_DIRECTORY))
+from unspoken import decoder, loader
+from unspoken.backends import create_backend
+from unspoken.pcmcache import PCMCache
+
+SAMPLE_RATE = 44100
+_SFM_WRITE = 0x20
+_SF_FORMAT_OGG_VORBIS = 0x200000 | 0x0060
+
+
+def write_sound(filename, seconds):
+    frames = int(seconds * SAMPLE_RATE)
+    with wave.open(filename, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        # A quiet sawtooth, the content does not matter to the decoders.
+        samples = [(i % 200 - 100) * 50 for i in range(frames)]
+        wav.writeframes(
+            struct.pack(f"<{frames * 2}h", *(s for s in samples for _ in "LR"))
+        )
+
+
+def write_ogg(filename, seconds):
+    """Encode a sawtooth like write_sound does, returns False if libsndfile can not."""
+    lib = decoder._load_libsndfile()
+    if not lib:
+        return False
+    info = decoder._SF_INFO(
+        samplerate=SAMPLE_RATE, channels=2, format=_SF_FORMAT_OGG_VORBIS
+    )
+    handle = lib.sf_open(os.fsencode(filename), _SFM_WRITE, ctypes.byref(info))
+    if not handle:
+        return False
+    frames = int(seconds * SAMPLE_RATE)
+    samples = (ctypes.c_float * (frames * 2))(
+        *(((i // 2) % 200 - 100) / 2000 for i in range(frames * 2))
+    )
+    lib.sf_writef_float.argtypes = [
+        ctypes.c_void_p,
+        ctypes.POINTER(ctypes.c_float),
+        ctypes.c_int64,
+    ]
+    lib.sf_writef_float(handle, samples, frames)
+    lib.sf_close(handle)
+    return True
+
+
+def timed(label, func):
+    started = time.perf_counter()
+    sounds = func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<24} {elapsed * 1000:9.1f} ms, {len(sounds)} sounds")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", default="numpy")
+    parser.add_argument("--sounds", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=0.5)
+    parser.add_argument("--pure-python", action="store_true")
+    parser.add_argument("--ogg", action="store_true")
+    parser.add_argument("--workers", type=int, default=loader.default_workers())
+    args = parser.parse_args()
+    if args.pure_python:
+        decoder.numpy = None
+    with tempfile.TemporaryDirectory() as directory:
+        sound_files = []
+        for i in range(args.sounds):
+            if args.ogg:
+                filename = os.path.join(directory, f"{i}.ogg")
+                if not write_ogg(filename, args.seconds):
+                    parser.error("libsndfile can not write Ogg Vorbis files here")
+            else:
+                filename = os.path.join(directory, f"{i}.wav")
+                write_sound(filename, args.seconds)
+            sound_files.append((i, filename))
+        backend = create_backend(args.backend)
+
+        def load(max_workers=None):
+            def run():
+                sounds, errors = loader.load_sounds(backend, sound_files, max_workers)
+                assert not errors, errors
+                return sounds
+
+            return run
+
+        if args.ogg:
+            print(f"{os.cpu_count()} CPUs")
+            single = timed("decoded, 1 thread", load(1))
+            pooled = timed(f"decoded, {args.workers} threads", load(args.workers))
+            print(f"{'':<24} {single / pooled:9.1f}x faster with the pool")
+        # With a cache, the backends decode WAV files themselves instead of handing them to a native library.
+        backend.pcm_cache = PCMCache(os.path.join(directory, "cache"))
+        decoded = timed("decoded", load(args.workers))
+        cached = timed("cached", load(args.workers))
+        print(f"{'':<24} {decoded / cached:9.1f}x faster from the cache")
+
+
+if __name__ == "__main__":
+    main()